@@ -109,6 +109,29 @@ WHATSAPP_API_VERSION = os.getenv("WHATSAPP_API_VERSION", "v18.0")
 
 SESSION_TIMEOUT_SECONDS = int(os.getenv("SESSION_TIMEOUT_SECONDS", "900"))
 INACTIVE_TIMEOUT_SECONDS = int(os.getenv("INACTIVE_TIMEOUT_SECONDS", "1800"))
+# Second tier of sessions.expire_stale: delete sessions idle for longer than
+# INACTIVE_TIMEOUT_SECONDS. Off by default because existing .env files set
+# that to 1800; raise it (e.g. 7776000 = 90 days) before enabling
+SESSION_PURGE_ENABLED = os.getenv("SESSION_PURGE_ENABLED", "False").lower() == "true"
+# Rows per chunk for the sessions.expire_stale job
+SESSION_SWEEP_BATCH_SIZE = int(os.getenv("SESSION_SWEEP_BATCH_SIZE", "1000"))
+# Session store: "db" (default) or "lru" (in-process cache with batched
+# write-behind). lru needs a single inbound worker process; on Postgres an
+# advisory lock enforces it (extra inbound processes fall back or stand down)
+SESSION_STORE = os.getenv("SESSION_STORE", "db")
+SESSION_STORE_CAPACITY = int(os.getenv("SESSION_STORE_CAPACITY", "10000"))
+SESSION_STORE_FLUSH_BATCH = int(os.getenv("SESSION_STORE_FLUSH_BATCH", "200"))
+SESSION_STORE_FLUSH_SECONDS = float(os.getenv("SESSION_STORE_FLUSH_SECONDS", "2"))
+
+# In-process content cache (menus, options, responses, config). Saves in this
+# process invalidate it right away; without the cache invalidation listener
+# this TTL bounds staleness for edits made from other processes (0 disables it)
+CONTENT_CACHE_TTL_SECONDS = float(os.getenv("CONTENT_CACHE_TTL_SECONDS", "60"))
+# Rebuild and pre-render the content snapshot in the background on invalidation
+CONTENT_CACHE_WARM = os.getenv("CONTENT_CACHE_WARM", "True").lower() == "true"
+# TTL for in-process caches (WABA config, content) while the Postgres
+# LISTEN/NOTIFY invalidation listener is up; edits are pushed to every process
+CACHE_BUS_TTL_SECONDS = float(os.getenv("CACHE_BUS_TTL_SECONDS", "3600"))
 
 API_TITLE = os.getenv("API_TITLE", "Aca Lujan Chatbot")
 API_VERSION = os.getenv("API_VERSION", "1.0.0")
@@ -124,8 +147,25 @@ ENABLE_SCHEDULER = os.getenv("ENABLE_SCHEDULER", "True").lower() == "true"
 # Queue worker / human-like timing
 QUEUE_WORKER_ENABLED = os.getenv("QUEUE_WORKER_ENABLED", "True").lower() == "true"
 QUEUE_POLL_INTERVAL_SECONDS = float(os.getenv("QUEUE_POLL_INTERVAL_SECONDS", "1"))
+# Used instead of QUEUE_POLL_INTERVAL_SECONDS while the LISTEN/NOTIFY wakeup is active
+QUEUE_FALLBACK_POLL_SECONDS = float(os.getenv("QUEUE_FALLBACK_POLL_SECONDS", "30"))
 QUEUE_BATCH_SIZE = int(os.getenv("QUEUE_BATCH_SIZE", "10"))
+QUEUE_INBOUND_WORKERS = int(os.getenv("QUEUE_INBOUND_WORKERS", "4"))
+QUEUE_INBOUND_SHARDS = int(os.getenv("QUEUE_INBOUND_SHARDS", "16"))
+# Reply only to the latest message per conversation within a claimed batch
+QUEUE_INBOUND_COALESCE = os.getenv("QUEUE_INBOUND_COALESCE", "False").lower() == "true"
 QUEUE_PROCESS_INLINE = os.getenv("QUEUE_PROCESS_INLINE", "False").lower() == "true"
+# Lease: a claimed message must finish within this time or the reaper requeues it
+QUEUE_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("QUEUE_VISIBILITY_TIMEOUT_SECONDS", "300"))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "5"))
+QUEUE_REAPER_INTERVAL_SECONDS = float(os.getenv("QUEUE_REAPER_INTERVAL_SECONDS", "30"))
+# Queued outbound rows loaded into the in-memory delivery agenda at worker start
+QUEUE_AGENDA_PRELOAD = int(os.getenv("QUEUE_AGENDA_PRELOAD", "1000"))
+# Webhook stores the raw body in webhook_inbox and acks; the queue worker parses it
+WEBHOOK_FAST_ACK = os.getenv("WEBHOOK_FAST_ACK", "False").lower() == "true"
+WEBHOOK_INBOX_BATCH_SIZE = int(os.getenv("WEBHOOK_INBOX_BATCH_SIZE", "50"))
+# Expanded inbox rows older than this are deleted by queue.purge_webhook_inbox
+WEBHOOK_INBOX_RETENTION_HOURS = float(os.getenv("WEBHOOK_INBOX_RETENTION_HOURS", "72"))
 
 RESPONSE_MIN_DELAY_MS = int(os.getenv("RESPONSE_MIN_DELAY_MS", "800"))
 RESPONSE_MAX_DELAY_MS = int(os.getenv("RESPONSE_MAX_DELAY_MS", "2000"))
@@ -141,4 +181,20 @@ WHATSAPP_FLOW_CTA_TEXT = os.getenv("WHATSAPP_FLOW_CTA_TEXT", "Ver opciones")
 
 # Drop stale outbound messages to avoid late replies
 OUTBOUND_MAX_AGE_SECONDS = int(os.getenv("OUTBOUND_MAX_AGE_SECONDS", "900"))
+# Exponential backoff (with jitter) for retryable Graph API send failures
+OUTBOUND_RETRY_BASE_MS = int(os.getenv("OUTBOUND_RETRY_BASE_MS", "2000"))
+OUTBOUND_RETRY_MAX_MS = int(os.getenv("OUTBOUND_RETRY_MAX_MS", "60000"))
 OUTBOUND_DROP_IF_NEWER_INBOUND = os.getenv("OUTBOUND_DROP_IF_NEWER_INBOUND", "True").lower() == "true"
+# Max concurrent Graph API sends (messages to the same recipient stay ordered)
+OUTBOUND_MAX_CONCURRENCY = int(os.getenv("OUTBOUND_MAX_CONCURRENCY", "8"))
+# Graph API token bucket per phone_id, split between bot replies and campaigns.
+# Store: auto (db on Postgres, memory otherwise) | db | memory. 0 disables it.
+GRAPH_RATE_LIMIT_PER_SECOND = float(os.getenv("GRAPH_RATE_LIMIT_PER_SECOND", "20"))
+GRAPH_RATE_CAMPAIGN_SHARE = float(os.getenv("GRAPH_RATE_CAMPAIGN_SHARE", "0.25"))
+GRAPH_RATE_LIMIT_STORE = os.getenv("GRAPH_RATE_LIMIT_STORE", "auto")
+GRAPH_RATE_MAX_WAIT_SECONDS = float(os.getenv("GRAPH_RATE_MAX_WAIT_SECONDS", "5"))
+GRAPH_RATE_BACKOFF_FACTOR = float(os.getenv("GRAPH_RATE_BACKOFF_FACTOR", "0.5"))
+GRAPH_RATE_MIN_PER_SECOND = float(os.getenv("GRAPH_RATE_MIN_PER_SECOND", "1"))
+GRAPH_RATE_RECOVERY_PER_SECOND = float(os.getenv("GRAPH_RATE_RECOVERY_PER_SECOND", "0.2"))
+# With the db store each process reserves this many ms of tokens per row lock (0 = lock per send)
+GRAPH_RATE_DB_RESERVE_MS = int(os.getenv("GRAPH_RATE_DB_RESERVE_MS", "200"))
@@ -23,6 +23,7 @@ from app.models.respuesta import Respuesta
 from app.models.sesion import Sesion
 from app.models.waba_config import WabaConfig
 from app.services.flow_validator import validate_flow_for_menu
+from app.services.queue_processor import reencolar_descartados
 
 
 @admin.register(Cliente)
@@ -334,6 +335,7 @@ class MensajeAdmin(admin.ModelAdmin):
         "wa_message_id",
         "queue_status",
         "delivery_status",
+        "attempts",
         "timestamp_ms",
         "created_at",
     )
@@ -359,6 +361,12 @@ class MensajeAdmin(admin.ModelAdmin):
         "metadata_json",
         "created_at",
     )
+    actions = ["requeue_dead"]
+
+    @admin.action(description="Reencolar mensajes descartados (dead)")
+    def requeue_dead(self, request, queryset):
+        count = reencolar_descartados(queryset)
+        self.message_user(request, f"Se reencolaron {count} mensaje(s).")
 
 
 @admin.register(AsyncJob)
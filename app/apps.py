@@ -12,6 +12,17 @@ class AppConfig(AppConfig):
     name = "app"
 
     def ready(self):
+        from app.jobs.queue_jobs import register_queue_jobs
+        from app.jobs.session_jobs import register_session_jobs
+        from app.services.repositorio_contenido import conectar_invalidacion
+        from app.services.sesion_store import conectar_invalidacion_sesiones
+        from app.services.waba_config import conectar_invalidacion_waba
+
+        register_queue_jobs()
+        register_session_jobs()
+        conectar_invalidacion()
+        conectar_invalidacion_sesiones()
+        conectar_invalidacion_waba()
         try:
             from django.conf import settings as dj_settings
 
@@ -24,6 +35,7 @@ class AppConfig(AppConfig):
                 "loaddata",
                 "dumpdata",
                 "test",
+                "run_queue_worker",
             }
             if any(cmd in sys.argv for cmd in skip_cmds):
                 return
@@ -36,6 +48,11 @@ class AppConfig(AppConfig):
             is_reloader_child = os.environ.get("RUN_MAIN") == "true"
             should_start = (runserver and is_reloader_child) or (not dj_settings.DEBUG)
 
+            if should_start:
+                from app.services.cache_bus import start_cache_listener
+
+                start_cache_listener()
+
             if should_start and getattr(dj_settings, "ENABLE_SCHEDULER", True):
                 from app.jobs.scheduler_bootstrap import initialize_scheduler
 
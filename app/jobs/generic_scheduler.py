@@ -4,9 +4,6 @@ from __future__ import annotations
 
 import builtins
 import logging
-import select
-import threading
-import time
 import uuid
 from datetime import timedelta
 from importlib import import_module
@@ -18,16 +15,12 @@ from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from django.conf import settings
-from django.db import connection, connections
+from django.db import connection
 from django.utils import timezone
 
-try:  # pragma: no cover - optional during tests
-    import psycopg
-except Exception:  # pragma: no cover
-    psycopg = None  # type: ignore
-
 from app.jobs.scheduler_registry import list_jobs
 from app.models.async_job import GenericJobConfig, GenericJobRunLog, GenericJobStatus
+from app.services.pg_listener import escuchar_canal
 
 logger = logging.getLogger("generic_jobs")
 REFRESH_CHANNEL = "generic_scheduler_refresh"
@@ -389,61 +382,19 @@ def start_refresh_listener() -> None:
     """Escucha pg_notify y gatilla refresh (si psycopg está disponible)."""
     if getattr(builtins, "generic_scheduler_refresh_thread", None):
         return
-    if psycopg is None:
-        logger.warning("psycopg no disponible; no se inicializa listener de refresh")
-        return
+    builtins.generic_scheduler_refresh_thread = escuchar_canal(
+        REFRESH_CHANNEL, _handle_refresh, nombre="generic-scheduler-refresh"
+    )
 
-    thread = threading.Thread(target=_refresh_listener_loop, name="generic-scheduler-refresh", daemon=True)
-    builtins.generic_scheduler_refresh_thread = thread
-    thread.start()
-
-
-def _refresh_listener_loop() -> None:
-    db_settings = connections.databases.get("default", {})
-    conn_params = {
-        "host": db_settings.get("HOST") or None,
-        "port": db_settings.get("PORT") or None,
-        "dbname": db_settings.get("NAME"),
-        "user": db_settings.get("USER") or None,
-        "password": db_settings.get("PASSWORD") or None,
-    }
-    while True:
+
+def _handle_refresh(notify) -> None:
+    logger.info("Notificacion de refresh: %s", notify.payload)
+    manager = get_generic_scheduler_manager()
+    if manager:
         try:
-            assert psycopg is not None
-            with psycopg.connect(**conn_params) as conn:
-                conn.autocommit = True
-                with conn.cursor() as cur:
-                    cur.execute(f"LISTEN {REFRESH_CHANNEL};")
-                    logger.info("Listener esperando notificaciones en %s", REFRESH_CHANNEL)
-
-                    def _handle_refresh(notify) -> None:
-                        logger.info("Notificacion de refresh: %s", notify.payload)
-                        manager = get_generic_scheduler_manager()
-                        if manager:
-                            try:
-                                stats = manager.refresh_all()
-                                logger.info("Scheduler refrescado: %s", stats)
-                            except Exception:
-                                logger.exception("Error refrescando scheduler tras notificacion")
-                        else:
-                            logger.warning("No hay GenericSchedulerManager al procesar refresh")
-
-                    if hasattr(conn, "poll"):
-                        while True:
-                            if select.select([conn], [], [], 60)[0]:
-                                conn.poll()
-                                while conn.notifies:
-                                    _handle_refresh(conn.notifies.pop(0))
-                            else:
-                                conn.poll()
-                    else:
-                        notifications = conn.notifies()
-                        while True:
-                            try:
-                                notify = next(notifications)
-                            except StopIteration:
-                                continue
-                            _handle_refresh(notify)
+            stats = manager.refresh_all()
+            logger.info("Scheduler refrescado: %s", stats)
         except Exception:
-            logger.exception("Fallo listener de refresh; reintentando en 5s")
-            time.sleep(5)
+            logger.exception("Error refrescando scheduler tras notificacion")
+    else:
+        logger.warning("No hay GenericSchedulerManager al procesar refresh")
@@ -0,0 +1,25 @@
+"""Jobs programables de mantenimiento de la cola de mensajes."""
+
+from __future__ import annotations
+
+from app.jobs.scheduler_registry import register_job
+
+
+def reap_expired_queue_leases(job_context=None, triggered_by: str | None = None, **kwargs) -> str:
+    """Reencola o descarta mensajes trabados en processing."""
+    from app.services.queue_processor import recuperar_leases_vencidos
+
+    resultado = recuperar_leases_vencidos()
+    return f"reencolados={resultado['reencolados']} descartados={resultado['descartados']}"
+
+
+def purge_webhook_inbox(job_context=None, triggered_by: str | None = None, **kwargs) -> str:
+    """Borra los webhooks crudos ya expandidos que superan la retencion."""
+    from app.services.webhook_eventos import purgar_inbox
+
+    return f"borrados={purgar_inbox(kwargs.get('retention_hours'))}"
+
+
+def register_queue_jobs() -> None:
+    register_job("queue.reap_expired_leases", reap_expired_queue_leases)
+    register_job("queue.purge_webhook_inbox", purge_webhook_inbox)
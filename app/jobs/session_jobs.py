@@ -0,0 +1,18 @@
+"""Jobs programables de mantenimiento de sesiones."""
+
+from __future__ import annotations
+
+from app.jobs.scheduler_registry import register_job
+
+
+def expire_stale_sessions(job_context=None, triggered_by: str | None = None, **kwargs) -> str:
+    """Cierra sesiones vencidas y borra las abandonadas, en lotes."""
+    from app.services.gestor_sesion import GestorSesion
+
+    cancelar = job_context.should_cancel if job_context else None
+    resultado = GestorSesion.expirar_sesiones(lote=kwargs.get("batch_size"), cancelar=cancelar)
+    return f"expiradas={resultado['expiradas']} archivadas={resultado['archivadas']}"
+
+
+def register_session_jobs() -> None:
+    register_job("sessions.expire_stale", expire_stale_sessions)
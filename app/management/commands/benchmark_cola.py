@@ -0,0 +1,222 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+
+from app.models.cola_mensaje import ColaMensaje
+from app.models.mensaje import Mensaje
+from app.services.queue_processor import RepositorioCola
+
+TIPO_BENCHMARK = "benchmark"
+
+# Indices de mensajes que usaba el reclamo antes de mensajes_cola (0017/0018).
+INDICES_ANTERIORES = [
+    models.Index(fields=["direccion", "queue_status"], name="msg_queue_dir_status_idx"),
+    models.Index(fields=["queue_status", "process_after_ms"], name="msg_queue_due_idx"),
+]
+
+SEMBRAR_MENSAJES_SQL = """
+    INSERT INTO {tabla} (
+        phone_number, nombre, direccion, tipo, contenido, timestamp_ms, queue_status,
+        process_after_ms, attempts, metadata_json, created_at
+    )
+    SELECT
+        '+54911' || lpad((g %% %(telefonos)s)::text, 7, '0'),
+        'Benchmark',
+        CASE WHEN g %% 2 = 0 THEN 'in' ELSE 'out' END,
+        %(tipo)s,
+        'mensaje ' || g,
+        %(base_ms)s + g,
+        CASE
+            WHEN g > %(historicos)s AND g %% 2 = 0 THEN 'pending'
+            WHEN g > %(historicos)s THEN 'queued'
+            WHEN g %% 2 = 0 THEN 'processed'
+            ELSE 'sent'
+        END,
+        %(base_ms)s + g,
+        1,
+        jsonb_build_object('raw', jsonb_build_object('id', 'wamid.' || g, 'texto', repeat('x', 200))),
+        now()
+    FROM generate_series(1, %(total)s) AS g
+"""
+
+SEMBRAR_COLA_SQL = """
+    INSERT INTO {cola} (mensaje_id, direccion, phone_number, status, due_at_ms, attempts)
+    SELECT id, direccion, phone_number, queue_status, process_after_ms, 0
+    FROM {tabla}
+    WHERE tipo = %(tipo)s AND queue_status IN ('pending', 'queued')
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra mensajes de prueba y compara la latencia del reclamo anterior "
+        "(sobre mensajes, con sus indices compuestos) con la del reclamo actual "
+        "sobre mensajes_cola y sus indices parciales."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--filas",
+            type=int,
+            default=5_000_000,
+            help="Mensajes historicos (processed/sent) a sembrar en mensajes.",
+        )
+        parser.add_argument(
+            "--vivos",
+            type=int,
+            default=20_000,
+            help="Mensajes pendientes (con fila en mensajes_cola) a sembrar.",
+        )
+        parser.add_argument(
+            "--reclamos",
+            type=int,
+            default=50,
+            help="Reclamos medidos por direccion y escenario.",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=None,
+            help="Mensajes por reclamo (default: QUEUE_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--sin-sembrar",
+            action="store_true",
+            help="Reutiliza los datos sembrados por una corrida anterior.",
+        )
+        parser.add_argument(
+            "--conservar",
+            action="store_true",
+            help="No borra los datos sembrados al terminar.",
+        )
+        parser.add_argument(
+            "--forzar",
+            action="store_true",
+            help="Permite correr con DEBUG=False (no usar contra produccion).",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("El benchmark de la cola requiere PostgreSQL.")
+        if not settings.DEBUG and not options["forzar"]:
+            raise CommandError("Con DEBUG=False hay que pasar --forzar.")
+        lote = int(options["lote"] or getattr(settings, "QUEUE_BATCH_SIZE", 10))
+        reclamos = max(1, options["reclamos"])
+
+        if not options["sin_sembrar"]:
+            self._sembrar(max(0, options["filas"]), max(0, options["vivos"]))
+        self._analizar()
+
+        try:
+            with transaction.atomic():
+                self._crear_indices_anteriores()
+                antes = self._medir(reclamos, lote, self._reclamo_anterior)
+                # Descarta los indices temporales de mensajes.
+                transaction.set_rollback(True)
+            self._analizar()
+            with transaction.atomic():
+                despues = self._medir(reclamos, lote, RepositorioCola._reclamar_sql)
+                transaction.set_rollback(True)
+        finally:
+            if not options["conservar"]:
+                self._limpiar()
+
+        for direccion in ("in", "out"):
+            self.stdout.write(f"Reclamo {direccion} (lote={lote}, {reclamos} reclamos):")
+            self.stdout.write(self._resumen("  antes (mensajes)     ", antes[direccion]))
+            self.stdout.write(self._resumen("  ahora (mensajes_cola)", despues[direccion]))
+
+    def _sembrar(self, historicos: int, vivos: int) -> None:
+        self._limpiar()
+        qn = connection.ops.quote_name
+        params = {
+            "tipo": TIPO_BENCHMARK,
+            "base_ms": int(time.time() * 1000) - (historicos + vivos) - 60_000,
+            "historicos": historicos,
+            "total": historicos + vivos,
+            "telefonos": max(1, (historicos + vivos) // 20),
+        }
+        inicio = time.monotonic()
+        with connection.cursor() as cursor:
+            cursor.execute(SEMBRAR_MENSAJES_SQL.format(tabla=qn(Mensaje._meta.db_table)), params)
+            cursor.execute(
+                SEMBRAR_COLA_SQL.format(
+                    cola=qn(ColaMensaje._meta.db_table),
+                    tabla=qn(Mensaje._meta.db_table),
+                ),
+                params,
+            )
+        self.stdout.write(
+            f"Sembrados {historicos} historicos y {vivos} pendientes "
+            f"en {time.monotonic() - inicio:.1f}s."
+        )
+
+    def _limpiar(self) -> None:
+        """Borra lo sembrado con SQL directo: el ORM cargaria millones de instancias."""
+        qn = connection.ops.quote_name
+        tabla = qn(Mensaje._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {qn(ColaMensaje._meta.db_table)} WHERE mensaje_id IN "
+                f"(SELECT id FROM {tabla} WHERE tipo = %s)",
+                [TIPO_BENCHMARK],
+            )
+            cursor.execute(f"DELETE FROM {tabla} WHERE tipo = %s", [TIPO_BENCHMARK])
+            borrados = cursor.rowcount
+        if borrados:
+            self.stdout.write(f"Borrados {borrados} mensajes de benchmark.")
+
+    def _analizar(self) -> None:
+        with connection.cursor() as cursor:
+            for modelo in (Mensaje, ColaMensaje):
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(modelo._meta.db_table)}")
+
+    def _crear_indices_anteriores(self) -> None:
+        with connection.schema_editor() as editor:
+            for index in INDICES_ANTERIORES:
+                editor.add_index(Mensaje, index)
+        self._analizar()
+
+    @staticmethod
+    def _reclamo_anterior(direccion: str, lote: int, now_ms: int, ids) -> list[Mensaje]:
+        """Reclamo previo a mensajes_cola: filtra y actualiza directamente mensajes."""
+        base_qs = (
+            Mensaje.objects.filter(
+                direccion=direccion,
+                queue_status=RepositorioCola.ESTADO_PENDIENTE[direccion],
+            )
+            .filter(models.Q(process_after_ms__lte=now_ms) | models.Q(process_after_ms__isnull=True))
+            .order_by(RepositorioCola.ORDEN[direccion], "id")
+        )
+        mensajes = list(base_qs.select_for_update(skip_locked=True)[:lote])
+        if mensajes:
+            Mensaje.objects.filter(id__in=[m.id for m in mensajes]).update(
+                queue_status="processing",
+                locked_at_ms=now_ms,
+                attempts=models.F("attempts") + 1,
+            )
+        return mensajes
+
+    def _medir(self, reclamos: int, lote: int, reclamar) -> dict[str, list[float]]:
+        """Mide reclamos reales deshaciendo cada uno para no consumir la cola."""
+        tiempos: dict[str, list[float]] = {"in": [], "out": []}
+        for direccion in tiempos:
+            for _ in range(reclamos):
+                sid = transaction.savepoint()
+                inicio = time.perf_counter()
+                reclamar(direccion, lote, int(time.time() * 1000), None)
+                tiempos[direccion].append((time.perf_counter() - inicio) * 1000)
+                transaction.savepoint_rollback(sid)
+        return tiempos
+
+    @staticmethod
+    def _resumen(titulo: str, tiempos: list[float]) -> str:
+        ordenados = sorted(tiempos)
+        p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+        return (
+            f"{titulo}: p50={statistics.median(ordenados):.2f}ms "
+            f"p95={p95:.2f}ms max={ordenados[-1]:.2f}ms"
+        )
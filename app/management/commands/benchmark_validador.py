@@ -0,0 +1,78 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.services.validador import ValidadorEntrada, _validar_memorizado
+
+# Entradas tipicas de una conversacion (opciones, comandos, saludos, texto libre).
+ENTRADAS = [
+    "1",
+    "2",
+    "12",
+    "A",
+    "b",
+    "#",
+    "0",
+    "MENU",
+    "volver",
+    "hola",
+    "Hola! 👋",
+    "buenas tardes",
+    "1️⃣",
+    "quiero saber los horarios de la pileta",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el costo por llamada de ValidadorEntrada.validar (tabla rapida + memo) "
+        "contra la validacion completa sin memo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iteraciones",
+            type=int,
+            default=20_000,
+            help="Llamadas por entrada y corrida.",
+        )
+        parser.add_argument(
+            "--corridas",
+            type=int,
+            default=5,
+            help="Corridas por entrada; se informa la mediana.",
+        )
+
+    def handle(self, *args, **options):
+        iteraciones = max(1, options["iteraciones"])
+        corridas = max(1, options["corridas"])
+        _validar_memorizado.cache_clear()
+
+        total_completo = 0.0
+        total_rapido = 0.0
+        self.stdout.write(f"{'entrada':<42} {'completo':>10} {'validar':>10} {'speedup':>8}")
+        for entrada in ENTRADAS:
+            completo = self._medir(ValidadorEntrada._validar_completo, entrada, iteraciones, corridas)
+            rapido = self._medir(ValidadorEntrada.validar, entrada, iteraciones, corridas)
+            total_completo += completo
+            total_rapido += rapido
+            self.stdout.write(
+                f"{entrada!r:<42} {completo:>8.2f}us {rapido:>8.2f}us {completo / rapido:>7.1f}x"
+            )
+        self.stdout.write(
+            f"{'total':<42} {total_completo:>8.2f}us {total_rapido:>8.2f}us "
+            f"{total_completo / total_rapido:>7.1f}x"
+        )
+        self.stdout.write(f"Memo: {_validar_memorizado.cache_info()}")
+
+    @staticmethod
+    def _medir(funcion, entrada: str, iteraciones: int, corridas: int) -> float:
+        """Mediana de microsegundos por llamada."""
+        tiempos = []
+        for _ in range(corridas):
+            inicio = time.perf_counter()
+            for _ in range(iteraciones):
+                funcion(entrada)
+            tiempos.append((time.perf_counter() - inicio) * 1_000_000 / iteraciones)
+        return statistics.median(tiempos)
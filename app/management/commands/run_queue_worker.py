@@ -0,0 +1,72 @@
+import logging
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.services.cache_bus import start_cache_listener
+from app.services.queue_notify import start_queue_listener
+from app.services.queue_worker import QueueWorker
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de mensajes en primer plano (fuera del proceso web)."
+
+    def add_arguments(self, parser):
+        grupo = parser.add_mutually_exclusive_group()
+        grupo.add_argument(
+            "--inbound-only",
+            action="store_true",
+            help="Solo procesa mensajes entrantes.",
+        )
+        grupo.add_argument(
+            "--outbound-only",
+            action="store_true",
+            help="Solo envia mensajes salientes.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Hilos de inbound y envios outbound simultaneos "
+            "(default: QUEUE_INBOUND_WORKERS / OUTBOUND_MAX_CONCURRENCY).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Mensajes reclamados por vuelta (default: QUEUE_BATCH_SIZE).",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        batch_size = options["batch_size"]
+        if concurrency is not None and concurrency < 1:
+            raise CommandError("--concurrency debe ser >= 1")
+        if batch_size is not None and batch_size < 1:
+            raise CommandError("--batch-size debe ser >= 1")
+
+        worker = QueueWorker(
+            inbound=not options["outbound_only"],
+            outbound=not options["inbound_only"],
+            concurrency=concurrency,
+            batch_size=batch_size,
+        )
+
+        def _detener(signum, frame):
+            logger.info("Senal %s recibida; drenando worker de cola.", signum)
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, _detener)
+        signal.signal(signal.SIGINT, _detener)
+
+        start_queue_listener()
+        start_cache_listener()
+        self.stdout.write(
+            "Worker de cola iniciado "
+            f"(inbound={worker.inbound}, outbound={worker.outbound}, "
+            f"concurrency={worker.workers}, batch={worker.batch})."
+        )
+        worker.run()
+        self.stdout.write(self.style.SUCCESS("Worker de cola detenido."))
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0014_wabaconfig_flow_enabled"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mensaje",
+            name="queue_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "pendiente"),
+                    ("processing", "procesando"),
+                    ("processed", "procesado"),
+                    ("queued", "en cola"),
+                    ("sent", "enviado"),
+                    ("failed", "fallido"),
+                    ("dead", "descartado"),
+                ],
+                db_index=True,
+                default="processed",
+                max_length=20,
+            ),
+        ),
+    ]
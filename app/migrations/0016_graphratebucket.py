@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0015_mensaje_queue_status_dead"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GraphRateBucket",
+            fields=[
+                ("key", models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ("tokens", models.FloatField(default=0)),
+                ("rate", models.FloatField(default=0)),
+                ("updated_ms", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "db_table": "graph_rate_buckets",
+            },
+        ),
+    ]
@@ -0,0 +1,90 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_cola(apps, schema_editor):
+    Mensaje = apps.get_model("app", "Mensaje")
+    ColaMensaje = apps.get_model("app", "ColaMensaje")
+    pendientes = Mensaje.objects.filter(
+        queue_status__in=["pending", "queued", "processing"],
+        direccion__in=["in", "out"],
+    ).only(
+        "id",
+        "direccion",
+        "phone_number",
+        "queue_status",
+        "timestamp_ms",
+        "process_after_ms",
+        "attempts",
+        "locked_at_ms",
+    )
+    lote = []
+    for mensaje in pendientes.iterator(chunk_size=1000):
+        # Mismo vencimiento que ColaMensaje.vencimiento: los entrantes van por
+        # timestamp_ms, nunca despues de su llegada.
+        due_at_ms = mensaje.process_after_ms
+        if mensaje.direccion == "in" and mensaje.timestamp_ms:
+            due_at_ms = min(mensaje.timestamp_ms, due_at_ms or mensaje.timestamp_ms)
+        lote.append(
+            ColaMensaje(
+                mensaje_id=mensaje.id,
+                direccion=mensaje.direccion,
+                phone_number=mensaje.phone_number,
+                status=mensaje.queue_status,
+                due_at_ms=due_at_ms,
+                attempts=mensaje.attempts,
+                locked_at_ms=mensaje.locked_at_ms,
+            )
+        )
+        if len(lote) >= 1000:
+            ColaMensaje.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        ColaMensaje.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0016_graphratebucket"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ColaMensaje",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("direccion", models.CharField(max_length=10)),
+                ("phone_number", models.CharField(max_length=20)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "pendiente"),
+                            ("queued", "en cola"),
+                            ("processing", "procesando"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("due_at_ms", models.BigIntegerField(blank=True, null=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("locked_at_ms", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "mensaje",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="cola",
+                        to="app.mensaje",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "mensajes_cola",
+                "indexes": [
+                    models.Index(fields=["direccion", "status", "due_at_ms"], name="cola_dir_status_due_idx"),
+                    models.Index(fields=["phone_number", "direccion", "status"], name="cola_phone_status_idx"),
+                ],
+            },
+        ),
+        migrations.RunPython(poblar_cola, migrations.RunPython.noop),
+    ]
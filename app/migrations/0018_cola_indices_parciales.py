@@ -0,0 +1,50 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0017_colamensaje"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="colamensaje",
+            name="cola_dir_status_due_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="colamensaje",
+            name="cola_phone_status_idx",
+        ),
+        migrations.AddIndex(
+            model_name="colamensaje",
+            index=models.Index(
+                condition=models.Q(("direccion", "in"), ("status", "pending")),
+                fields=["due_at_ms", "mensaje"],
+                name="cola_in_pending_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="colamensaje",
+            index=models.Index(
+                condition=models.Q(("direccion", "out"), ("status", "queued")),
+                fields=["due_at_ms", "mensaje"],
+                name="cola_out_queued_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="colamensaje",
+            index=models.Index(
+                condition=models.Q(("status", "processing")),
+                fields=["phone_number", "direccion"],
+                name="cola_processing_phone_idx",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="mensaje",
+            name="msg_queue_dir_status_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="mensaje",
+            name="msg_queue_due_idx",
+        ),
+    ]
@@ -0,0 +1,14 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0018_cola_indices_parciales"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sesion",
+            index=models.Index(fields=["ultimo_acceso_ms"], name="sesion_ultimo_acceso_idx"),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0019_sesion_ultimo_acceso_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WebhookInbox",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("payload", models.TextField()),
+                ("recibido_ms", models.BigIntegerField()),
+                ("procesado_ms", models.BigIntegerField(blank=True, null=True)),
+                ("error", models.TextField(blank=True, null=True)),
+            ],
+            options={
+                "db_table": "webhook_inbox",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("procesado_ms__isnull", True)),
+                        fields=["id"],
+                        name="webhook_inbox_pendiente_idx",
+                    ),
+                    models.Index(fields=["procesado_ms"], name="webhook_inbox_procesado_idx"),
+                ],
+            },
+        ),
+    ]
@@ -10,10 +10,13 @@ from app.models.async_job import (
 from app.models.menu import Menu
 from app.models.menu_option import MenuOption
 from app.models.mensaje import Mensaje
+from app.models.cola_mensaje import ColaMensaje
 from app.models.respuesta import Respuesta
 from app.models.sesion import Sesion
 from app.models.config import Config
 from app.models.waba_config import WabaConfig
+from app.models.rate_bucket import GraphRateBucket
+from app.models.webhook_inbox import WebhookInbox
 
 __all__ = [
     "Cliente",
@@ -27,8 +30,11 @@ __all__ = [
     "Menu",
     "MenuOption",
     "Mensaje",
+    "ColaMensaje",
     "Respuesta",
     "Sesion",
     "Config",
     "WabaConfig",
+    "GraphRateBucket",
+    "WebhookInbox",
 ]
@@ -0,0 +1,81 @@
+from django.db import models
+
+
+class ColaMensaje(models.Model):
+    """Fila de trabajo de la cola de mensajes.
+
+    Tabla angosta que los workers reclaman y actualizan; se borra cuando el
+    mensaje termina. El resultado final queda en Mensaje (log permanente).
+    """
+
+    ESTADOS = (
+        ("pending", "pendiente"),
+        ("queued", "en cola"),
+        ("processing", "procesando"),
+    )
+
+    mensaje = models.OneToOneField(
+        "app.Mensaje",
+        on_delete=models.CASCADE,
+        related_name="cola",
+    )
+    direccion = models.CharField(max_length=10)
+    phone_number = models.CharField(max_length=20)
+    status = models.CharField(max_length=20, choices=ESTADOS)
+    due_at_ms = models.BigIntegerField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    locked_at_ms = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        db_table = "mensajes_cola"
+        # Indices parciales con los predicados y el orden exactos del reclamo.
+        indexes = [
+            models.Index(
+                fields=["due_at_ms", "mensaje"],
+                condition=models.Q(direccion="in", status="pending"),
+                name="cola_in_pending_idx",
+            ),
+            models.Index(
+                fields=["due_at_ms", "mensaje"],
+                condition=models.Q(direccion="out", status="queued"),
+                name="cola_out_queued_idx",
+            ),
+            models.Index(
+                fields=["phone_number", "direccion"],
+                condition=models.Q(status="processing"),
+                name="cola_processing_phone_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Cola {self.direccion} {self.mensaje_id} ({self.status})"
+
+    @classmethod
+    def encolar(cls, mensaje) -> "ColaMensaje":
+        """Crea la fila de trabajo de un mensaje pending/queued."""
+        fila = cls.para(mensaje)
+        fila.save(force_insert=True)
+        return fila
+
+    @classmethod
+    def para(cls, mensaje) -> "ColaMensaje":
+        """Fila de trabajo sin guardar (para bulk_create)."""
+        return cls(
+            mensaje=mensaje,
+            direccion=mensaje.direccion,
+            phone_number=mensaje.phone_number,
+            status=mensaje.queue_status,
+            due_at_ms=cls.vencimiento(mensaje, mensaje.process_after_ms),
+            attempts=mensaje.attempts or 0,
+        )
+
+    @staticmethod
+    def vencimiento(mensaje, process_after_ms):
+        """due_at_ms de la fila: los entrantes se ordenan por su timestamp_ms.
+
+        Un entrante ya esta vencido al llegar; usar la hora de llegada
+        dejaria a uno reenviado tarde por Meta detras de mensajes posteriores.
+        """
+        if mensaje.direccion == "in" and mensaje.timestamp_ms:
+            return min(mensaje.timestamp_ms, process_after_ms or mensaje.timestamp_ms)
+        return process_after_ms
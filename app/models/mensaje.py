@@ -18,6 +18,7 @@ class Mensaje(models.Model):
         ("queued", "en cola"),
         ("sent", "enviado"),
         ("failed", "fallido"),
+        ("dead", "descartado"),
     )
 
     phone_number = models.CharField(max_length=20, db_index=True)
@@ -52,10 +53,6 @@ class Mensaje(models.Model):
                 name="uniq_inbound_wa_message_id",
             )
         ]
-        indexes = [
-            models.Index(fields=["direccion", "queue_status"], name="msg_queue_dir_status_idx"),
-            models.Index(fields=["queue_status", "process_after_ms"], name="msg_queue_due_idx"),
-        ]
 
     def __str__(self) -> str:
         return f"Mensaje {self.phone_number} {self.direccion}"
@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from app.models.fields import LenientJSONField
 
@@ -32,7 +33,28 @@ class Menu(models.Model):
     def __str__(self) -> str:
         return f"Menu {self.id}"
 
+    def clean(self):
+        super().clean()
+        self.validar_parent()
+
+    def validar_parent(self):
+        """Rechaza un parent que arme un ciclo (el menu seria su propio ancestro)."""
+        visitados = {str(self.pk)} if self.pk is not None else set()
+        padre_id = self.parent_id
+        while padre_id is not None:
+            padre_id = str(padre_id)
+            if padre_id in visitados:
+                raise ValidationError(
+                    {"parent": f"El menu padre {self.parent_id} genera un ciclo de menus."}
+                )
+            visitados.add(padre_id)
+            padre_id = Menu.objects.filter(pk=padre_id).values_list("parent_id", flat=True).first()
+
     def save(self, *args, **kwargs):
+        # Tambien fuera del admin (shell, scripts, fixtures): clean() no corre solo.
+        update_fields = kwargs.get("update_fields")
+        if self.parent_id is not None and (update_fields is None or "parent" in update_fields):
+            self.validar_parent()
         super().save(*args, **kwargs)
         if self.is_main:
             Menu.objects.exclude(pk=self.pk).filter(is_main=True).update(is_main=False)
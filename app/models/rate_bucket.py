@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class GraphRateBucket(models.Model):
+    """Estado compartido de un token bucket de la Graph API (phone_id + clase)."""
+
+    key = models.CharField(max_length=100, primary_key=True)
+    tokens = models.FloatField(default=0)
+    rate = models.FloatField(default=0)
+    updated_ms = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "graph_rate_buckets"
+
+    def __str__(self) -> str:
+        return f"{self.key} ({self.rate:.2f}/s)"
@@ -31,6 +31,9 @@ class Sesion(models.Model):
 
     class Meta:
         db_table = "sesiones"
+        indexes = [
+            models.Index(fields=["ultimo_acceso_ms"], name="sesion_ultimo_acceso_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Sesion {self.phone_number}"
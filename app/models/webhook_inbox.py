@@ -0,0 +1,29 @@
+from django.db import models
+
+
+class WebhookInbox(models.Model):
+    """Cuerpo crudo de un webhook, guardado tal como llego (solo se agrega).
+
+    El webhook en modo fast-ack solo inserta aca y responde; el worker
+    expande las filas pendientes en Mensaje y estados de entrega.
+    """
+
+    payload = models.TextField()
+    recibido_ms = models.BigIntegerField()
+    procesado_ms = models.BigIntegerField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        db_table = "webhook_inbox"
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(procesado_ms__isnull=True),
+                name="webhook_inbox_pendiente_idx",
+            ),
+            models.Index(fields=["procesado_ms"], name="webhook_inbox_procesado_idx"),
+        ]
+
+    def __str__(self) -> str:
+        estado = "pendiente" if self.procesado_ms is None else "procesado"
+        return f"Webhook {self.pk} ({estado})"
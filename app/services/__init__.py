@@ -5,6 +5,7 @@ from app.services.gestor_cliente import GestorCliente
 from app.services.gestor_contenido import GestorContenido
 from app.services.gestor_mensajes import GestorMensajes
 from app.services.navegador import NavigadorBot
+from app.services.contexto_conversacion import ContextoConversacion
 from app.services.cliente_whatsapp import ClienteWhatsApp
 
 __all__ = [
@@ -16,5 +17,6 @@ __all__ = [
     "GestorContenido",
     "GestorMensajes",
     "NavigadorBot",
+    "ContextoConversacion",
     "ClienteWhatsApp",
 ]
@@ -0,0 +1,117 @@
+"""Bus de invalidacion de caches locales via Postgres LISTEN/NOTIFY.
+
+Cada proceso (web, worker) cachea en memoria cosas que cambian poco
+(config WABA, contenido del bot). Quien cambia una de ellas publica el
+topico con publicar_invalidacion(); cada proceso que escucha corre los
+callbacks suscriptos a ese topico y descarta su cache al instante.
+
+Sin listener activo (sin Postgres o sin psycopg) las caches vuelven a su
+TTL corto: ttl_cache() elige entre ese TTL y CACHE_BUS_TTL_SECONDS.
+"""
+
+import logging
+import os
+import threading
+import uuid
+from typing import Callable
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from app.services.pg_listener import escuchar_canal
+
+logger = logging.getLogger(__name__)
+CACHE_CHANNEL = "cache_invalidation"
+
+# Identifica a este proceso para ignorar el eco de sus propios avisos.
+ORIGEN = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+_suscriptores: dict[str, list[Callable[[str], None]]] = {}
+_suscriptores_lock = threading.Lock()
+_listener_thread = None
+_listener_activo = threading.Event()
+
+
+def suscribir(topico: str, callback: Callable[[str], None]) -> None:
+    """Registra un callback(version) que descarta la cache local del topico."""
+    with _suscriptores_lock:
+        callbacks = _suscriptores.setdefault(topico, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+
+def _invalidar_local(topico: str, version: str) -> None:
+    with _suscriptores_lock:
+        callbacks = list(_suscriptores.get(topico, ()))
+    for callback in callbacks:
+        try:
+            callback(version)
+        except Exception:
+            logger.exception("Fallo la invalidacion local de %s", topico)
+
+
+def publicar_invalidacion(topico: str, version: int | str = "") -> None:
+    """Anuncia que cambio el topico: invalida aca y en los demas procesos.
+
+    Como notificar_cola, el NOTIFY se entrega al confirmar la transaccion y
+    el aviso local se difiere con on_commit, para que nadie recargue antes
+    de que el cambio sea visible.
+    """
+    version = str(version)
+    if connection.vendor == "postgresql":
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_notify(%s, %s)",
+                    [CACHE_CHANNEL, f"{topico}:{version}:{ORIGEN}"],
+                )
+        except Exception:
+            logger.exception("No se pudo publicar la invalidacion de %s", topico)
+    transaction.on_commit(lambda: _invalidar_local(topico, version))
+
+
+def cache_listener_activo() -> bool:
+    return _listener_activo.is_set()
+
+
+def ttl_cache(ttl_sin_bus: float) -> float:
+    """TTL de una cache local: largo si el bus avisa los cambios, corto si no."""
+    if cache_listener_activo():
+        return float(getattr(settings, "CACHE_BUS_TTL_SECONDS", 3600))
+    return float(ttl_sin_bus)
+
+
+def start_cache_listener() -> None:
+    """Escucha pg_notify de invalidaciones (si psycopg y Postgres estan disponibles)."""
+    global _listener_thread
+    if _listener_thread and _listener_thread.is_alive():
+        return
+    _listener_thread = escuchar_canal(
+        CACHE_CHANNEL,
+        _handle_notify,
+        nombre="cache-listener",
+        al_conectar=_al_conectar,
+        al_caer=_listener_activo.clear,
+    )
+
+
+def _handle_notify(notify) -> None:
+    topico, _, resto = (notify.payload or "").partition(":")
+    version, _, origen = resto.rpartition(":")
+    if not topico or origen == ORIGEN:
+        return
+    logger.debug("Invalidacion de %s (version %s) desde %s", topico, version, origen)
+    _invalidar_local(topico, version)
+
+
+def _al_conectar() -> None:
+    # Lo cambiado mientras no escuchabamos no llego: se descarta todo.
+    _invalidar_todo()
+    _listener_activo.set()
+
+
+def _invalidar_todo() -> None:
+    with _suscriptores_lock:
+        topicos = list(_suscriptores)
+    for topico in topicos:
+        _invalidar_local(topico, "")
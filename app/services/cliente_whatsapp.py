@@ -4,6 +4,12 @@ from typing import Optional
 import requests
 from django.conf import settings
 
+from app.services.rate_limiter import (
+    THROTTLING_ERROR_CODES,
+    es_throttling,
+    get_limitador,
+    rate_limit_habilitado,
+)
 from app.services.waba_config import get_active_waba_config, get_whatsapp_setting
 
 logger = logging.getLogger(__name__)
@@ -13,6 +19,67 @@ class ClienteWhatsApp:
     """Cliente para enviar mensajes a traves de WhatsApp Cloud API"""
 
     TIMEOUT = 10
+    # Codigos de error de Meta que indican throttling o fallas transitorias.
+    RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | {1, 2, 17, 131000, 131016, 133004}
+    # Resultado local cuando el rate limiter no dio cupo (no hubo llamada a Graph).
+    SIN_CUPO = "rate_limited"
+
+    @staticmethod
+    def _resultado_error(response) -> dict:
+        """Arma el resultado de una respuesta no-200 clasificandola como reintentable o no."""
+        error_code = None
+        try:
+            error_code = (response.json().get("error") or {}).get("code")
+        except Exception:
+            error_code = None
+        retryable = (
+            response.status_code == 429
+            or response.status_code >= 500
+            or error_code in ClienteWhatsApp.RETRYABLE_ERROR_CODES
+        )
+        return {
+            "ok": False,
+            "message_id": None,
+            "response": response.text,
+            "status_code": response.status_code,
+            "error_code": error_code,
+            "retryable": retryable,
+        }
+
+    @staticmethod
+    def _esperar_turno(clase: str) -> Optional[dict]:
+        """Toma cupo del rate limiter; sin cupo retorna un resultado reintentable."""
+        if not rate_limit_habilitado():
+            return None
+        phone_id = get_whatsapp_setting("phone_id", settings.WHATSAPP_PHONE_ID)
+        if get_limitador().adquirir(phone_id, clase):
+            return None
+        logger.warning("Sin cupo de envio para %s (%s); se reintentara.", phone_id, clase)
+        return {"ok": False, "message_id": None, "error": ClienteWhatsApp.SIN_CUPO, "retryable": True}
+
+    @staticmethod
+    def _hay_turno(clase: str) -> bool:
+        """Toma cupo solo si lo hay ya, sin esperar (acuses de lectura)."""
+        if not rate_limit_habilitado():
+            return True
+        phone_id = get_whatsapp_setting("phone_id", settings.WHATSAPP_PHONE_ID)
+        return get_limitador().intentar(phone_id, clase) <= 0
+
+    @staticmethod
+    def sin_cupo(resultado: Optional[dict]) -> bool:
+        """True si el envio no salio por falta de cupo local (no cuenta como intento)."""
+        return bool(resultado and resultado.get("error") == ClienteWhatsApp.SIN_CUPO)
+
+    @staticmethod
+    def _registrar_throttling(resultado: dict) -> None:
+        if rate_limit_habilitado() and es_throttling(resultado):
+            phone_id = get_whatsapp_setting("phone_id", settings.WHATSAPP_PHONE_ID)
+            get_limitador().registrar_throttling(phone_id)
+
+    @staticmethod
+    def es_reintentable(resultado: Optional[dict]) -> bool:
+        """True si el fallo es transitorio (throttling, 5xx o error de conexion)."""
+        return bool(resultado and not resultado.get("ok") and resultado.get("retryable"))
 
     @staticmethod
     def _build_base_url() -> str:
@@ -32,33 +99,40 @@ class ClienteWhatsApp:
         }
 
     @staticmethod
-    def enviar_mensaje(phone_number: str, mensaje: str) -> bool:
+    def enviar_mensaje(phone_number: str, mensaje: str, clase: str = "reply") -> bool:
         """
         Envia un mensaje a traves de WhatsApp API
 
         Args:
             phone_number: Numero de telefono en formato +54...
             mensaje: Contenido del mensaje
+            clase: Bucket del rate limiter ("reply" o "campaign")
 
         Returns:
             True si se envio exitosamente, False en caso contrario
         """
-        resultado = ClienteWhatsApp.enviar_mensaje_con_resultado(phone_number, mensaje)
+        resultado = ClienteWhatsApp.enviar_mensaje_con_resultado(phone_number, mensaje, clase=clase)
         return resultado.get("ok", False)
 
     @staticmethod
     def enviar_mensajes_batch(mensajes: list[dict]) -> dict:
-        """Envia multiples mensajes"""
+        """Envia multiples mensajes (envio masivo: bucket de campana)"""
         resultados = {}
         for msg in mensajes:
             resultados[msg["phone_number"]] = ClienteWhatsApp.enviar_mensaje(
-                msg["phone_number"], msg["mensaje"]
+                msg["phone_number"], msg["mensaje"], clase="campaign"
             )
         return resultados
 
     @staticmethod
-    def enviar_mensaje_con_resultado(phone_number: str, mensaje: str) -> dict:
-        """Envia mensaje y retorna resultado con message_id si existe."""
+    def enviar_mensaje_con_resultado(phone_number: str, mensaje: str, clase: str = "reply") -> dict:
+        """Envia mensaje y retorna resultado con message_id si existe.
+
+        clase elige el bucket del rate limiter ("reply" o "campaign").
+        """
+        sin_cupo = ClienteWhatsApp._esperar_turno(clase)
+        if sin_cupo:
+            return sin_cupo
         try:
             phone_clean = phone_number.replace("+", "").replace(" ", "")
             url = ClienteWhatsApp._build_base_url()
@@ -95,20 +169,27 @@ class ClienteWhatsApp:
                 response.status_code,
                 response.text,
             )
-            return {"ok": False, "message_id": None, "response": response.text}
+            resultado = ClienteWhatsApp._resultado_error(response)
+            ClienteWhatsApp._registrar_throttling(resultado)
+            return resultado
 
         except requests.exceptions.RequestException as exc:
             logger.error("Error de conexion enviando mensaje a %s: %s", phone_number, exc)
-            return {"ok": False, "message_id": None, "error": str(exc)}
+            return {"ok": False, "message_id": None, "error": str(exc), "retryable": True}
         except Exception as exc:
             logger.error("Error inesperado enviando mensaje a %s: %s", phone_number, exc)
             return {"ok": False, "message_id": None, "error": str(exc)}
 
     @staticmethod
-    def enviar_interactive_con_resultado(phone_number: str, interactive_payload: Optional[dict]) -> dict:
+    def enviar_interactive_con_resultado(
+        phone_number: str, interactive_payload: Optional[dict], clase: str = "reply"
+    ) -> dict:
         """Envia mensaje interactivo y retorna resultado con message_id si existe."""
         if not interactive_payload:
             return {"ok": False, "message_id": None, "error": "interactive_payload_vacio"}
+        sin_cupo = ClienteWhatsApp._esperar_turno(clase)
+        if sin_cupo:
+            return sin_cupo
         try:
             phone_clean = phone_number.replace("+", "").replace(" ", "")
             url = ClienteWhatsApp._build_base_url()
@@ -145,11 +226,13 @@ class ClienteWhatsApp:
                 response.status_code,
                 response.text,
             )
-            return {"ok": False, "message_id": None, "response": response.text}
+            resultado = ClienteWhatsApp._resultado_error(response)
+            ClienteWhatsApp._registrar_throttling(resultado)
+            return resultado
 
         except requests.exceptions.RequestException as exc:
             logger.error("Error de conexion enviando interactivo a %s: %s", phone_number, exc)
-            return {"ok": False, "message_id": None, "error": str(exc)}
+            return {"ok": False, "message_id": None, "error": str(exc), "retryable": True}
         except Exception as exc:
             logger.error("Error inesperado enviando interactivo a %s: %s", phone_number, exc)
             return {"ok": False, "message_id": None, "error": str(exc)}
@@ -159,6 +242,11 @@ class ClienteWhatsApp:
         """Marca un mensaje como leido y opcionalmente envia typing indicator."""
         if not message_id:
             return False
+        # Comparte la cuota del phone_id, pero no espera: sin cupo se omite
+        # el acuse y el hilo sigue con la respuesta.
+        if not ClienteWhatsApp._hay_turno("reply"):
+            logger.debug("Sin cupo para marcar como leido %s; se omite.", message_id)
+            return False
         try:
             url = ClienteWhatsApp._build_base_url()
             headers = ClienteWhatsApp._build_headers()
@@ -184,6 +272,7 @@ class ClienteWhatsApp:
                 response.status_code,
                 response.text,
             )
+            ClienteWhatsApp._registrar_throttling(ClienteWhatsApp._resultado_error(response))
             return False
         except Exception as exc:
             logger.error("Error marcando como leido %s: %s", message_id, exc)
@@ -0,0 +1,82 @@
+from typing import Optional
+
+from app.models.cliente import Cliente
+from app.models.menu import Menu
+from app.models.sesion import Sesion
+from app.services.gestor_cliente import GestorCliente
+from app.services.gestor_contenido import GestorContenido
+from app.services.gestor_sesion import GestorSesion
+from app.services.sesion_store import get_sesion_store
+
+
+class ContextoConversacion:
+    """Unidad de trabajo de un mensaje entrante.
+
+    Lee Sesion una sola vez (del store de sesiones); los menus salen de la
+    instantanea de contenido. Cliente se obtiene del upsert de
+    registrar_contacto. Los cambios se aplican en
+    memoria marcando los campos sucios; guardar() escribe cada fila una vez
+    con update_fields (o la inserta si es nueva).
+    """
+
+    def __init__(self, phone_number: str, nombre: str = ""):
+        self.phone_number = phone_number
+        self.nombre = nombre
+        self.cliente: Optional[Cliente] = None
+        self._store = get_sesion_store()
+        self.sesion: Optional[Sesion] = self._store.cargar(phone_number)
+        self.prev_contact_ms: int | None = None
+        self._cliente_campos: set[str] = set()
+        self._sesion_campos: set[str] = set()
+        self._sesion_nueva = False
+
+    def abrir_sesion(self) -> tuple[Sesion, bool]:
+        """Equivalente en memoria de GestorSesion.obtener_o_crear_sesion."""
+        if self.sesion is None:
+            self.sesion = GestorSesion.nueva_sesion(self.phone_number, self.nombre)
+            self._sesion_nueva = True
+            return self.sesion, False
+        expirada, campos = GestorSesion.registrar_acceso(self.sesion)
+        self._sesion_campos.update(campos)
+        return self.sesion, expirada
+
+    @property
+    def sesion_nueva(self) -> bool:
+        return self._sesion_nueva
+
+    def registrar_contacto(self, mensaje: str, alias_waba: str | None = None) -> tuple[Cliente, bool]:
+        """Cuenta el contacto en la base (upsert atomico) y toma el Cliente resultante."""
+        self.cliente, es_nuevo, self.prev_contact_ms = GestorCliente.contabilizar_contacto(
+            self.phone_number, self.nombre, mensaje, alias_waba
+        )
+        return self.cliente, es_nuevo
+
+    def marcar_cliente(self, *campos: str) -> None:
+        self._cliente_campos.update(campos)
+
+    def actualizar_estado(
+        self,
+        nuevo_estado: str,
+        historial: list[str],
+        mensaje: str = "",
+        tipo_contenido: str | None = None,
+    ) -> None:
+        if self.sesion is None:
+            return
+        campos = GestorSesion.aplicar_estado(
+            self.sesion, nuevo_estado, historial, mensaje, tipo_contenido
+        )
+        self._sesion_campos.update(campos)
+
+    def menu(self, menu_id: str) -> Optional[Menu]:
+        return GestorContenido.obtener_menu(str(menu_id))
+
+    def guardar(self) -> None:
+        """Escribe Cliente y entrega Sesion al store, cada uno una sola vez."""
+        if self.cliente is not None and self._cliente_campos:
+            self.cliente.save(update_fields=sorted(self._cliente_campos) + ["updated_at"])
+        if self.sesion is not None and (self._sesion_nueva or self._sesion_campos):
+            self._store.guardar(self.sesion, self._sesion_campos, nueva=self._sesion_nueva)
+        self._cliente_campos.clear()
+        self._sesion_campos.clear()
+        self._sesion_nueva = False
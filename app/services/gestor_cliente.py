@@ -1,8 +1,33 @@
 import time
 from typing import Tuple
 
+from django.db import connection, models, transaction
+
 from app.models.cliente import Cliente
 
+UPSERT_CONTACTO_SQL = """
+    WITH previo AS (
+        SELECT ultimo_contacto_ms FROM {tabla} WHERE phone_number = %(phone_number)s
+    )
+    INSERT INTO {tabla} AS c (
+        phone_number, nombre, alias_waba, marketing_opt_in, primer_contacto_ms,
+        ultimo_contacto_ms, mensajes_totales, ultimo_mensaje, activo, created_at, updated_at
+    )
+    VALUES (
+        %(phone_number)s, %(nombre)s, %(alias_waba)s, TRUE, %(ahora_ms)s,
+        %(ahora_ms)s, 1, %(mensaje)s, TRUE, now(), now()
+    )
+    ON CONFLICT (phone_number) DO UPDATE SET
+        nombre = COALESCE(NULLIF(c.nombre, ''), EXCLUDED.nombre),
+        alias_waba = COALESCE(NULLIF(c.alias_waba, ''), EXCLUDED.alias_waba),
+        ultimo_contacto_ms = EXCLUDED.ultimo_contacto_ms,
+        mensajes_totales = c.mensajes_totales + 1,
+        ultimo_mensaje = EXCLUDED.ultimo_mensaje,
+        activo = TRUE,
+        updated_at = EXCLUDED.updated_at
+    RETURNING c.*, (c.xmax = 0) AS creado, (SELECT ultimo_contacto_ms FROM previo) AS previo_ms
+"""
+
 
 class GestorCliente:
     """Gestiona clientes por numero de telefono."""
@@ -15,29 +40,99 @@ class GestorCliente:
         alias_waba: str | None = None,
     ) -> Tuple[Cliente, bool]:
         """Crea o actualiza un cliente. Retorna (cliente, es_nuevo)."""
+        cliente, es_nuevo, _ = GestorCliente.contabilizar_contacto(
+            phone_number, nombre, mensaje, alias_waba
+        )
+        return cliente, es_nuevo
+
+    @staticmethod
+    def contabilizar_contacto(
+        phone_number: str,
+        nombre: str,
+        mensaje: str,
+        alias_waba: str | None = None,
+    ) -> Tuple[Cliente, bool, int | None]:
+        """Registra un contacto sin perder incrementos entre workers.
+
+        En Postgres es un solo INSERT ... ON CONFLICT DO UPDATE que suma
+        mensajes_totales en la base. Retorna (cliente, es_nuevo,
+        ultimo_contacto_ms previo).
+        """
+        if connection.vendor == "postgresql":
+            return GestorCliente._contabilizar_sql(phone_number, nombre, mensaje, alias_waba)
+        return GestorCliente._contabilizar_orm(phone_number, nombre, mensaje, alias_waba)
+
+    @staticmethod
+    def _contabilizar_sql(
+        phone_number: str, nombre: str, mensaje: str, alias_waba: str | None
+    ) -> Tuple[Cliente, bool, int | None]:
+        sql = UPSERT_CONTACTO_SQL.format(tabla=connection.ops.quote_name(Cliente._meta.db_table))
+        params = {
+            "phone_number": phone_number,
+            "nombre": nombre or None,
+            "alias_waba": alias_waba or None,
+            "ahora_ms": int(time.time() * 1000),
+            "mensaje": mensaje,
+        }
+        cliente = list(Cliente.objects.raw(sql, params))[0]
+        return cliente, bool(cliente.creado), cliente.previo_ms
+
+    @staticmethod
+    def _contabilizar_orm(
+        phone_number: str, nombre: str, mensaje: str, alias_waba: str | None
+    ) -> Tuple[Cliente, bool, int | None]:
+        with transaction.atomic():
+            cliente = Cliente.objects.select_for_update().filter(phone_number=phone_number).first()
+            if not cliente:
+                cliente = GestorCliente.nuevo_cliente(phone_number, nombre, mensaje, alias_waba)
+                cliente.save(force_insert=True)
+                return cliente, True, None
+
+            previo_ms = cliente.ultimo_contacto_ms
+            campos = GestorCliente.aplicar_contacto(cliente, nombre, mensaje, alias_waba)
+            total = cliente.mensajes_totales
+            cliente.mensajes_totales = models.F("mensajes_totales") + 1
+            cliente.save(update_fields=campos + ["updated_at"])
+            cliente.mensajes_totales = total
+        return cliente, False, previo_ms
+
+    @staticmethod
+    def nuevo_cliente(
+        phone_number: str,
+        nombre: str,
+        mensaje: str,
+        alias_waba: str | None = None,
+    ) -> Cliente:
+        """Cliente de primer contacto, sin guardar."""
         ahora_ms = int(time.time() * 1000)
-        cliente = Cliente.objects.filter(phone_number=phone_number).first()
-
-        if not cliente:
-            cliente = Cliente.objects.create(
-                phone_number=phone_number,
-                nombre=nombre or None,
-                alias_waba=alias_waba or None,
-                primer_contacto_ms=ahora_ms,
-                ultimo_contacto_ms=ahora_ms,
-                mensajes_totales=1,
-                ultimo_mensaje=mensaje,
-                activo=True,
-            )
-            return cliente, True
+        return Cliente(
+            phone_number=phone_number,
+            nombre=nombre or None,
+            alias_waba=alias_waba or None,
+            primer_contacto_ms=ahora_ms,
+            ultimo_contacto_ms=ahora_ms,
+            mensajes_totales=1,
+            ultimo_mensaje=mensaje,
+            activo=True,
+        )
 
+    @staticmethod
+    def aplicar_contacto(
+        cliente: Cliente,
+        nombre: str,
+        mensaje: str,
+        alias_waba: str | None = None,
+    ) -> list[str]:
+        """Registra un contacto en memoria. Retorna los campos modificados."""
+        campos = ["ultimo_contacto_ms", "mensajes_totales", "ultimo_mensaje", "activo"]
         if nombre and not cliente.nombre:
             cliente.nombre = nombre
+            campos.append("nombre")
         if alias_waba and not cliente.alias_waba:
             cliente.alias_waba = alias_waba
-        cliente.ultimo_contacto_ms = ahora_ms
+            campos.append("alias_waba")
+        cliente.ultimo_contacto_ms = int(time.time() * 1000)
         cliente.mensajes_totales += 1
         cliente.ultimo_mensaje = mensaje
         cliente.activo = True
-        cliente.save()
-        return cliente, False
+        return campos
@@ -1,14 +1,14 @@
-from typing import List, Optional, Dict, Any, Set
+from typing import List, Optional, Dict, Any
 import unicodedata
 
 from app.models.menu import Menu
 from app.models.menu_option import MenuOption
 from app.models.respuesta import Respuesta
-from app.models.config import Config
+from app.services.repositorio_contenido import InstantaneaContenido, obtener_contenido
 
 
 class GestorContenido:
-    """Gestiona menus y respuestas desde BD"""
+    """Gestiona menus y respuestas (lee la instantanea de repositorio_contenido)"""
 
     CLUB_SHORTCUT_KEY = "CLUB"
     NAV_CLUB_LINE = "🎁 CLUB Club de beneficios"
@@ -19,25 +19,25 @@ class GestorContenido:
     @staticmethod
     def obtener_menu(menu_id: str) -> Optional[Menu]:
         """Obtiene un menu por ID"""
-        return Menu.objects.filter(id=menu_id, activo=True).first()
+        return obtener_contenido().menus_activos.get(str(menu_id))
 
     @staticmethod
     def obtener_respuesta(respuesta_id: str) -> Optional[Respuesta]:
         """Obtiene una respuesta por ID"""
-        return Respuesta.objects.filter(id=respuesta_id, activo=True).first()
+        return obtener_contenido().respuestas.get(str(respuesta_id))
 
     @staticmethod
     def obtener_config_mensaje(clave: str) -> Optional[str]:
         """Obtiene mensaje de configuracion"""
-        config = Config.objects.filter(id=f"mensaje_{clave}").first()
-        if not config or not isinstance(config.valor, dict):
+        valor = obtener_contenido().config.get(f"mensaje_{clave}")
+        if not isinstance(valor, dict):
             return None
-        return config.valor.get("contenido")
+        return valor.get("contenido")
 
     @staticmethod
     def obtener_menu_principal() -> Optional[Menu]:
         """Obtiene el menu principal (id=0)"""
-        menu = Menu.objects.filter(is_main=True, activo=True).first()
+        menu = obtener_contenido().menu_principal
         if menu:
             return menu
         return GestorContenido.obtener_menu("0")
@@ -45,21 +45,17 @@ class GestorContenido:
     @staticmethod
     def listar_menus_activos() -> List[Menu]:
         """Lista todos los menus activos"""
-        return list(Menu.objects.filter(activo=True))
+        return list(obtener_contenido().menus_activos.values())
 
     @staticmethod
     def listar_respuestas_activas() -> List[Respuesta]:
         """Lista todas las respuestas activas"""
-        return list(Respuesta.objects.filter(activo=True))
+        return list(obtener_contenido().respuestas.values())
 
     @staticmethod
     def obtener_opcion(menu_id: str, key: str) -> Optional[MenuOption]:
         """Obtiene una opcion activa de un menu por key."""
-        return (
-            MenuOption.objects.filter(menu_id=menu_id, key=key, activo=True)
-            .select_related("target_menu", "target_respuesta")
-            .first()
-        )
+        return obtener_contenido().opciones_por_key.get((str(menu_id), key))
 
     @staticmethod
     def _es_opcion_club_beneficios(label: str) -> bool:
@@ -69,17 +65,15 @@ class GestorContenido:
         return any(term in label_norm for term in ("beneficio", "promo", "descuento"))
 
     @staticmethod
-    def obtener_opcion_club_beneficios() -> Optional[MenuOption]:
+    def obtener_opcion_club_beneficios(
+        instantanea: Optional[InstantaneaContenido] = None,
+    ) -> Optional[MenuOption]:
         """Busca en el menu principal la opcion que apunta al Club de Beneficios."""
-        menu_principal = GestorContenido.obtener_menu_principal()
+        instantanea = instantanea or obtener_contenido()
+        menu_principal = instantanea.menu_principal or instantanea.menus_activos.get("0")
         if not menu_principal:
             return None
-        opciones = (
-            MenuOption.objects.filter(menu=menu_principal, activo=True)
-            .select_related("target_menu", "target_respuesta")
-            .order_by("orden")
-        )
-        for opcion in opciones:
+        for opcion in instantanea.opciones_de(menu_principal.id):
             if GestorContenido._es_opcion_club_beneficios(opcion.label):
                 return opcion
         return None
@@ -116,20 +110,22 @@ class GestorContenido:
     def construir_ruta_menu(menu: Optional[Menu], max_depth: int = 15) -> str:
         if not menu:
             return ""
-        ruta: List[str] = []
-        visitados: Set[str] = set()
-        actual = menu
-        while actual and len(ruta) < max_depth:
-            menu_id = str(actual.id)
-            if menu_id in visitados:
-                break
-            visitados.add(menu_id)
-            ruta.append(GestorContenido._titulo_menu(actual))
-            actual = actual.parent
+        instantanea = obtener_contenido()
+        menu_id = str(menu.id)
+        if instantanea.es_propio(menu):
+            ids = instantanea.ancestros.get(menu_id, (menu_id,))
+        else:
+            padre = instantanea.ancestros.get(str(menu.parent_id), ()) if menu.parent_id else ()
+            ids = tuple(paso for paso in padre if paso != menu_id) + (menu_id,)
+        ruta: List[str] = [
+            GestorContenido._titulo_menu(
+                menu if paso == menu_id else instantanea.menus[paso]
+            )
+            for paso in ids[-max_depth:]
+        ]
 
         if not ruta:
             return ""
-        ruta.reverse()
         if ruta[0] != "Menu principal" and not GestorContenido._menu_es_principal(menu):
             ruta.insert(0, "Menu principal")
         return " > ".join(ruta)
@@ -195,7 +191,25 @@ class GestorContenido:
         incluir_navegacion: bool = True,
         menu_contexto_id: Optional[str] = None,
     ) -> str:
-        """Formatea una respuesta para enviar a WhatsApp"""
+        """Formatea una respuesta para enviar a WhatsApp (memorizado por version)"""
+        instantanea = obtener_contenido()
+        if not instantanea.es_propio(respuesta):
+            return GestorContenido._formatear_respuesta(
+                respuesta, incluir_navegacion, menu_contexto_id
+            )
+        return instantanea.renderizar(
+            ("respuesta", str(respuesta.pk), menu_contexto_id, incluir_navegacion),
+            lambda: GestorContenido._formatear_respuesta(
+                respuesta, incluir_navegacion, menu_contexto_id
+            ),
+        )
+
+    @staticmethod
+    def _formatear_respuesta(
+        respuesta: Respuesta,
+        incluir_navegacion: bool,
+        menu_contexto_id: Optional[str],
+    ) -> str:
         contenido = (respuesta.contenido or "").strip()
 
         contexto = GestorContenido.obtener_contexto_menu(menu_contexto_id)
@@ -214,10 +228,18 @@ class GestorContenido:
         incluir_navegacion: bool = True,
         incluir_contexto: bool = True,
     ) -> str:
-        """Formatea un menu para enviar a WhatsApp"""
-        opciones = list(
-            MenuOption.objects.filter(menu=menu, activo=True).order_by("orden")
+        """Formatea un menu para enviar a WhatsApp (memorizado por version)"""
+        instantanea = obtener_contenido()
+        if not instantanea.es_propio(menu):
+            return GestorContenido._formatear_menu(menu, incluir_navegacion, incluir_contexto)
+        return instantanea.renderizar(
+            ("menu", str(menu.pk), incluir_navegacion, incluir_contexto),
+            lambda: GestorContenido._formatear_menu(menu, incluir_navegacion, incluir_contexto),
         )
+
+    @staticmethod
+    def _formatear_menu(menu: Menu, incluir_navegacion: bool, incluir_contexto: bool) -> str:
+        opciones = obtener_contenido().opciones_de(menu.id)
         if opciones:
             cuerpo = "\n".join([f"{opt.key} {opt.label}".strip() for opt in opciones])
         else:
@@ -236,3 +258,22 @@ class GestorContenido:
             contenido = GestorContenido._agregar_navegacion(contenido, pasos)
 
         return contenido
+
+    @staticmethod
+    def precalentar_render(instantanea: InstantaneaContenido) -> int:
+        """Renderiza por adelantado lo que piden los mensajes: cada menu (texto e
+        interactivo) y cada respuesta en el menu desde el que se elige.
+        """
+        from app.services.interactive_builder import build_menu_interactive_payloads
+
+        total = 0
+        for menu in instantanea.menus_activos.values():
+            GestorContenido.formatear_menu(menu)
+            build_menu_interactive_payloads(menu, body_text=menu.titulo or "")
+            total += 1
+            for opcion in instantanea.opciones_de(menu.id):
+                respuesta = instantanea.respuestas.get(str(opcion.target_respuesta_id))
+                if respuesta is not None:
+                    GestorContenido.formatear_respuesta(respuesta, menu_contexto_id=menu.id)
+                    total += 1
+        return total
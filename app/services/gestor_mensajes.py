@@ -1,9 +1,34 @@
 import time
 from typing import Optional
 
-from django.db import IntegrityError
+from django.db import IntegrityError, connection, transaction
 
+from app.models.cola_mensaje import ColaMensaje
 from app.models.mensaje import Mensaje
+from app.services.queue_notify import notificar_cola
+
+# Alta de un lote de entrantes en una sola sentencia: los wa_message_id ya
+# registrados (reintentos de Meta) los descarta el indice parcial
+# uniq_inbound_wa_message_id y los nuevos pending pasan a la cola con el
+# vencimiento de ColaMensaje.vencimiento (su timestamp_ms).
+INSERTAR_ENTRADAS_SQL = """
+    WITH nuevos AS (
+        INSERT INTO {mensajes} ({columnas})
+        VALUES {filas}
+        ON CONFLICT (wa_message_id) WHERE direccion = 'in' AND wa_message_id IS NOT NULL
+        DO NOTHING
+        RETURNING id, direccion, phone_number, queue_status, process_after_ms, timestamp_ms, attempts
+    ),
+    encolados AS (
+        INSERT INTO {cola} (mensaje_id, direccion, phone_number, status, due_at_ms, attempts)
+        SELECT id, direccion, phone_number, queue_status,
+               LEAST(timestamp_ms, COALESCE(process_after_ms, timestamp_ms)), attempts
+        FROM nuevos
+        WHERE queue_status = 'pending'
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM nuevos), (SELECT count(*) FROM encolados)
+"""
 
 
 class GestorMensajes:
@@ -21,17 +46,16 @@ class GestorMensajes:
         queue_status: str = "pending",
         process_after_ms: Optional[int] = None,
     ) -> Mensaje:
-        defaults = dict(
-            phone_number=phone_number,
-            nombre=nombre or None,
-            direccion="in",
-            tipo=tipo or "text",
-            contenido=contenido,
-            wa_message_id=wa_message_id,
-            timestamp_ms=timestamp_ms or int(time.time() * 1000),
-            metadata_json=metadata or None,
-            queue_status=queue_status,
-            process_after_ms=process_after_ms,
+        mensaje = GestorMensajes.nueva_entrada(
+            phone_number,
+            nombre,
+            contenido,
+            tipo,
+            timestamp_ms,
+            wa_message_id,
+            metadata,
+            queue_status,
+            process_after_ms,
         )
         if wa_message_id:
             existing = Mensaje.objects.filter(
@@ -40,7 +64,11 @@ class GestorMensajes:
             if existing:
                 return existing
         try:
-            return Mensaje.objects.create(**defaults)
+            with transaction.atomic():
+                mensaje.save(force_insert=True)
+                if queue_status == "pending":
+                    ColaMensaje.encolar(mensaje)
+            return mensaje
         except IntegrityError:
             if wa_message_id:
                 existing = Mensaje.objects.filter(
@@ -51,24 +79,130 @@ class GestorMensajes:
             raise
 
     @staticmethod
-    def registrar_salida(
+    def nueva_entrada(
         phone_number: str,
         nombre: str,
         contenido: str,
-        tipo: str = "text",
+        tipo: str,
         timestamp_ms: Optional[int] = None,
+        wa_message_id: str | None = None,
         metadata: Optional[dict] = None,
-        queue_status: str = "queued",
+        queue_status: str = "pending",
         process_after_ms: Optional[int] = None,
     ) -> Mensaje:
-        return Mensaje.objects.create(
+        """Mensaje entrante sin guardar (registrar_entrada, registrar_entradas)."""
+        return Mensaje(
             phone_number=phone_number,
             nombre=nombre or None,
-            direccion="out",
+            direccion="in",
             tipo=tipo or "text",
             contenido=contenido,
+            wa_message_id=wa_message_id,
             timestamp_ms=timestamp_ms or int(time.time() * 1000),
             metadata_json=metadata or None,
             queue_status=queue_status,
             process_after_ms=process_after_ms,
         )
+
+    @staticmethod
+    def registrar_entradas(mensajes: list[Mensaje]) -> dict:
+        """Inserta un lote de entrantes descartando los wa_message_id repetidos.
+
+        En Postgres es una sola sentencia (INSERT ... ON CONFLICT DO NOTHING
+        que ademas crea las filas de cola). En otros motores se filtran los
+        ya registrados con una consulta y se usa bulk_create. Retorna
+        {"nuevos", "duplicados"}.
+        """
+        vistos: set[str] = set()
+        unicos: list[Mensaje] = []
+        for mensaje in mensajes:
+            if mensaje.wa_message_id:
+                if mensaje.wa_message_id in vistos:
+                    continue
+                vistos.add(mensaje.wa_message_id)
+            unicos.append(mensaje)
+        if not unicos:
+            return {"nuevos": 0, "duplicados": len(mensajes)}
+        if connection.vendor == "postgresql":
+            nuevos = GestorMensajes._registrar_entradas_sql(unicos)
+        else:
+            nuevos = GestorMensajes._registrar_entradas_orm(unicos)
+        return {"nuevos": nuevos, "duplicados": len(mensajes) - nuevos}
+
+    @staticmethod
+    def _registrar_entradas_sql(mensajes: list[Mensaje]) -> int:
+        qn = connection.ops.quote_name
+        campos = [campo for campo in Mensaje._meta.concrete_fields if not campo.primary_key]
+        fila = "(" + ", ".join(["%s"] * len(campos)) + ")"
+        sql = INSERTAR_ENTRADAS_SQL.format(
+            mensajes=qn(Mensaje._meta.db_table),
+            cola=qn(ColaMensaje._meta.db_table),
+            columnas=", ".join(qn(campo.column) for campo in campos),
+            filas=", ".join([fila] * len(mensajes)),
+        )
+        params = [
+            campo.get_db_prep_save(campo.pre_save(mensaje, True), connection)
+            for mensaje in mensajes
+            for campo in campos
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            nuevos, _ = cursor.fetchone()
+        return nuevos
+
+    @staticmethod
+    def _registrar_entradas_orm(mensajes: list[Mensaje]) -> int:
+        ids = [mensaje.wa_message_id for mensaje in mensajes if mensaje.wa_message_id]
+        for intento in range(3):
+            try:
+                with transaction.atomic():
+                    existentes: set[str] = set()
+                    if ids:
+                        existentes.update(
+                            Mensaje.objects.filter(direccion="in", wa_message_id__in=ids)
+                            .values_list("wa_message_id", flat=True)
+                        )
+                    nuevos = Mensaje.objects.bulk_create(
+                        [mensaje for mensaje in mensajes if mensaje.wa_message_id not in existentes]
+                    )
+                    ColaMensaje.objects.bulk_create(
+                        [ColaMensaje.para(mensaje) for mensaje in nuevos if mensaje.queue_status == "pending"]
+                    )
+                return len(nuevos)
+            except IntegrityError:
+                # Otro proceso registro alguno entre la consulta y el INSERT.
+                for mensaje in mensajes:
+                    mensaje.pk = None
+                    mensaje._state.adding = True
+                if intento == 2:
+                    raise
+        return 0
+
+    @staticmethod
+    def registrar_salida(
+        phone_number: str,
+        nombre: str,
+        contenido: str,
+        tipo: str = "text",
+        timestamp_ms: Optional[int] = None,
+        metadata: Optional[dict] = None,
+        queue_status: str = "queued",
+        process_after_ms: Optional[int] = None,
+    ) -> Mensaje:
+        with transaction.atomic():
+            mensaje = Mensaje.objects.create(
+                phone_number=phone_number,
+                nombre=nombre or None,
+                direccion="out",
+                tipo=tipo or "text",
+                contenido=contenido,
+                timestamp_ms=timestamp_ms or int(time.time() * 1000),
+                metadata_json=metadata or None,
+                queue_status=queue_status,
+                process_after_ms=process_after_ms,
+            )
+            if queue_status == "queued":
+                ColaMensaje.encolar(mensaje)
+        if queue_status == "queued":
+            notificar_cola("out", process_after_ms, mensaje_id=mensaje.id)
+        return mensaje
@@ -1,9 +1,11 @@
 import time
-from typing import List
+from typing import Callable, List
 
 from django.conf import settings
+from django.utils import timezone
 
 from app.models.sesion import Sesion
+from app.services.sesion_store import get_sesion_store, invalidar_sesion
 
 
 class GestorSesion:
@@ -12,31 +14,52 @@ class GestorSesion:
     @staticmethod
     def obtener_o_crear_sesion(phone_number: str, nombre: str = "") -> tuple[Sesion, bool]:
         """Obtiene sesion existente o crea una nueva. Retorna (sesion, expirada)."""
-        sesion = Sesion.objects.filter(phone_number=phone_number).first()
-
-        tiempo_actual = int(time.time() * 1000)
+        store = get_sesion_store()
+        sesion = store.cargar(phone_number)
 
         if not sesion:
-            sesion = Sesion.objects.create(
-                phone_number=phone_number,
-                nombre=nombre,
-                activa=True,
-                estado_actual="0",
-                historial_navegacion=["0"],
-                inicio_sesion_ms=tiempo_actual,
-                ultimo_acceso_ms=tiempo_actual,
-                primer_acceso=True,
-            )
+            sesion = GestorSesion.nueva_sesion(phone_number, nombre)
+            store.guardar(sesion, nueva=True)
             return sesion, False
 
+        expirada, campos = GestorSesion.registrar_acceso(sesion)
+        store.guardar(sesion, campos)
+        return sesion, expirada
+
+    @staticmethod
+    def nueva_sesion(phone_number: str, nombre: str = "") -> Sesion:
+        """Sesion inicial en el menu principal, sin guardar."""
+        tiempo_actual = int(time.time() * 1000)
+        return Sesion(
+            phone_number=phone_number,
+            nombre=nombre,
+            activa=True,
+            estado_actual="0",
+            historial_navegacion=["0"],
+            inicio_sesion_ms=tiempo_actual,
+            ultimo_acceso_ms=tiempo_actual,
+            primer_acceso=True,
+        )
+
+    @staticmethod
+    def registrar_acceso(sesion: Sesion) -> tuple[bool, List[str]]:
+        """Registra un acceso en memoria. Retorna (expirada, campos modificados).
+
+        Normalmente el barrido (expirar_sesiones) ya cerro la sesion y aca
+        solo se lee activa; si todavia no paso, se cierra en el momento.
+        """
+        tiempo_actual = int(time.time() * 1000)
         inactividad_ms = tiempo_actual - sesion.ultimo_acceso_ms
-        expirada = inactividad_ms > settings.SESSION_TIMEOUT_SECONDS * 1000
+        vencida = inactividad_ms > settings.SESSION_TIMEOUT_SECONDS * 1000
+        barrida = not sesion.activa
+        expirada = vencida or barrida
 
         sesion.ultimo_acceso_ms = tiempo_actual
         sesion.primer_acceso = False
+        sesion.activa = True
+        campos = ["ultimo_acceso_ms", "primer_acceso", "activa"]
 
-        if expirada:
-            sesion.activa = False
+        if vencida and not barrida:
             sesion.estado_actual = "0"
             sesion.historial_navegacion = ["0"]
             sesion.intentos_fallidos = 0
@@ -44,11 +67,73 @@ class GestorSesion:
             extra["last_closed_ms"] = tiempo_actual
             extra["last_close_reason"] = "timeout"
             sesion.datos_extra = extra
-        else:
-            sesion.activa = True
+            campos += ["estado_actual", "historial_navegacion", "intentos_fallidos", "datos_extra"]
 
-        sesion.save()
-        return sesion, expirada
+        return expirada, campos
+
+    @staticmethod
+    def expirar_sesiones(
+        now_ms: int | None = None,
+        lote: int | None = None,
+        cancelar: Callable[[], bool] | None = None,
+    ) -> dict:
+        """Cierra en lotes las sesiones inactivas y borra las abandonadas.
+
+        Primer nivel: sesiones activas sin acceso hace SESSION_TIMEOUT_SECONDS
+        quedan activa=False y vuelven al menu principal. Segundo nivel, solo
+        con SESSION_PURGE_ENABLED: las que llevan INACTIVE_TIMEOUT_SECONDS
+        sin acceso se borran (0 lo desactiva); si el cliente vuelve arranca
+        una sesion nueva.
+        """
+        now_ms = now_ms or int(time.time() * 1000)
+        lote = int(lote or getattr(settings, "SESSION_SWEEP_BATCH_SIZE", 1000))
+        cancelar = cancelar or (lambda: False)
+        corte_ms = now_ms - int(settings.SESSION_TIMEOUT_SECONDS) * 1000
+        vencidas = Sesion.objects.filter(activa=True, ultimo_acceso_ms__lt=corte_ms)
+
+        expiradas = 0
+        while not cancelar():
+            ids = list(vencidas.order_by("ultimo_acceso_ms").values_list("pk", flat=True)[:lote])
+            if not ids:
+                break
+            expiradas += vencidas.filter(pk__in=ids).update(
+                activa=False,
+                estado_actual="0",
+                historial_navegacion=["0"],
+                intentos_fallidos=0,
+                updated_at=timezone.now(),
+            )
+            GestorSesion._descartar_cacheadas(ids)
+            if len(ids) < lote:
+                break
+
+        archivadas = 0
+        inactivo_s = int(getattr(settings, "INACTIVE_TIMEOUT_SECONDS", 0) or 0)
+        if getattr(settings, "SESSION_PURGE_ENABLED", False) and inactivo_s > 0:
+            corte_archivo_ms = now_ms - max(inactivo_s, int(settings.SESSION_TIMEOUT_SECONDS)) * 1000
+            abandonadas = Sesion.objects.filter(ultimo_acceso_ms__lt=corte_archivo_ms)
+            while not cancelar():
+                ids = list(abandonadas.order_by("ultimo_acceso_ms").values_list("pk", flat=True)[:lote])
+                if not ids:
+                    break
+                archivadas += abandonadas.filter(pk__in=ids).delete()[0]
+                GestorSesion._descartar_cacheadas(ids)
+                if len(ids) < lote:
+                    break
+
+        return {"expiradas": expiradas, "archivadas": archivadas}
+
+    @staticmethod
+    def _descartar_cacheadas(phone_numbers: List[str]) -> None:
+        """Libera las sesiones barridas del store de este proceso.
+
+        Las que tienen cambios sin escribir se conservan: fueron accedidas
+        despues de lo que vio el barrido. En otro proceso no hace falta
+        avisar: el store lru relee las que pasaron SESSION_TIMEOUT_SECONDS.
+        """
+        store = get_sesion_store()
+        for phone_number in phone_numbers:
+            store.descartar(phone_number, pendientes=False)
 
     @staticmethod
     def actualizar_estado(
@@ -59,29 +144,52 @@ class GestorSesion:
         tipo_contenido: str | None = None,
     ) -> Sesion:
         """Actualiza el estado actual y el historial de navegacion"""
-        sesion = Sesion.objects.filter(phone_number=phone_number).first()
+        store = get_sesion_store()
+        sesion = store.cargar(phone_number)
 
         if sesion:
-            sesion.estado_actual = nuevo_estado
-            sesion.historial_navegacion = historial
-            sesion.ultimo_mensaje = mensaje
-            sesion.timestamp_ultimo_mensaje = int(time.time() * 1000)
-            if tipo_contenido:
-                extra = sesion.datos_extra or {}
-                extra["last_content_type"] = tipo_contenido
-                sesion.datos_extra = extra
-            sesion.save()
+            campos = GestorSesion.aplicar_estado(
+                sesion, nuevo_estado, historial, mensaje, tipo_contenido
+            )
+            store.guardar(sesion, campos)
 
         return sesion
 
+    @staticmethod
+    def aplicar_estado(
+        sesion: Sesion,
+        nuevo_estado: str,
+        historial: List[str],
+        mensaje: str = "",
+        tipo_contenido: str | None = None,
+    ) -> List[str]:
+        """Aplica el nuevo estado en memoria. Retorna los campos modificados."""
+        sesion.estado_actual = nuevo_estado
+        sesion.historial_navegacion = historial
+        sesion.ultimo_mensaje = mensaje
+        sesion.timestamp_ultimo_mensaje = int(time.time() * 1000)
+        campos = [
+            "estado_actual",
+            "historial_navegacion",
+            "ultimo_mensaje",
+            "timestamp_ultimo_mensaje",
+        ]
+        if tipo_contenido:
+            extra = sesion.datos_extra or {}
+            extra["last_content_type"] = tipo_contenido
+            sesion.datos_extra = extra
+            campos.append("datos_extra")
+        return campos
+
     @staticmethod
     def incrementar_intentos_fallidos(phone_number: str) -> int:
         """Incrementa contador de intentos fallidos"""
-        sesion = Sesion.objects.filter(phone_number=phone_number).first()
+        store = get_sesion_store()
+        sesion = store.cargar(phone_number)
 
         if sesion:
             sesion.intentos_fallidos += 1
-            sesion.save()
+            store.guardar(sesion, ["intentos_fallidos"])
             return sesion.intentos_fallidos
 
         return 1
@@ -89,7 +197,24 @@ class GestorSesion:
     @staticmethod
     def resetear_intentos_fallidos(phone_number: str) -> None:
         """Resetea contador de intentos fallidos"""
-        Sesion.objects.filter(phone_number=phone_number).update(intentos_fallidos=0)
+        store = get_sesion_store()
+        sesion = store.cargar(phone_number)
+        if sesion:
+            sesion.intentos_fallidos = 0
+            store.guardar(sesion, ["intentos_fallidos"])
+
+    @staticmethod
+    def resetear_navegacion(phone_number: str) -> Sesion | None:
+        """Vuelve la sesion al menu principal."""
+        store = get_sesion_store()
+        sesion = store.cargar(phone_number)
+        if sesion:
+            sesion.estado_actual = "0"
+            sesion.historial_navegacion = ["0"]
+            sesion.intentos_fallidos = 0
+            store.guardar(sesion, ["estado_actual", "historial_navegacion", "intentos_fallidos"])
+            invalidar_sesion(phone_number)
+        return sesion
 
     @staticmethod
     def es_sesion_valida(sesion: Sesion) -> bool:
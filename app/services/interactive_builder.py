@@ -1,10 +1,11 @@
 from __future__ import annotations
 
+import json
 import time
 from typing import Optional, List, Dict, Any
 
 from app.models.menu import Menu
-from app.models.menu_option import MenuOption
+from app.services.repositorio_contenido import obtener_contenido
 
 
 MAX_BUTTONS = 3
@@ -33,9 +34,7 @@ def _trim(text: str, max_len: int) -> str:
 
 
 def _build_options(menu: Menu) -> List[Dict[str, str]]:
-    opciones = list(
-        MenuOption.objects.filter(menu=menu, activo=True).order_by("orden")
-    )
+    opciones = obtener_contenido().opciones_de(menu.id)
     items = [
         {"key": (opt.key or "").strip(), "label": (opt.label or "").strip()}
         for opt in opciones
@@ -67,6 +66,19 @@ def _find_first_screen_id(flow_json: Any) -> Optional[str]:
     return None
 
 
+def _memorizado(menu: Menu, clave: tuple, construir) -> Any:
+    """Payload construido una vez por version de contenido, guardado como JSON.
+
+    Cada llamada recibe su propia copia (json.loads), asi quien lo arma o lo
+    guarda en metadata no toca el cacheado.
+    """
+    instantanea = obtener_contenido()
+    if not instantanea.es_propio(menu):
+        return construir()
+    serializado = instantanea.renderizar(clave, lambda: json.dumps(construir()))
+    return json.loads(serializado)
+
+
 def build_flow_interactive_payload(
     menu: Menu,
     body_text: Optional[str] = None,
@@ -75,17 +87,31 @@ def build_flow_interactive_payload(
 ) -> Optional[Dict]:
     if not menu or not menu.flow_id:
         return None
+    payload = _memorizado(
+        menu,
+        ("flow", str(menu.pk), body_text, cta_text, str(message_version)),
+        lambda: _build_flow_payload(menu, body_text, cta_text, message_version),
+    )
+    # El flow_token es por envio: se inyecta sobre el payload cacheado.
+    payload["action"]["parameters"]["flow_token"] = f"menu_{menu.id}_{int(time.time())}"
+    return payload
+
 
+def _build_flow_payload(
+    menu: Menu,
+    body_text: Optional[str],
+    cta_text: str,
+    message_version: str,
+) -> Dict:
     screen_id = _find_first_screen_id(menu.flow_json)
     body = _trim(body_text or menu.titulo or "Selecciona una opcion", MAX_BODY_TEXT)
     cta = _trim(cta_text, MAX_FLOW_CTA) or "Ver opciones"
-    flow_token = f"menu_{menu.id}_{int(time.time())}"
 
     parameters: Dict[str, Any] = {
         "flow_message_version": str(message_version),
         "flow_id": str(menu.flow_id),
         "flow_cta": cta,
-        "flow_token": flow_token,
+        "flow_token": "",
     }
 
     if screen_id:
@@ -158,6 +184,14 @@ def _build_list_payload(opciones: List[Dict[str, str]], body: str, section_title
 
 
 def build_menu_interactive_payloads(menu: Menu, body_text: Optional[str] = None) -> Optional[List[Dict]]:
+    return _memorizado(
+        menu,
+        ("interactivo", str(menu.pk), body_text),
+        lambda: _build_menu_payloads(menu, body_text),
+    )
+
+
+def _build_menu_payloads(menu: Menu, body_text: Optional[str]) -> Optional[List[Dict]]:
     opciones = _build_options(menu)
     if not opciones:
         return None
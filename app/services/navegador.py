@@ -1,7 +1,112 @@
-from typing import List, Optional, Dict, Tuple
+from typing import Callable, List, Optional, Dict, Tuple
 
-from app.services.validador import ValidadorEntrada
+from app.models.menu import Menu
+from app.services.validador import ResultadoValidacion, ValidadorEntrada
 from app.services.gestor_contenido import GestorContenido
+from app.services.repositorio_contenido import InstantaneaContenido, obtener_contenido
+
+# Reglas de historial de una transicion.
+HISTORIAL_REINICIAR = "reiniciar"  # ["0"] (+ destino si es un menu)
+HISTORIAL_AGREGAR = "agregar"  # agrega el destino si no estaba
+HISTORIAL_MANTENER = "mantener"
+HISTORIAL_VOLVER = "volver"  # depende del historial y del ultimo contenido
+
+
+class Transicion:
+    """Destino de una entrada desde un estado: tipo, target y regla de historial.
+
+    estado None significa quedarse en el estado actual; target None, usar el
+    target de la validacion (ayuda) o el estado resultante (volver).
+    """
+
+    __slots__ = ("tipo", "target", "estado", "historial")
+
+    def __init__(self, tipo: str, target: Optional[str], estado: Optional[str], historial: str):
+        self.tipo = tipo
+        self.target = target
+        self.estado = estado
+        self.historial = historial
+
+    def aplicar(
+        self,
+        historial_actual: List[str],
+        estado_actual: str,
+        ultimo_tipo: Optional[str],
+        target_validacion: str,
+    ) -> Tuple[str, List[str], str, str, bool]:
+        nuevo_historial = list(historial_actual)
+        nuevo_estado = estado_actual if self.estado is None else self.estado
+        target = self.target if self.target is not None else target_validacion
+
+        if self.historial == HISTORIAL_REINICIAR:
+            nuevo_historial = ["0"]
+            if self.tipo == "menu" and nuevo_estado not in nuevo_historial:
+                nuevo_historial.append(nuevo_estado)
+        elif self.historial == HISTORIAL_AGREGAR:
+            if nuevo_estado not in nuevo_historial:
+                nuevo_historial.append(nuevo_estado)
+        elif self.historial == HISTORIAL_VOLVER:
+            if ultimo_tipo == "respuesta":
+                nuevo_estado = estado_actual
+            else:
+                if len(nuevo_historial) > 1:
+                    nuevo_historial.pop()
+                nuevo_estado = nuevo_historial[-1] if nuevo_historial else "0"
+            target = nuevo_estado
+
+        return nuevo_estado, nuevo_historial, self.tipo, target, True
+
+
+class AutomataNavegacion:
+    """Tabla de transiciones compilada desde una instantanea de contenido.
+
+    transiciones: (estado, key de opcion) -> Transicion.
+    comandos: accion del validador (menu principal, club, volver, ayuda) -> Transicion.
+    """
+
+    def __init__(self, transiciones: Dict[Tuple[str, str], Transicion], comandos: Dict[str, Transicion]):
+        self.transiciones = transiciones
+        self.comandos = comandos
+
+    @staticmethod
+    def vigente() -> "AutomataNavegacion":
+        instantanea = obtener_contenido()
+        return instantanea.derivado(
+            "navegacion", lambda: AutomataNavegacion.compilar(instantanea)
+        )
+
+    @staticmethod
+    def compilar(instantanea: InstantaneaContenido) -> "AutomataNavegacion":
+        transiciones: Dict[Tuple[str, str], Transicion] = {}
+        for (menu_id, key), opcion in instantanea.opciones_por_key.items():
+            if opcion.target_menu_id:
+                transiciones[(menu_id, key)] = Transicion(
+                    "menu", str(opcion.target_menu_id), str(opcion.target_menu_id), HISTORIAL_AGREGAR
+                )
+            elif opcion.target_respuesta_id:
+                transiciones[(menu_id, key)] = Transicion(
+                    "respuesta", str(opcion.target_respuesta_id), None, HISTORIAL_MANTENER
+                )
+
+        principal = Transicion("menu", "0", "0", HISTORIAL_REINICIAR)
+        opcion_club = GestorContenido.obtener_opcion_club_beneficios(instantanea)
+        if opcion_club and opcion_club.target_menu_id:
+            club = Transicion(
+                "menu", str(opcion_club.target_menu_id), str(opcion_club.target_menu_id), HISTORIAL_REINICIAR
+            )
+        elif opcion_club and opcion_club.target_respuesta_id:
+            club = Transicion("respuesta", str(opcion_club.target_respuesta_id), "0", HISTORIAL_REINICIAR)
+        else:
+            # Fallback seguro: si no hay opcion configurada, vuelve al menu principal.
+            club = principal
+
+        comandos = {
+            "ir_menu_principal": principal,
+            "ir_club_beneficios": club,
+            "volver_anterior": Transicion("menu", None, None, HISTORIAL_VOLVER),
+            "mostrar_ayuda": Transicion("help", None, None, HISTORIAL_MANTENER),
+        }
+        return AutomataNavegacion(transiciones, comandos)
 
 
 class NavigadorBot:
@@ -13,6 +118,7 @@ class NavigadorBot:
         historial_actual: List[str],
         estado_actual: str,
         ultimo_tipo: Optional[str] = None,
+        validacion: Optional[ResultadoValidacion] = None,
     ) -> Tuple[str, List[str], str, str, bool]:
         """
         Procesa la entrada del usuario y retorna:
@@ -21,84 +127,39 @@ class NavigadorBot:
         - tipo (menu o respuesta)
         - target (id del contenido)
         - es_valido
+
+        La transicion sale de la tabla compilada (AutomataNavegacion) de la
+        version vigente del contenido: un paso es una busqueda en un dict.
         """
-        validacion = ValidadorEntrada.validar(entrada)
+        if validacion is None:
+            validacion = ValidadorEntrada.validar(entrada)
 
         if not validacion.es_valido:
             return estado_actual, historial_actual, "error", "", False
 
-        accion = validacion.accion
-        target = validacion.target
-
-        nuevo_historial = list(historial_actual)
-        tipo_contenido = "menu"
-
-        if accion == "ir_menu_principal":
-            nuevo_historial = ["0"]
-            nuevo_estado = "0"
-            tipo_contenido = "menu"
-            target = "0"
-        elif accion == "ir_club_beneficios":
-            opcion_club = GestorContenido.obtener_opcion_club_beneficios()
-            if opcion_club and opcion_club.target_menu_id:
-                nuevo_historial = ["0"]
-                nuevo_estado = opcion_club.target_menu_id
-                if nuevo_estado not in nuevo_historial:
-                    nuevo_historial.append(nuevo_estado)
-                tipo_contenido = "menu"
-                target = opcion_club.target_menu_id
-            elif opcion_club and opcion_club.target_respuesta_id:
-                nuevo_historial = ["0"]
-                nuevo_estado = "0"
-                tipo_contenido = "respuesta"
-                target = opcion_club.target_respuesta_id
-            else:
-                # Fallback seguro: si no hay opcion configurada, vuelve al menu principal.
-                nuevo_historial = ["0"]
-                nuevo_estado = "0"
-                tipo_contenido = "menu"
-                target = "0"
-        elif accion == "volver_anterior":
-            if ultimo_tipo == "respuesta":
-                nuevo_estado = estado_actual
-            else:
-                if len(nuevo_historial) > 1:
-                    nuevo_historial.pop()
-                nuevo_estado = nuevo_historial[-1] if nuevo_historial else "0"
-            tipo_contenido = "menu"
-            target = nuevo_estado
-        elif accion == "seleccionar_opcion":
-            opcion = GestorContenido.obtener_opcion(estado_actual, target)
-            if not opcion:
-                return estado_actual, historial_actual, "error", "", False
-
-            if opcion.target_menu_id:
-                nuevo_estado = opcion.target_menu_id
-                if nuevo_estado not in nuevo_historial:
-                    nuevo_historial.append(nuevo_estado)
-                tipo_contenido = "menu"
-                target = opcion.target_menu_id
-            elif opcion.target_respuesta_id:
-                nuevo_estado = estado_actual
-                tipo_contenido = "respuesta"
-                target = opcion.target_respuesta_id
-            else:
-                return estado_actual, historial_actual, "error", "", False
-        elif accion == "mostrar_ayuda":
-            nuevo_estado = estado_actual
-            tipo_contenido = "help"
+        automata = AutomataNavegacion.vigente()
+        if validacion.accion == "seleccionar_opcion":
+            transicion = automata.transiciones.get((str(estado_actual), validacion.target))
         else:
+            transicion = automata.comandos.get(validacion.accion)
+        if transicion is None:
             return estado_actual, historial_actual, "error", "", False
 
-        return nuevo_estado, nuevo_historial, tipo_contenido, target, True
+        return transicion.aplicar(historial_actual, estado_actual, ultimo_tipo, validacion.target)
 
     @staticmethod
     def obtener_contenido(
-        target: str, tipo: str, menu_contexto_id: Optional[str] = None
+        target: str,
+        tipo: str,
+        menu_contexto_id: Optional[str] = None,
+        obtener_menu: Optional[Callable[[str], Optional[Menu]]] = None,
     ) -> Optional[Dict]:
-        """Obtiene el contenido a mostrar"""
+        """Obtiene el contenido a mostrar.
+
+        obtener_menu permite reutilizar menus ya leidos (ContextoConversacion.menu).
+        """
         if tipo == "menu":
-            menu = GestorContenido.obtener_menu(target)
+            menu = (obtener_menu or GestorContenido.obtener_menu)(target)
             if menu:
                 return {
                     "id": menu.id,
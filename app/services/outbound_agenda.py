@@ -0,0 +1,104 @@
+"""Agenda en memoria de envios outbound diferidos (min-heap por vencimiento).
+
+La base sigue siendo la fuente de verdad: la agenda solo le dice al worker
+que ids reclamar y cuando. Lo que no llegue a la agenda (otro nodo sin
+LISTEN, caida del proceso) lo levanta el escaneo periodico de la cola.
+"""
+
+import heapq
+import threading
+import time
+
+from app.models.cola_mensaje import ColaMensaje
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class AgendaOutbound:
+    def __init__(self):
+        self._heap: list[tuple[int, int]] = []
+        self._due: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._escanear = False
+        self._activa = False
+
+    def activar(self) -> None:
+        """Solo un proceso con worker de outbound consume la agenda."""
+        self._activa = True
+
+    def desactivar(self) -> None:
+        self._activa = False
+        self.limpiar()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._due)
+
+    def agendar(self, mensaje_id: int, due_ms: int | None) -> None:
+        """Agenda (o reprograma) un mensaje; la ultima fecha gana."""
+        if not self._activa:
+            return
+        due_ms = int(due_ms or _now_ms())
+        with self._lock:
+            if self._due.get(mensaje_id) == due_ms:
+                return
+            self._due[mensaje_id] = due_ms
+            heapq.heappush(self._heap, (due_ms, mensaje_id))
+
+    def proximo(self) -> int | None:
+        """Vencimiento mas cercano agendado."""
+        with self._lock:
+            self._descartar_obsoletos()
+            return self._heap[0][0] if self._heap else None
+
+    def tomar_vencidos(self, limit: int, now_ms: int | None = None) -> list[int]:
+        """Saca de la agenda hasta limit ids ya vencidos, en orden de vencimiento."""
+        now_ms = now_ms or _now_ms()
+        ids = []
+        with self._lock:
+            while self._heap and len(ids) < limit:
+                self._descartar_obsoletos()
+                if not self._heap or self._heap[0][0] > now_ms:
+                    break
+                _, mensaje_id = heapq.heappop(self._heap)
+                del self._due[mensaje_id]
+                ids.append(mensaje_id)
+        return ids
+
+    def solicitar_escaneo(self) -> None:
+        """Pide un escaneo completo de la cola (aviso sin id, p. ej. reencolado masivo)."""
+        with self._lock:
+            self._escanear = True
+
+    def tomar_escaneo(self) -> bool:
+        with self._lock:
+            escanear, self._escanear = self._escanear, False
+            return escanear
+
+    def cargar_desde_db(self, limit: int = 1000) -> int:
+        """Carga los proximos envios en cola; se usa al arrancar el worker."""
+        filas = (
+            ColaMensaje.objects.filter(direccion="out", status="queued")
+            .order_by("due_at_ms", "mensaje_id")
+            .values_list("mensaje_id", "due_at_ms")[:limit]
+        )
+        cargados = 0
+        for mensaje_id, due_ms in filas:
+            self.agendar(mensaje_id, due_ms)
+            cargados += 1
+        return cargados
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._heap.clear()
+            self._due.clear()
+            self._escanear = False
+
+    def _descartar_obsoletos(self) -> None:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+
+agenda_outbound = AgendaOutbound()
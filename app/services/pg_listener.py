@@ -0,0 +1,109 @@
+"""Hilo que escucha un canal de Postgres (LISTEN) y se reconecta si se cae.
+
+Lo comparten el despertador de la cola, el bus de invalidacion de caches y
+el refresh del scheduler: cada uno pasa su canal y su callback. Sin psycopg
+o fuera de Postgres no se arranca nada.
+"""
+
+import logging
+import select
+import threading
+import time
+from typing import Callable, Optional
+
+from django.db import connections
+
+try:  # pragma: no cover - optional during tests
+    import psycopg
+except Exception:  # pragma: no cover
+    psycopg = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+REINTENTO_SEGUNDOS = 5
+
+
+def escuchar_canal(
+    canal: str,
+    al_notificar: Callable[[object], None],
+    nombre: str,
+    al_conectar: Optional[Callable[[], None]] = None,
+    al_caer: Optional[Callable[[], None]] = None,
+) -> Optional[threading.Thread]:
+    """Arranca el hilo que llama al_notificar(notify) por cada aviso del canal.
+
+    al_conectar corre cada vez que queda escuchando (tambien tras reconectar);
+    al_caer cuando se pierde la conexion. Retorna None si no hay listener.
+    """
+    if psycopg is None:
+        logger.warning("psycopg no disponible; no se escucha el canal %s", canal)
+        return None
+    if connections["default"].vendor != "postgresql":
+        return None
+    thread = threading.Thread(
+        target=_loop,
+        args=(canal, al_notificar, al_conectar, al_caer),
+        name=nombre,
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def _parametros_conexion() -> dict:
+    db_settings = connections.databases.get("default", {})
+    return {
+        "host": db_settings.get("HOST") or None,
+        "port": db_settings.get("PORT") or None,
+        "dbname": db_settings.get("NAME"),
+        "user": db_settings.get("USER") or None,
+        "password": db_settings.get("PASSWORD") or None,
+    }
+
+
+def _despachar(canal: str, al_notificar: Callable[[object], None], notify) -> None:
+    try:
+        al_notificar(notify)
+    except Exception:
+        logger.exception("Error procesando aviso de %s", canal)
+
+
+def _loop(
+    canal: str,
+    al_notificar: Callable[[object], None],
+    al_conectar: Optional[Callable[[], None]],
+    al_caer: Optional[Callable[[], None]],
+) -> None:
+    conn_params = _parametros_conexion()
+    while True:
+        try:
+            assert psycopg is not None
+            with psycopg.connect(**conn_params) as conn:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {canal};")
+                    logger.info("Listener esperando notificaciones en %s", canal)
+                    if al_conectar:
+                        al_conectar()
+
+                    if hasattr(conn, "poll"):
+                        while True:
+                            if select.select([conn], [], [], 60)[0]:
+                                conn.poll()
+                                while conn.notifies:
+                                    _despachar(canal, al_notificar, conn.notifies.pop(0))
+                            else:
+                                conn.poll()
+                    else:
+                        notifications = conn.notifies()
+                        while True:
+                            try:
+                                notify = next(notifications)
+                            except StopIteration:
+                                continue
+                            _despachar(canal, al_notificar, notify)
+        except Exception:
+            if al_caer:
+                al_caer()
+            logger.exception("Fallo listener de %s; reintentando en %ss", canal, REINTENTO_SEGUNDOS)
+            time.sleep(REINTENTO_SEGUNDOS)
@@ -0,0 +1,127 @@
+"""Despertador del worker de cola via Postgres LISTEN/NOTIFY."""
+
+import heapq
+import logging
+import threading
+import time
+
+from django.db import connection, transaction
+
+from app.services.outbound_agenda import agenda_outbound
+from app.services.pg_listener import escuchar_canal
+
+logger = logging.getLogger(__name__)
+QUEUE_CHANNEL = "message_queue"
+
+_cond = threading.Condition()
+_pendiente = False
+_vencimientos: list[int] = []
+_listener_thread = None
+_listener_activo = threading.Event()
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def despertar_worker(due_ms: int | None = None) -> None:
+    """Despierta al worker local ahora o cuando venza due_ms."""
+    global _pendiente
+    with _cond:
+        if due_ms is None or int(due_ms) <= _now_ms():
+            _pendiente = True
+        else:
+            heapq.heappush(_vencimientos, int(due_ms))
+        _cond.notify_all()
+
+
+def esperar_cola(timeout: float) -> bool:
+    """Bloquea hasta que haya trabajo notificado, venza un envio o pase timeout.
+
+    Retorna True si se desperto por trabajo y False si fue por timeout.
+    """
+    global _pendiente
+    deadline = time.monotonic() + max(0.0, timeout)
+    with _cond:
+        while True:
+            now_ms = _now_ms()
+            vencido = False
+            while _vencimientos and _vencimientos[0] <= now_ms:
+                heapq.heappop(_vencimientos)
+                vencido = True
+            if _pendiente or vencido:
+                _pendiente = False
+                return True
+            restante = deadline - time.monotonic()
+            if restante <= 0:
+                return False
+            if _vencimientos:
+                restante = min(restante, (_vencimientos[0] - now_ms) / 1000.0)
+            _cond.wait(restante)
+
+
+def agendar_envio(mensaje_id: int, due_ms: int | None) -> None:
+    """Agenda un envio outbound en este proceso y programa el despertar del worker."""
+    agenda_outbound.agendar(mensaje_id, due_ms)
+    despertar_worker(due_ms)
+
+
+def _aviso_local(direccion: str, due_ms: int | None, mensaje_id: int | None) -> None:
+    if direccion == "out":
+        if mensaje_id:
+            agendar_envio(mensaje_id, due_ms)
+            return
+        agenda_outbound.solicitar_escaneo()
+    despertar_worker(due_ms)
+
+
+def notificar_cola(direccion: str, due_ms: int | None = None, mensaje_id: int | None = None) -> None:
+    """Avisa que hay mensajes nuevos en la cola (in/out).
+
+    El NOTIFY de Postgres se entrega recien al confirmar la transaccion; el
+    aviso local tambien se difiere con on_commit para no despertar al worker
+    antes de que las filas sean visibles. Con mensaje_id el envio entra a la
+    agenda outbound de cada worker que escuche.
+    """
+    payload = f"{direccion}:{due_ms or ''}:{mensaje_id or ''}"
+    if connection.vendor == "postgresql":
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", [QUEUE_CHANNEL, payload])
+        except Exception:
+            logger.exception("No se pudo notificar la cola (payload=%s)", payload)
+    transaction.on_commit(lambda: _aviso_local(direccion, due_ms, mensaje_id))
+
+
+def queue_listener_activo() -> bool:
+    return _listener_activo.is_set()
+
+
+def start_queue_listener() -> None:
+    """Escucha pg_notify de la cola (si psycopg y Postgres estan disponibles)."""
+    global _listener_thread
+    if _listener_thread and _listener_thread.is_alive():
+        return
+    _listener_thread = escuchar_canal(
+        QUEUE_CHANNEL,
+        _handle_notify,
+        nombre="queue-listener",
+        al_conectar=_al_conectar,
+        al_caer=_listener_activo.clear,
+    )
+
+
+def _al_conectar() -> None:
+    _listener_activo.set()
+    # Lo encolado mientras no escuchabamos se recoge de inmediato.
+    despertar_worker()
+
+
+def _handle_notify(notify) -> None:
+    direccion, _, resto = (notify.payload or "").partition(":")
+    due, _, mensaje_id = resto.partition(":")
+    _aviso_local(
+        direccion,
+        int(due) if due.isdigit() else None,
+        int(mensaje_id) if mensaje_id.isdigit() else None,
+    )
@@ -1,31 +1,46 @@
 import logging
 import random
+import threading
 import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 
 from django.conf import settings
-from django.db import transaction, close_old_connections, models
+from django.db import connection, transaction, close_old_connections, models
 from django.db.utils import NotSupportedError
 
 from app.models.mensaje import Mensaje
-from app.models.cliente import Cliente
+from app.models.cola_mensaje import ColaMensaje
 from app.services import (
-    GestorCliente,
     GestorContenido,
     GestorMensajes,
-    GestorSesion,
     NavigadorBot,
     ValidadorEntrada,
 )
 from app.services.cliente_whatsapp import ClienteWhatsApp
+from app.services.contexto_conversacion import ContextoConversacion
+from app.services.queue_notify import agendar_envio, notificar_cola
 from app.services.interactive_builder import (
     build_menu_interactive_payloads,
     build_flow_interactive_payload,
     build_navigation_interactive_payload,
 )
-from app.services.waba_config import get_whatsapp_bool, get_whatsapp_setting
+from app.services.waba_config import (
+    get_active_waba_config,
+    get_whatsapp_bool,
+    get_whatsapp_setting,
+)
+from app.services.webhook_eventos import expandir_inbox
 
 logger = logging.getLogger(__name__)
+_outbound_executor: ThreadPoolExecutor | None = None
+_outbound_executor_size = 0
+_outbound_executor_lock = threading.Lock()
+_reclamo_lock = threading.Lock()
+# Espera antes de reintentar un envio que el rate limiter local no dejo salir.
+REINTENTO_SIN_CUPO_MS = 1000
 
 
 def _now_ms() -> int:
@@ -92,12 +107,13 @@ def _coerce_optin(value) -> bool | None:
     return None
 
 
-def _actualizar_cliente_desde_flow(phone_number: str, metadata: dict) -> list[str]:
+def _actualizar_cliente_desde_flow(contexto: ContextoConversacion, metadata: dict) -> list[str]:
     flow_data = metadata.get("flow_client_data") or {}
     if not isinstance(flow_data, dict) or not flow_data:
         return []
 
-    cliente = Cliente.objects.filter(phone_number=phone_number).first()
+    cliente = contexto.cliente
+    phone_number = contexto.phone_number
     if not cliente:
         return []
 
@@ -134,8 +150,7 @@ def _actualizar_cliente_desde_flow(phone_number: str, metadata: dict) -> list[st
         cliente.marketing_opt_in = marketing_opt_in
         updated_fields.append("marketing_opt_in")
 
-    if updated_fields:
-        cliente.save(update_fields=updated_fields + ["updated_at"])
+    contexto.marcar_cliente(*updated_fields)
     return updated_fields
 
 
@@ -163,14 +178,14 @@ def _es_comando_baja_promociones(mensaje_usuario: str, validacion) -> bool:
     return entrada_limpia == "BAJA"
 
 
-def _registrar_baja_promociones(phone_number: str) -> bool:
-    cliente = Cliente.objects.filter(phone_number=phone_number).first()
+def _registrar_baja_promociones(contexto: ContextoConversacion) -> bool:
+    cliente = contexto.cliente
     if not cliente:
         return False
     if cliente.marketing_opt_in is False:
         return False
     cliente.marketing_opt_in = False
-    cliente.save(update_fields=["marketing_opt_in", "updated_at"])
+    contexto.marcar_cliente("marketing_opt_in")
     return True
 
 
@@ -187,7 +202,17 @@ def _mensaje_baja_club_beneficios() -> str:
     )
 
 
-def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> None:
+def _procesar_mensaje_inbound(
+    mensaje_in: Mensaje, simulate: bool = False, coalescer: bool = False
+) -> None:
+    """Procesa un mensaje entrante y encola la respuesta.
+
+    Solo anota en mensaje_in.metadata_json: lo guarda el cierre del lote
+    junto con el estado final, asi el mensaje se escribe una sola vez.
+    Con coalescer=True (hay otro mensaje del mismo telefono detras en el
+    lote) una navegacion comun solo avanza el estado de la sesion, sin
+    renderizar ni encolar respuesta.
+    """
     datos = mensaje_in.metadata_json or {}
     inbound_phone_id = datos.get("phone_number_id")
     expected_phone_id = get_whatsapp_setting(
@@ -207,7 +232,6 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
             }
         )
         mensaje_in.metadata_json = datos
-        mensaje_in.save(update_fields=["metadata_json"])
         return
     phone_number = mensaje_in.phone_number
     mensaje_usuario = mensaje_in.contenido or ""
@@ -220,23 +244,20 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
     _marcar_leido_y_typing(wa_message_id, simulate=simulate)
 
     now_ms = _now_ms()
-    cliente_prev = Cliente.objects.filter(phone_number=phone_number).first()
-    prev_contact_ms = cliente_prev.ultimo_contacto_ms if cliente_prev else None
-
-    sesion, sesion_expirada = GestorSesion.obtener_o_crear_sesion(
-        phone_number, nombre_usuario
-    )
-    _, cliente_nuevo = GestorCliente.registrar_contacto(
-        phone_number, nombre_usuario, mensaje_usuario, alias_waba=alias_waba
-    )
-    flow_updated_fields = _actualizar_cliente_desde_flow(phone_number, datos)
+    contexto = ContextoConversacion(phone_number, nombre_usuario)
+    sesion, sesion_expirada = contexto.abrir_sesion()
+    _, cliente_nuevo = contexto.registrar_contacto(mensaje_usuario, alias_waba=alias_waba)
+    # Sin sesion pero con cliente: el barrido la archivo por inactividad.
+    sesion_expirada = sesion_expirada or (contexto.sesion_nueva and not cliente_nuevo)
+    prev_contact_ms = contexto.prev_contact_ms
+    flow_updated_fields = _actualizar_cliente_desde_flow(contexto, datos)
     flow_client_data_received = bool(datos.get("flow_client_data"))
 
     validacion = ValidadorEntrada.validar(mensaje_usuario)
     baja_promociones = _es_comando_baja_promociones(mensaje_usuario, validacion)
     baja_promociones_actualizada = False
     if baja_promociones:
-        baja_promociones_actualizada = _registrar_baja_promociones(phone_number)
+        baja_promociones_actualizada = _registrar_baja_promociones(contexto)
 
     if flow_client_data_received:
         estado_nuevo = "0"
@@ -276,6 +297,7 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
                 sesion.historial_navegacion,
                 sesion.estado_actual,
                 last_content_type,
+                validacion=validacion,
             )
         )
 
@@ -298,6 +320,7 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
         tipo_entrada = "valido" if es_valido else "invalido"
         accion = validacion.accion
 
+    coalescido = coalescer and tipo_entrada in ("valido", "invalido", "no_texto")
     inbound_meta = mensaje_in.metadata_json or {}
     inbound_meta.update(
         {
@@ -314,8 +337,19 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
             "marketing_opt_in_updated": baja_promociones_actualizada,
         }
     )
+    if coalescido:
+        inbound_meta["coalesced"] = True
     mensaje_in.metadata_json = inbound_meta
-    mensaje_in.save(update_fields=["metadata_json"])
+
+    if coalescido:
+        contexto.actualizar_estado(
+            estado_nuevo,
+            historial_nuevo,
+            mensaje_usuario,
+            tipo_contenido=tipo_contenido,
+        )
+        contexto.guardar()
+        return
 
     respuesta_texto = ""
     interactive_body = ""
@@ -326,7 +360,7 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
 
     if flow_client_data_received:
         confirmacion = _mensaje_confirmacion_club_beneficios()
-        contenido_menu = NavigadorBot.obtener_contenido("0", "menu")
+        contenido_menu = NavigadorBot.obtener_contenido("0", "menu", obtener_menu=contexto.menu)
         menu_texto = contenido_menu["contenido"] if contenido_menu else ""
         pre_menu_text_message = confirmacion
         menu_texto_principal = menu_texto
@@ -335,7 +369,7 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
         menu_id_for_interactive = "0"
     elif baja_promociones:
         confirmacion = _mensaje_baja_club_beneficios()
-        contenido_menu = NavigadorBot.obtener_contenido("0", "menu")
+        contenido_menu = NavigadorBot.obtener_contenido("0", "menu", obtener_menu=contexto.menu)
         menu_texto = contenido_menu["contenido"] if contenido_menu else ""
         pre_menu_text_message = confirmacion
         menu_texto_principal = menu_texto
@@ -344,7 +378,7 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
         menu_id_for_interactive = "0"
     elif cliente_nuevo:
         bienvenida = GestorContenido.obtener_config_mensaje("bienvenida") or ""
-        contenido_menu = NavigadorBot.obtener_contenido("0", "menu")
+        contenido_menu = NavigadorBot.obtener_contenido("0", "menu", obtener_menu=contexto.menu)
         menu_texto = contenido_menu["contenido"] if contenido_menu else ""
         respuesta_texto = f"{bienvenida}\n\n{menu_texto}".strip()
         interactive_body = bienvenida or "Bienvenido"
@@ -365,13 +399,13 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
             and (now_ms - int(prev_contact_ms)) >= retorno_threshold_ms
         )
         error_sesion = saludo_retorno if use_return_greeting else error_default
-        contenido_menu = NavigadorBot.obtener_contenido("0", "menu")
+        contenido_menu = NavigadorBot.obtener_contenido("0", "menu", obtener_menu=contexto.menu)
         menu_texto = contenido_menu["contenido"] if contenido_menu else ""
         respuesta_texto = f"{error_sesion}\n\n{menu_texto}".strip()
         interactive_body = error_sesion or "Sesion expirada"
         menu_id_for_interactive = "0"
     elif (not is_textual) or not mensaje_usuario:
-        contenido_menu = NavigadorBot.obtener_contenido("0", "menu")
+        contenido_menu = NavigadorBot.obtener_contenido("0", "menu", obtener_menu=contexto.menu)
         menu_texto = contenido_menu["contenido"] if contenido_menu else ""
         respuesta_texto = (
             "Solo puedo leer mensajes de texto.\n"
@@ -382,7 +416,10 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
         menu_id_for_interactive = "0"
     elif es_valido:
         contenido = NavigadorBot.obtener_contenido(
-            target, tipo_contenido, menu_contexto_id=estado_nuevo
+            target,
+            tipo_contenido,
+            menu_contexto_id=estado_nuevo,
+            obtener_menu=contexto.menu,
         )
         if contenido:
             respuesta_texto = contenido["contenido"]
@@ -402,7 +439,7 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
         entrada_limpia = validacion.entrada_limpia if validacion else ""
         es_texto_libre = bool(entrada_limpia) and not entrada_limpia.isdigit() and len(entrada_limpia) > 1
         if es_texto_libre:
-            contenido_menu = NavigadorBot.obtener_contenido("0", "menu")
+            contenido_menu = NavigadorBot.obtener_contenido("0", "menu", obtener_menu=contexto.menu)
             menu_texto = contenido_menu["contenido"] if contenido_menu else ""
             respuesta_texto = (
                 "Si queres otra informacion, elegi una opcion del menu.\n\n"
@@ -419,13 +456,13 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
             interactive_body = "Opcion no valida."
             menu_id_for_interactive = "0"
 
-    GestorSesion.actualizar_estado(
-        phone_number,
+    contexto.actualizar_estado(
         estado_nuevo,
         historial_nuevo,
         mensaje_usuario,
         tipo_contenido=tipo_contenido,
     )
+    contexto.guardar()
 
     interactive_enabled = get_whatsapp_bool(
         "interactive_enabled",
@@ -444,7 +481,7 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
         interactive_body = respuesta_texto or interactive_body
 
     if interactive_enabled and menu_id_for_interactive:
-        menu = GestorContenido.obtener_menu(menu_id_for_interactive) or GestorContenido.obtener_menu("0")
+        menu = contexto.menu(menu_id_for_interactive) or contexto.menu("0")
         if menu:
             if (not interactive_navigation_only) and flow_enabled and menu.flow_id:
                 flow_payload = build_flow_interactive_payload(
@@ -489,7 +526,7 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
         "simulated": simulate,
     }
     if menu_id_for_interactive:
-        menu_ref = GestorContenido.obtener_menu(menu_id_for_interactive) or GestorContenido.obtener_menu("0")
+        menu_ref = contexto.menu(menu_id_for_interactive) or contexto.menu("0")
         if menu_ref and menu_ref.flow_id:
             outbound_meta["flow_id"] = menu_ref.flow_id
         if menu_ref and menu_ref.flow_json and simulate:
@@ -529,190 +566,838 @@ def _procesar_mensaje_inbound(mensaje_in: Mensaje, simulate: bool = False) -> No
     )
 
 
-def procesar_inbound_pendientes(limit: int = 10, simulate: bool = False) -> int:
-    """Procesa mensajes entrantes pendientes."""
-    close_old_connections()
-    now_ms = _now_ms()
-    with transaction.atomic():
-        base_qs = (
-            Mensaje.objects.filter(
-                direccion="in",
-                queue_status="pending",
+def shard_for_phone(phone_number: str, shards: int) -> int:
+    """Shard estable (entre procesos) para una conversacion."""
+    if shards <= 1:
+        return 0
+    return zlib.crc32((phone_number or "").encode("utf-8")) % shards
+
+
+def agrupar_por_conversacion(mensajes: list) -> "OrderedDict[str, list]":
+    """Agrupa preservando el orden de llegada dentro de cada telefono."""
+    grupos: "OrderedDict[str, list]" = OrderedDict()
+    for mensaje in mensajes:
+        grupos.setdefault(mensaje.phone_number, []).append(mensaje)
+    return grupos
+
+
+def _actualizar_por_fila(queryset, clave: str, filas: list[tuple[object, dict]]) -> int:
+    """UPDATE unico con un CASE por columna; cada fila aporta sus propios valores.
+
+    Las columnas que una fila no trae conservan su valor actual.
+    """
+    filas = [(valor_clave, campos) for valor_clave, campos in filas if campos]
+    if not filas:
+        return 0
+    modelo = queryset.model
+    columnas: dict[str, list] = {}
+    for _, campos in filas:
+        for nombre in campos:
+            columnas.setdefault(nombre, [])
+    for nombre, casos in columnas.items():
+        campo = modelo._meta.get_field(nombre)
+        for valor_clave, campos in filas:
+            if nombre in campos:
+                casos.append(
+                    models.When(
+                        **{clave: valor_clave},
+                        then=models.Value(campos[nombre], output_field=campo),
+                    )
+                )
+    return queryset.filter(**{f"{clave}__in": [valor_clave for valor_clave, _ in filas]}).update(
+        **{
+            nombre: models.Case(
+                *casos,
+                default=models.F(nombre),
+                output_field=modelo._meta.get_field(nombre),
             )
-            .filter(models.Q(process_after_ms__lte=now_ms) | models.Q(process_after_ms__isnull=True))
-            .order_by("timestamp_ms", "id")
+            for nombre, casos in columnas.items()
+        }
+    )
+
+
+class RepositorioCola:
+    """Operaciones de bookkeeping de la cola sobre la tabla angosta mensajes_cola.
+
+    En Postgres el reclamo toma primero un advisory lock de transaccion
+    por telefono (LOCK_TELEFONOS_SQL) y despues reclama el lote (CTE con
+    FOR UPDATE SKIP LOCKED + UPDATE ... RETURNING unido a mensajes) solo
+    de los telefonos bloqueados. Los telefonos con un mensaje en processing
+    se descartan antes del LIMIT, para que no ocupen el lote de telefonos
+    mientras otros esperan. La segunda sentencia toma su snapshot con
+    el lock ya tomado, asi que ve el 'processing' de cualquier reclamo
+    anterior del mismo telefono; un reclamo concurrente no obtiene el lock
+    y saltea ese telefono. En otros motores se usa el camino ORM
+    equivalente, serializado (ver _reclamar_orm). Los mensajes reclamados
+    se devuelven como instancias de Mensaje con attempts, locked_at_ms,
+    process_after_ms y queue_status tomados de la fila de cola.
+
+    Al cerrar un lote las filas terminadas se borran de la cola y Mensaje
+    recibe su unica actualizacion final; las reprogramadas solo tocan la cola.
+    """
+
+    ORDEN = {"in": "timestamp_ms", "out": "process_after_ms"}
+    ESTADO_PENDIENTE = {"in": "pending", "out": "queued"}
+    # Campos de Mensaje que durante el procesamiento viven en la fila de cola.
+    CAMPOS_COLA = {
+        "queue_status": "status",
+        "process_after_ms": "due_at_ms",
+        "attempts": "attempts",
+        "locked_at_ms": "locked_at_ms",
+    }
+
+    LOCK_TELEFONOS_SQL = """
+        SELECT s.phone_number
+        FROM (
+            SELECT c.phone_number
+            FROM {cola} c
+            WHERE c.direccion = %(direccion)s
+              AND c.status = %(estado)s
+              AND (c.due_at_ms IS NULL OR c.due_at_ms <= %(now_ms)s)
+              {filtro_ids}
+              AND NOT EXISTS (
+                  SELECT 1 FROM {cola} p
+                  WHERE p.phone_number = c.phone_number
+                    AND p.direccion = %(direccion)s
+                    AND p.status = 'processing'
+              )
+            GROUP BY c.phone_number
+            ORDER BY MIN(c.due_at_ms), MIN(c.mensaje_id)
+            LIMIT %(limit)s
+        ) s
+        WHERE pg_try_advisory_xact_lock(hashtext(%(llave)s), hashtext(s.phone_number))
+    """
+
+    CLAIM_SQL = """
+        WITH candidatos AS (
+            SELECT c.id FROM {cola} c
+            WHERE c.direccion = %(direccion)s
+              AND c.status = %(estado)s
+              AND (c.due_at_ms IS NULL OR c.due_at_ms <= %(now_ms)s)
+              AND c.phone_number = ANY(%(telefonos)s)
+              {filtro_ids}
+              AND NOT EXISTS (
+                  SELECT 1 FROM {cola} p
+                  WHERE p.phone_number = c.phone_number
+                    AND p.direccion = %(direccion)s
+                    AND p.status = 'processing'
+              )
+            ORDER BY c.due_at_ms, c.mensaje_id
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        ), reclamados AS (
+            UPDATE {cola} t
+            SET status = 'processing', locked_at_ms = %(now_ms)s, attempts = t.attempts + 1
+            FROM candidatos
+            WHERE t.id = candidatos.id
+            RETURNING t.mensaje_id, t.status, t.due_at_ms, t.attempts, t.locked_at_ms
         )
-        try:
-            mensajes = list(base_qs.select_for_update(skip_locked=True)[:limit])
-        except NotSupportedError:
-            mensajes = list(base_qs[:limit])
-        if mensajes:
-            Mensaje.objects.filter(id__in=[m.id for m in mensajes]).update(
-                queue_status="processing",
+        SELECT {columnas}
+        FROM reclamados r
+        JOIN {tabla} m ON m.id = r.mensaje_id
+    """
+
+    @staticmethod
+    def reclamar(direccion: str, limit: int = 10, ids: list[int] | None = None) -> list[Mensaje]:
+        """Reclama hasta limit mensajes vencidos de direccion marcandolos como processing.
+
+        Se omiten las conversaciones que ya tienen un mensaje en processing
+        para que dos workers nunca atiendan a la vez el mismo telefono. Con
+        ids (de Mensaje) solo se consideran esos mensajes.
+        """
+        close_old_connections()
+        if limit <= 0 or ids == []:
+            return []
+        now_ms = _now_ms()
+        if connection.vendor == "postgresql":
+            mensajes = RepositorioCola._reclamar_sql(direccion, limit, now_ms, ids)
+        else:
+            mensajes = RepositorioCola._reclamar_orm(direccion, limit, now_ms, ids)
+        orden = RepositorioCola.ORDEN[direccion]
+        mensajes.sort(
+            key=lambda m: (getattr(m, orden) is None, getattr(m, orden) or 0, m.id)
+        )
+        return mensajes
+
+    @staticmethod
+    def _reclamar_sql(direccion: str, limit: int, now_ms: int, ids: list[int] | None) -> list[Mensaje]:
+        qn = connection.ops.quote_name
+        columnas = []
+        for field in Mensaje._meta.concrete_fields:
+            cola_col = RepositorioCola.CAMPOS_COLA.get(field.attname)
+            origen = f"r.{qn(cola_col)}" if cola_col else f"m.{qn(field.column)}"
+            columnas.append(f"{origen} AS {qn(field.column)}")
+        filtro_ids = "AND c.mensaje_id = ANY(%(ids)s)" if ids else ""
+        lock_sql = RepositorioCola.LOCK_TELEFONOS_SQL.format(
+            cola=qn(ColaMensaje._meta.db_table),
+            filtro_ids=filtro_ids,
+        )
+        sql = RepositorioCola.CLAIM_SQL.format(
+            cola=qn(ColaMensaje._meta.db_table),
+            tabla=qn(Mensaje._meta.db_table),
+            columnas=", ".join(columnas),
+            filtro_ids=filtro_ids,
+        )
+        params = {
+            "direccion": direccion,
+            "estado": RepositorioCola.ESTADO_PENDIENTE[direccion],
+            "now_ms": now_ms,
+            "limit": limit,
+            "ids": list(ids or []),
+            "llave": f"{ColaMensaje._meta.db_table}:{direccion}",
+        }
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(lock_sql, params)
+                telefonos = [fila[0] for fila in cursor.fetchall()]
+            if not telefonos:
+                return []
+            # Sentencia aparte: su snapshot es posterior a los locks tomados.
+            return list(Mensaje.objects.raw(sql, {**params, "telefonos": telefonos}))
+
+    @staticmethod
+    def _reclamar_orm(direccion: str, limit: int, now_ms: int, ids: list[int] | None) -> list[Mensaje]:
+        """Reclamo sin advisory locks: los reclamos se hacen de a uno.
+
+        Dentro del proceso los serializa _reclamo_lock. Entre procesos se
+        apoya en SQLite, que admite un solo escritor: una transaccion que
+        leyo antes del commit de otra falla al escribir en vez de reclamar
+        con datos viejos.
+        """
+        en_proceso = ColaMensaje.objects.filter(
+            phone_number=models.OuterRef("phone_number"),
+            direccion=direccion,
+            status="processing",
+        )
+        with _reclamo_lock, transaction.atomic():
+            base_qs = (
+                ColaMensaje.objects.filter(
+                    direccion=direccion,
+                    status=RepositorioCola.ESTADO_PENDIENTE[direccion],
+                )
+                .filter(models.Q(due_at_ms__lte=now_ms) | models.Q(due_at_ms__isnull=True))
+                .filter(~models.Exists(en_proceso))
+                .order_by("due_at_ms", "mensaje_id")
+            )
+            if ids:
+                base_qs = base_qs.filter(mensaje_id__in=ids)
+            try:
+                filas = list(base_qs.select_for_update(skip_locked=True)[:limit])
+            except NotSupportedError:
+                filas = list(base_qs[:limit])
+            if not filas:
+                return []
+            ColaMensaje.objects.filter(id__in=[fila.id for fila in filas]).update(
+                status="processing",
                 locked_at_ms=now_ms,
                 attempts=models.F("attempts") + 1,
             )
+            por_id = Mensaje.objects.in_bulk([fila.mensaje_id for fila in filas])
+        mensajes = []
+        for fila in filas:
+            mensaje = por_id[fila.mensaje_id]
+            mensaje.queue_status = "processing"
+            mensaje.process_after_ms = fila.due_at_ms
+            mensaje.attempts = fila.attempts + 1
+            mensaje.locked_at_ms = now_ms
+            mensajes.append(mensaje)
+        return mensajes
+
+    @staticmethod
+    def completar(resultados: list[tuple[Mensaje, dict]]) -> int:
+        """Cierra los mensajes reclamados cuyo lease sigue vigente.
+
+        Las filas de cola vigentes se bloquean en una consulta; despues van
+        un UPDATE para las reprogramadas, un DELETE para las terminadas y un
+        UPDATE sobre mensajes, sin importar el tamano del lote. Si el reaper
+        ya devolvio una fila a la cola (lease vencido) no se pisa su estado.
+        """
+        resultados = [(mensaje, campos) for mensaje, campos in resultados if campos]
+        if not resultados:
+            return 0
+        lease = models.Q(pk__in=[])
+        for mensaje, _ in resultados:
+            lease |= models.Q(mensaje_id=mensaje.id, locked_at_ms=mensaje.locked_at_ms)
+        with transaction.atomic():
+            vigentes = set(
+                ColaMensaje.objects.select_for_update()
+                .filter(lease, status="processing")
+                .values_list("mensaje_id", flat=True)
+            )
+            cola_filas = []
+            terminados = []
+            mensaje_filas = []
+            for mensaje, campos in resultados:
+                if mensaje.id not in vigentes:
+                    continue
+                if campos.get("queue_status") in ("pending", "queued"):
+                    cola_filas.append(
+                        (
+                            mensaje.id,
+                            {
+                                RepositorioCola.CAMPOS_COLA[nombre]: valor
+                                for nombre, valor in campos.items()
+                                if nombre in RepositorioCola.CAMPOS_COLA
+                            },
+                        )
+                    )
+                    propios = {
+                        nombre: valor
+                        for nombre, valor in campos.items()
+                        if nombre not in RepositorioCola.CAMPOS_COLA
+                    }
+                else:
+                    terminados.append(mensaje.id)
+                    propios = {"attempts": mensaje.attempts, **campos}
+                    propios.pop("locked_at_ms", None)
+                mensaje_filas.append((mensaje.id, propios))
+            _actualizar_por_fila(ColaMensaje.objects.all(), "mensaje_id", cola_filas)
+            if terminados:
+                ColaMensaje.objects.filter(mensaje_id__in=terminados).delete()
+            _actualizar_por_fila(Mensaje.objects.all(), "id", mensaje_filas)
+        if len(vigentes) < len(resultados):
+            logger.warning(
+                "Lease perdido para %s de %s mensajes; se descarta su resultado.",
+                len(resultados) - len(vigentes),
+                len(resultados),
+            )
+        return len(vigentes)
+
 
+def liberar_reclamados(mensajes: list[Mensaje]) -> int:
+    """Devuelve a la cola mensajes reclamados que no se llegaron a procesar.
+
+    No consume intento: el claim lo habia sumado y aca se descuenta.
+    """
+    return RepositorioCola.completar(
+        [
+            (
+                mensaje,
+                {
+                    "queue_status": RepositorioCola.ESTADO_PENDIENTE[mensaje.direccion],
+                    "locked_at_ms": None,
+                    "attempts": max(0, mensaje.attempts - 1),
+                },
+            )
+            for mensaje in mensajes
+        ]
+    )
+
+
+def reclamar_inbound(limit: int = 10) -> list[Mensaje]:
+    """Reclama mensajes entrantes pendientes marcandolos como processing."""
+    return RepositorioCola.reclamar("in", limit=limit)
+
+
+def procesar_lote_inbound(mensajes: list[Mensaje], simulate: bool = False) -> int:
+    """Procesa en orden mensajes ya reclamados.
+
+    Cada entrante se cierra en la misma transaccion que encola su respuesta:
+    si el worker muere a mitad del lote, el reaper solo reencola los que no
+    respondio, y si el lease ya se perdio la respuesta no se confirma.
+    Con QUEUE_INBOUND_COALESCE solo se responde al ultimo mensaje de cada
+    telefono del lote; los anteriores solo aplican su navegacion.
+    """
+    coalesce = str(getattr(settings, "QUEUE_INBOUND_COALESCE", "False")).lower() == "true"
+    ultimo_por_phone = {mensaje.phone_number: mensaje.id for mensaje in mensajes}
     procesados = 0
     for mensaje in mensajes:
         try:
-            _procesar_mensaje_inbound(mensaje, simulate=simulate)
-            Mensaje.objects.filter(id=mensaje.id).update(
-                queue_status="processed",
-                processed_at_ms=_now_ms(),
-                error=None,
-            )
+            with transaction.atomic():
+                _procesar_mensaje_inbound(
+                    mensaje,
+                    simulate=simulate,
+                    coalescer=coalesce and ultimo_por_phone[mensaje.phone_number] != mensaje.id,
+                )
+                cerrado = RepositorioCola.completar(
+                    [
+                        (
+                            mensaje,
+                            {
+                                "queue_status": "processed",
+                                "processed_at_ms": _now_ms(),
+                                "error": None,
+                                "metadata_json": mensaje.metadata_json,
+                            },
+                        )
+                    ]
+                )
+                if not cerrado:
+                    # Lease perdido: otro worker lo va a procesar; sin respuesta duplicada.
+                    transaction.set_rollback(True)
+                    continue
             procesados += 1
         except Exception as exc:
             logger.exception("Error procesando mensaje inbound %s", mensaje.id)
-            Mensaje.objects.filter(id=mensaje.id).update(
-                queue_status="failed",
-                error=str(exc),
-                processed_at_ms=_now_ms(),
+            RepositorioCola.completar(
+                [
+                    (
+                        mensaje,
+                        {
+                            "queue_status": "failed",
+                            "error": str(exc),
+                            "processed_at_ms": _now_ms(),
+                            "metadata_json": mensaje.metadata_json,
+                        },
+                    )
+                ]
             )
     return procesados
 
 
-def procesar_outbound_pendientes(limit: int = 10) -> int:
-    """Envia mensajes salientes en cola."""
-    close_old_connections()
+def procesar_inbound_pendientes(limit: int = 10, simulate: bool = False) -> int:
+    """Procesa mensajes entrantes pendientes."""
+    mensajes = reclamar_inbound(limit=limit)
+    return procesar_lote_inbound(mensajes, simulate=simulate)
+
+
+def reclamar_outbound(limit: int = 10, ids: list[int] | None = None) -> list[Mensaje]:
+    """Reclama mensajes salientes vencidos marcandolos como processing.
+
+    Con ids (vencimientos de la agenda) los que no se pudieron reclamar y
+    siguen en cola, por ejemplo porque el telefono tiene un envio en curso
+    en otro worker, vuelven a la agenda un poco mas tarde.
+    """
+    mensajes = RepositorioCola.reclamar("out", limit=limit, ids=ids)
+    if ids:
+        faltantes = set(ids) - {mensaje.id for mensaje in mensajes}
+        if faltantes:
+            reintento_ms = _now_ms() + 1000
+            for mensaje_id, due_ms in ColaMensaje.objects.filter(
+                mensaje_id__in=faltantes, status="queued"
+            ).values_list("mensaje_id", "due_at_ms"):
+                agendar_envio(mensaje_id, max(int(due_ms or 0), reintento_ms))
+    return mensajes
+
+
+def _backoff_ms(attempts: int) -> int:
+    """Espera exponencial con jitter para el reintento numero attempts."""
+    base_ms = int(getattr(settings, "OUTBOUND_RETRY_BASE_MS", 2000))
+    max_ms = int(getattr(settings, "OUTBOUND_RETRY_MAX_MS", 60000))
+    delay_ms = min(max_ms, base_ms * (2 ** max(0, attempts - 1)))
+    return delay_ms // 2 + random.randint(0, delay_ms // 2)
+
+
+def _inicio_envio_ms(mensaje: Mensaje, now_ms: int) -> int:
+    """Desde cuando cuenta OUTBOUND_MAX_AGE_SECONDS: creacion o reencolado manual."""
+    reencolado_ms = (mensaje.metadata_json or {}).get("reencolado_ms")
+    return int(reencolado_ms or mensaje.timestamp_ms or now_ms)
+
+
+def _programar_reintento(mensaje: Mensaje, error: str | None) -> dict:
+    """Reprograma un envio con fallo transitorio o lo pasa a dead si no hay margen.
+
+    Se descarta al agotar QUEUE_MAX_ATTEMPTS o si el proximo intento caeria
+    fuera de OUTBOUND_MAX_AGE_SECONDS.
+    """
     now_ms = _now_ms()
+    max_attempts = int(getattr(settings, "QUEUE_MAX_ATTEMPTS", 5))
     max_age_seconds = int(getattr(settings, "OUTBOUND_MAX_AGE_SECONDS", 900))
-    drop_if_newer = str(getattr(settings, "OUTBOUND_DROP_IF_NEWER_INBOUND", "True")).lower() == "true"
-    with transaction.atomic():
-        base_qs = (
-            Mensaje.objects.filter(
-                direccion="out",
-                queue_status="queued",
+    due_ms = now_ms + _backoff_ms(mensaje.attempts)
+    vencido = max_age_seconds > 0 and (
+        due_ms - _inicio_envio_ms(mensaje, now_ms) > max_age_seconds * 1000
+    )
+    if mensaje.attempts >= max_attempts or vencido:
+        return {"queue_status": "dead", "error": error, "processed_at_ms": now_ms}
+    return {
+        "queue_status": "queued",
+        "error": error,
+        "process_after_ms": due_ms,
+        "locked_at_ms": None,
+    }
+
+
+def _reprogramar_sin_cupo(mensaje: Mensaje) -> dict:
+    """Sin cupo del rate limiter no hubo llamada a Graph: se reprograma sin gastar intento."""
+    return {
+        "queue_status": "queued",
+        "locked_at_ms": None,
+        "attempts": max(0, mensaje.attempts - 1),
+        "process_after_ms": _now_ms() + REINTENTO_SIN_CUPO_MS,
+    }
+
+
+def _clase_envio(mensaje: Mensaje) -> str:
+    """Bucket del rate limiter: "campaign" si el saliente lo marca asi, si no "reply"."""
+    if (mensaje.metadata_json or {}).get("clase_envio") == "campaign":
+        return "campaign"
+    return "reply"
+
+
+def _resultado_fallido(mensaje: Mensaje, resultado: dict) -> dict:
+    error = resultado.get("error") or resultado.get("response")
+    if ClienteWhatsApp.sin_cupo(resultado):
+        return _reprogramar_sin_cupo(mensaje)
+    if ClienteWhatsApp.es_reintentable(resultado):
+        return _programar_reintento(mensaje, error)
+    return {"queue_status": "failed", "error": error, "processed_at_ms": _now_ms()}
+
+
+def _enviar_mensaje_outbound(mensaje: Mensaje) -> tuple[dict, bool]:
+    """Envia un mensaje a la Graph API y retorna (campos a actualizar, enviado)."""
+    clase = _clase_envio(mensaje)
+    if mensaje.tipo == "interactive":
+        meta = mensaje.metadata_json or {}
+        payloads = meta.get("interactive_payloads")
+        if not payloads:
+            single = meta.get("interactive_payload")
+            payloads = [single] if single else []
+        fallback_text = meta.get("interactive_fallback") or mensaje.contenido or ""
+        # En un reintento se retoma desde el primer payload que no salio.
+        inicio = int(meta.get("interactive_next_index") or 0)
+        sent_count = int(meta.get("interactive_sent_count") or 0)
+        ok = not meta.get("interactive_force_fallback")
+        message_id = None
+        interactive_error = meta.get("interactive_error")
+        resultado = None
+        pendientes = payloads[inicio:] if ok else []
+        for idx, payload in enumerate(pendientes, start=inicio):
+            if not payload:
+                continue
+            resultado = ClienteWhatsApp.enviar_interactive_con_resultado(
+                mensaje.phone_number, payload, clase=clase
             )
-            .filter(models.Q(process_after_ms__lte=now_ms) | models.Q(process_after_ms__isnull=True))
-            .order_by("process_after_ms", "id")
-        )
+            if not resultado.get("ok", False):
+                ok = False
+                interactive_error = resultado.get("error") or resultado.get("response")
+                meta["interactive_next_index"] = idx
+                break
+            sent_count += 1
+            message_id = resultado.get("message_id") or message_id
+        update_fields = {
+            "processed_at_ms": _now_ms(),
+            "error": None,
+        }
+        enviado = False
+        if ok:
+            update_fields["queue_status"] = "sent"
+            update_fields["delivery_status"] = "sent"
+            update_fields["wa_message_id"] = message_id or mensaje.wa_message_id
+            meta["sent_via"] = "interactive"
+            meta["interactive_sent_count"] = sent_count
+            enviado = True
+        elif ClienteWhatsApp.sin_cupo(resultado):
+            update_fields = _reprogramar_sin_cupo(mensaje)
+            if message_id:
+                update_fields["wa_message_id"] = message_id
+            meta["interactive_sent_count"] = sent_count
+        elif ClienteWhatsApp.es_reintentable(resultado):
+            update_fields = _programar_reintento(mensaje, interactive_error)
+            if message_id:
+                update_fields["wa_message_id"] = message_id
+            meta["interactive_sent_count"] = sent_count
+            meta["interactive_error"] = interactive_error
+        else:
+            meta["interactive_force_fallback"] = True
+            fallback_result = ClienteWhatsApp.enviar_mensaje_con_resultado(
+                mensaje.phone_number, fallback_text, clase=clase
+            )
+            if fallback_result.get("ok", False):
+                update_fields["queue_status"] = "sent"
+                update_fields["delivery_status"] = "sent"
+                update_fields["wa_message_id"] = (
+                    fallback_result.get("message_id") or mensaje.wa_message_id
+                )
+                meta["sent_via"] = "fallback_text"
+                meta["interactive_error"] = interactive_error
+                enviado = True
+            else:
+                update_fields = _resultado_fallido(mensaje, fallback_result)
+                meta["interactive_error"] = interactive_error
+        update_fields["metadata_json"] = meta
+        return update_fields, enviado
+
+    resultado = ClienteWhatsApp.enviar_mensaje_con_resultado(
+        mensaje.phone_number, mensaje.contenido or "", clase=clase
+    )
+    ok = resultado.get("ok", False)
+    message_id = resultado.get("message_id")
+    if not ok:
+        return _resultado_fallido(mensaje, resultado), False
+    update_fields = {
+        "processed_at_ms": _now_ms(),
+        "error": None,
+        "queue_status": "sent",
+        "delivery_status": "sent",
+        "wa_message_id": message_id or mensaje.wa_message_id,
+    }
+    return update_fields, ok
+
+
+def _enviar_grupo_outbound(mensajes: list[Mensaje]) -> list[tuple[Mensaje, dict, bool]]:
+    """Envia en orden estricto los mensajes de un mismo destinatario.
+
+    Si un envio queda reprogramado, los siguientes vuelven a la cola detras
+    de el sin consumir intento, para no adelantarse al reintento.
+    """
+    resultados = []
+    reintento_ms = None
+    for mensaje in mensajes:
+        if reintento_ms is not None:
+            update_fields = {
+                "queue_status": "queued",
+                "locked_at_ms": None,
+                "attempts": mensaje.attempts - 1,
+                "process_after_ms": max(reintento_ms, int(mensaje.process_after_ms or 0)),
+            }
+            resultados.append((mensaje, update_fields, False))
+            continue
         try:
-            mensajes = list(base_qs.select_for_update(skip_locked=True)[:limit])
-        except NotSupportedError:
-            mensajes = list(base_qs[:limit])
-        if mensajes:
-            Mensaje.objects.filter(id__in=[m.id for m in mensajes]).update(
-                queue_status="processing",
-                locked_at_ms=now_ms,
-                attempts=models.F("attempts") + 1,
+            update_fields, enviado = _enviar_mensaje_outbound(mensaje)
+        except Exception as exc:
+            logger.exception("Error enviando mensaje outbound %s", mensaje.id)
+            update_fields = {
+                "queue_status": "failed",
+                "error": str(exc),
+                "processed_at_ms": _now_ms(),
+            }
+            enviado = False
+        if update_fields.get("queue_status") == "queued":
+            reintento_ms = update_fields["process_after_ms"]
+        resultados.append((mensaje, update_fields, enviado))
+    return resultados
+
+
+def _enviar_grupo_outbound_en_hilo(mensajes: list[Mensaje]) -> list[tuple[Mensaje, dict, bool]]:
+    try:
+        return _enviar_grupo_outbound(mensajes)
+    finally:
+        close_old_connections()
+
+
+def _get_outbound_executor(max_workers: int) -> ThreadPoolExecutor:
+    global _outbound_executor, _outbound_executor_size
+    with _outbound_executor_lock:
+        if _outbound_executor is None or _outbound_executor_size != max_workers:
+            if _outbound_executor is not None:
+                _outbound_executor.shutdown(wait=False)
+            _outbound_executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix="queue-outbound",
             )
+            _outbound_executor_size = max_workers
+        return _outbound_executor
 
-    enviados = 0
+
+def _despachar_outbound(
+    mensajes: list[Mensaje], concurrency: int | None = None
+) -> list[tuple[Mensaje, dict, bool]]:
+    """Envia a varios destinatarios en paralelo respetando el orden de cada uno.
+
+    Cada telefono es una unica tarea secuencial; OUTBOUND_MAX_CONCURRENCY
+    limita cuantas tareas (y por lo tanto requests a Graph) corren a la vez.
+    """
+    grupos = agrupar_por_conversacion(mensajes)
+    concurrency = int(concurrency or getattr(settings, "OUTBOUND_MAX_CONCURRENCY", 8))
+    if concurrency <= 1 or len(grupos) <= 1:
+        resultados = []
+        for grupo in grupos.values():
+            resultados.extend(_enviar_grupo_outbound(grupo))
+        return resultados
+
+    # Precalienta el cache de WabaConfig para que los hilos no consulten la BD.
+    get_active_waba_config()
+    executor = _get_outbound_executor(concurrency)
+    futures = [
+        executor.submit(_enviar_grupo_outbound_en_hilo, grupo)
+        for grupo in grupos.values()
+    ]
+    resultados = []
+    for future in futures:
+        resultados.extend(future.result())
+    return resultados
+
+
+def _respuesta_ts(mensaje: Mensaje) -> int | None:
+    """Timestamp del inbound al que responde un mensaje saliente, si lo tiene."""
+    meta = mensaje.metadata_json or {}
+    respuesta_ts = meta.get("respuesta_a_ts_ms") or meta.get("respuesta_a_ts")
+    return int(respuesta_ts) if respuesta_ts else None
+
+
+def ultimos_inbound_por_telefono(phone_numbers) -> dict[str, int]:
+    """Ultimo timestamp_ms entrante de cada telefono, en una sola consulta agrupada."""
+    if not phone_numbers:
+        return {}
+    filas = (
+        Mensaje.objects.filter(direccion="in", phone_number__in=list(phone_numbers))
+        .order_by()
+        .values("phone_number")
+        .annotate(ultimo_ts=models.Max("timestamp_ms"))
+    )
+    return {fila["phone_number"]: fila["ultimo_ts"] for fila in filas}
+
+
+def procesar_outbound_pendientes(
+    limit: int = 10, concurrency: int | None = None, ids: list[int] | None = None
+) -> int:
+    """Envia mensajes salientes en cola (o solo los ids indicados, si vencieron)."""
+    mensajes = reclamar_outbound(limit=limit, ids=ids)
+    if not mensajes:
+        return 0
+    now_ms = _now_ms()
+    max_age_seconds = int(getattr(settings, "OUTBOUND_MAX_AGE_SECONDS", 900))
+    drop_if_newer = str(getattr(settings, "OUTBOUND_DROP_IF_NEWER_INBOUND", "True")).lower() == "true"
+
+    ultimos_inbound = {}
+    if drop_if_newer:
+        ultimos_inbound = ultimos_inbound_por_telefono(
+            {m.phone_number for m in mensajes if _respuesta_ts(m)}
+        )
+
+    resultados = []
+    a_enviar = []
     for mensaje in mensajes:
         try:
             if max_age_seconds > 0:
-                age_ms = now_ms - int(mensaje.timestamp_ms or now_ms)
+                age_ms = now_ms - _inicio_envio_ms(mensaje, now_ms)
                 if age_ms > (max_age_seconds * 1000):
-                    Mensaje.objects.filter(id=mensaje.id).update(
-                        queue_status="failed",
-                        error="expired_outbound",
-                        processed_at_ms=_now_ms(),
+                    resultados.append(
+                        (mensaje, {"queue_status": "failed", "error": "expired_outbound", "processed_at_ms": now_ms})
                     )
                     continue
 
             if drop_if_newer:
-                meta = mensaje.metadata_json or {}
-                respuesta_ts = meta.get("respuesta_a_ts_ms") or meta.get("respuesta_a_ts")
+                respuesta_ts = _respuesta_ts(mensaje)
                 if respuesta_ts:
-                    newer_inbound = Mensaje.objects.filter(
-                        phone_number=mensaje.phone_number,
-                        direccion="in",
-                        timestamp_ms__gt=int(respuesta_ts),
-                    ).exists()
-                    if newer_inbound:
-                        Mensaje.objects.filter(id=mensaje.id).update(
-                            queue_status="failed",
-                            error="superseded_by_newer_inbound",
-                            processed_at_ms=_now_ms(),
+                    ultimo_inbound = ultimos_inbound.get(mensaje.phone_number)
+                    if ultimo_inbound is not None and ultimo_inbound > respuesta_ts:
+                        resultados.append(
+                            (
+                                mensaje,
+                                {
+                                    "queue_status": "failed",
+                                    "error": "superseded_by_newer_inbound",
+                                    "processed_at_ms": now_ms,
+                                },
+                            )
                         )
                         continue
-
-            if mensaje.tipo == "interactive":
-                meta = mensaje.metadata_json or {}
-                payloads = meta.get("interactive_payloads")
-                if not payloads:
-                    single = meta.get("interactive_payload")
-                    payloads = [single] if single else []
-                fallback_text = meta.get("interactive_fallback") or mensaje.contenido or ""
-                ok = True
-                message_id = None
-                sent_count = 0
-                interactive_error = None
-                for payload in payloads:
-                    if not payload:
-                        continue
-                    resultado = ClienteWhatsApp.enviar_interactive_con_resultado(
-                        mensaje.phone_number, payload
-                    )
-                    if not resultado.get("ok", False):
-                        ok = False
-                        interactive_error = resultado.get("error") or resultado.get("response")
-                        break
-                    sent_count += 1
-                    message_id = resultado.get("message_id") or message_id
-                update_fields = {
-                    "processed_at_ms": _now_ms(),
-                    "error": None,
-                }
-                if ok:
-                    update_fields["queue_status"] = "sent"
-                    update_fields["delivery_status"] = "sent"
-                    update_fields["wa_message_id"] = message_id or mensaje.wa_message_id
-                    meta["sent_via"] = "interactive"
-                    meta["interactive_sent_count"] = sent_count
-                    enviados += 1
-                else:
-                    fallback_result = ClienteWhatsApp.enviar_mensaje_con_resultado(
-                        mensaje.phone_number, fallback_text
-                    )
-                    if fallback_result.get("ok", False):
-                        update_fields["queue_status"] = "sent"
-                        update_fields["delivery_status"] = "sent"
-                        update_fields["wa_message_id"] = (
-                            fallback_result.get("message_id") or mensaje.wa_message_id
-                        )
-                        meta["sent_via"] = "fallback_text"
-                        meta["interactive_error"] = interactive_error
-                        enviados += 1
-                    else:
-                        update_fields["queue_status"] = "failed"
-                        update_fields["error"] = fallback_result.get("error") or fallback_result.get("response")
-                        meta["interactive_error"] = interactive_error
-                update_fields["metadata_json"] = meta
-                Mensaje.objects.filter(id=mensaje.id).update(**update_fields)
-            else:
-                resultado = ClienteWhatsApp.enviar_mensaje_con_resultado(
-                    mensaje.phone_number, mensaje.contenido or ""
-                )
-                ok = resultado.get("ok", False)
-                message_id = resultado.get("message_id")
-                update_fields = {
-                    "processed_at_ms": _now_ms(),
-                    "error": None,
-                }
-                if ok:
-                    update_fields["queue_status"] = "sent"
-                    update_fields["delivery_status"] = "sent"
-                    update_fields["wa_message_id"] = message_id or mensaje.wa_message_id
-                    enviados += 1
-                else:
-                    update_fields["queue_status"] = "failed"
-                    update_fields["error"] = resultado.get("error") or resultado.get("response")
-                Mensaje.objects.filter(id=mensaje.id).update(**update_fields)
+            a_enviar.append(mensaje)
         except Exception as exc:
             logger.exception("Error enviando mensaje outbound %s", mensaje.id)
-            Mensaje.objects.filter(id=mensaje.id).update(
-                queue_status="failed",
-                error=str(exc),
-                processed_at_ms=_now_ms(),
+            resultados.append(
+                (mensaje, {"queue_status": "failed", "error": str(exc), "processed_at_ms": now_ms})
             )
+
+    enviados = 0
+    reintentos = []
+    for mensaje, update_fields, enviado in _despachar_outbound(a_enviar, concurrency=concurrency):
+        resultados.append((mensaje, update_fields))
+        if update_fields.get("queue_status") == "queued":
+            reintentos.append((mensaje.id, update_fields["process_after_ms"]))
+        if enviado:
+            enviados += 1
+    RepositorioCola.completar(resultados)
+    for mensaje_id, due_ms in reintentos:
+        agendar_envio(mensaje_id, due_ms)
     return enviados
 
 
+def recuperar_leases_vencidos(now_ms: int | None = None) -> dict:
+    """Devuelve a la cola (o descarta) mensajes con lease de processing vencido.
+
+    Un mensaje reclamado tiene QUEUE_VISIBILITY_TIMEOUT_SECONDS para
+    terminar; pasado ese plazo se asume que el worker murio. Si todavia le
+    quedan intentos vuelve a pending/queued, si no pasa a dead.
+    """
+    now_ms = now_ms or _now_ms()
+    timeout_ms = int(getattr(settings, "QUEUE_VISIBILITY_TIMEOUT_SECONDS", 300)) * 1000
+    max_attempts = int(getattr(settings, "QUEUE_MAX_ATTEMPTS", 5))
+    vencidos = ColaMensaje.objects.filter(status="processing").filter(
+        models.Q(locked_at_ms__lt=now_ms - timeout_ms) | models.Q(locked_at_ms__isnull=True)
+    )
+    with transaction.atomic():
+        agotados = list(
+            vencidos.filter(attempts__gte=max_attempts)
+            .select_for_update()
+            .values_list("mensaje_id", "attempts")
+        )
+        if agotados:
+            _actualizar_por_fila(
+                Mensaje.objects.all(),
+                "id",
+                [
+                    (
+                        mensaje_id,
+                        {
+                            "queue_status": "dead",
+                            "error": "lease_expired",
+                            "attempts": attempts,
+                            "processed_at_ms": now_ms,
+                        },
+                    )
+                    for mensaje_id, attempts in agotados
+                ],
+            )
+            ColaMensaje.objects.filter(mensaje_id__in=[m for m, _ in agotados]).delete()
+        reencolados = vencidos.update(
+            status=models.Case(
+                models.When(direccion="in", then=models.Value("pending")),
+                default=models.Value("queued"),
+            ),
+            locked_at_ms=None,
+        )
+    descartados = len(agotados)
+    if reencolados or descartados:
+        logger.warning(
+            "Leases vencidos: %s reencolados, %s descartados.", reencolados, descartados
+        )
+    return {"reencolados": reencolados, "descartados": descartados}
+
+
+def reencolar_descartados(queryset) -> int:
+    """Devuelve a la cola los mensajes dead del queryset con intentos en cero.
+
+    En los salientes la edad maxima vuelve a contar desde ahora; si no, un
+    envio viejo se descartaria como expired_outbound sin intentarse.
+    """
+    now_ms = _now_ms()
+    muertos = list(queryset.filter(queue_status="dead").exclude(direccion="system"))
+    if not muertos:
+        return 0
+    with transaction.atomic():
+        Mensaje.objects.filter(id__in=[m.id for m in muertos]).update(
+            queue_status=models.Case(
+                models.When(direccion="in", then=models.Value("pending")),
+                default=models.Value("queued"),
+            ),
+            attempts=0,
+            error=None,
+            locked_at_ms=None,
+            processed_at_ms=None,
+            process_after_ms=now_ms,
+        )
+        _actualizar_por_fila(
+            Mensaje.objects.all(),
+            "id",
+            [
+                (mensaje.id, {"metadata_json": {**(mensaje.metadata_json or {}), "reencolado_ms": now_ms}})
+                for mensaje in muertos
+                if mensaje.direccion == "out"
+            ],
+        )
+        ColaMensaje.objects.bulk_create(
+            [
+                ColaMensaje(
+                    mensaje_id=mensaje.id,
+                    direccion=mensaje.direccion,
+                    phone_number=mensaje.phone_number,
+                    status=RepositorioCola.ESTADO_PENDIENTE[mensaje.direccion],
+                    due_at_ms=ColaMensaje.vencimiento(mensaje, now_ms),
+                )
+                for mensaje in muertos
+            ],
+            ignore_conflicts=True,
+        )
+    notificar_cola("in")
+    notificar_cola("out")
+    return len(muertos)
+
+
 def procesar_cola(limit: int = 10) -> dict:
     """Procesa colas inbound y outbound."""
+    expandir_inbox(limit=limit)
     procesados_in = procesar_inbound_pendientes(limit=limit, simulate=False)
     procesados_out = procesar_outbound_pendientes(limit=limit)
     return {"inbound": procesados_in, "outbound": procesados_out}
@@ -741,6 +1426,7 @@ def simular_mensaje(
         queue_status="processed",
         processed_at_ms=_now_ms(),
         error=None,
+        metadata_json=mensaje_in.metadata_json,
     )
     respuesta = (
         Mensaje.objects.filter(
@@ -1,42 +1,303 @@
 import logging
+import queue
 import threading
 import time
+from typing import Callable
 
 from django.conf import settings
 from django.db import close_old_connections
 
-from app.services.queue_processor import procesar_cola
+from app.services.outbound_agenda import agenda_outbound
+from app.services.queue_notify import (
+    despertar_worker,
+    esperar_cola,
+    queue_listener_activo,
+    start_queue_listener,
+)
+from app.services.queue_processor import (
+    agrupar_por_conversacion,
+    liberar_reclamados,
+    procesar_lote_inbound,
+    procesar_outbound_pendientes,
+    reclamar_inbound,
+    recuperar_leases_vencidos,
+    shard_for_phone,
+)
+from app.services.repositorio_contenido import precargar_contenido
+from app.services.sesion_store import (
+    activar_sesion_store,
+    desactivar_sesion_store,
+    get_sesion_store,
+)
+from app.services.webhook_eventos import expandir_inbox
 
 logger = logging.getLogger(__name__)
 _worker_thread = None
-_stop_event = threading.Event()
 
 
-def _worker_loop():
-    interval = float(getattr(settings, "QUEUE_POLL_INTERVAL_SECONDS", 1.0))
-    batch = int(getattr(settings, "QUEUE_BATCH_SIZE", 10))
-    while not _stop_event.is_set():
+class ShardedWorkerPool:
+    """Pool de hilos donde cada shard lo atiende siempre el mismo hilo.
+
+    Los lotes se encolan por clave (telefono); todas las tareas de un mismo
+    shard caen en la cola FIFO del mismo hilo, por lo que una conversacion se
+    procesa en orden mientras que conversaciones distintas corren en paralelo.
+
+    Con capacidad, el hilo que baja pending por debajo de ese tope despierta
+    al loop de la cola (que dejo de reclamar por tener el pool lleno).
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        shards: int | None = None,
+        name: str = "queue-shard",
+        capacidad: int = 0,
+    ):
+        self.workers = max(1, int(workers))
+        self.shards = max(self.workers, int(shards or self.workers))
+        self.name = name
+        self.capacidad = max(0, int(capacidad))
+        self._queues: list[queue.Queue] = [queue.Queue() for _ in range(self.workers)]
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Condition()
+        self._pending = 0
+        self._liberar: Callable[[list], object] | None = None
+
+    @property
+    def pending(self) -> int:
+        """Cantidad de items encolados o en curso."""
+        with self._lock:
+            return self._pending
+
+    def worker_for(self, key: str) -> int:
+        return shard_for_phone(key, self.shards) % self.workers
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        for idx, cola in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._run,
+                args=(idx, cola),
+                name=f"{self.name}-{idx}",
+                daemon=True,
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def submit(self, key: str, fn: Callable[[list], object], items: list) -> None:
+        """Encola fn(items) en el hilo duenio del shard de key."""
+        if not items:
+            return
+        with self._lock:
+            self._pending += len(items)
+        self._queues[self.worker_for(key)].put((fn, items))
+
+    def en_cada_hilo(self, fn: Callable[[int], object]) -> None:
+        """Encola fn(indice del hilo) en cada hilo, detras de lo que ya tiene."""
+        for cola in self._queues:
+            cola.put((fn, None))
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        with self._lock:
+            return self._lock.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def drain(self, liberar: Callable[[list], object]) -> None:
+        """Lo que ya esta corriendo termina; lo encolado se entrega a liberar(items)."""
+        self._liberar = liberar
+
+    def stop(self, wait: bool = True) -> None:
+        for cola in self._queues:
+            cola.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def _run(self, idx: int, cola: queue.Queue) -> None:
+        while True:
+            item = cola.get()
+            if item is None:
+                break
+            fn, items = item
+            if items is None:
+                # Tarea del hilo (flush de sesiones): no cuenta en pending.
+                try:
+                    fn(idx)
+                except Exception:
+                    logger.exception("Error en %s", threading.current_thread().name)
+                continue
+            try:
+                close_old_connections()
+                (self._liberar or fn)(items)
+            except Exception:
+                logger.exception("Error en %s", threading.current_thread().name)
+            finally:
+                close_old_connections()
+                with self._lock:
+                    lleno = self.capacidad and self._pending >= self.capacidad
+                    self._pending -= len(items)
+                    libera = lleno and self._pending < self.capacidad
+                    self._lock.notify_all()
+                if libera:
+                    despertar_worker()
+
+
+def _poll_interval() -> float:
+    """Con LISTEN activo el polling queda solo como respaldo lento."""
+    if queue_listener_activo():
+        return float(getattr(settings, "QUEUE_FALLBACK_POLL_SECONDS", 30.0))
+    return float(getattr(settings, "QUEUE_POLL_INTERVAL_SECONDS", 1.0))
+
+
+class QueueWorker:
+    """Loop de la cola: reclama inbound hacia el pool y envia outbound.
+
+    Corre tanto como hilo dentro del proceso web (start_queue_worker) como
+    en primer plano desde `manage.py run_queue_worker`.
+    """
+
+    def __init__(
+        self,
+        inbound: bool = True,
+        outbound: bool = True,
+        concurrency: int | None = None,
+        batch_size: int | None = None,
+    ):
+        self.inbound = inbound
+        self.outbound = outbound
+        self.batch = int(batch_size or getattr(settings, "QUEUE_BATCH_SIZE", 10))
+        self.workers = int(concurrency or getattr(settings, "QUEUE_INBOUND_WORKERS", 4))
+        self.outbound_concurrency = int(
+            concurrency or getattr(settings, "OUTBOUND_MAX_CONCURRENCY", 8)
+        )
+        self.stop_event = threading.Event()
+        self._proximo_escaneo = 0.0
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        despertar_worker()
+
+    def run(self) -> None:
+        shards = int(getattr(settings, "QUEUE_INBOUND_SHARDS", 16))
+        pool = ShardedWorkerPool(
+            self.workers, shards, name="queue-inbound", capacidad=max(1, self.workers) * self.batch
+        )
+        if self.inbound and activar_sesion_store() is None:
+            self.inbound = False
+        if self.inbound:
+            try:
+                precargar_contenido()
+            except Exception:
+                logger.exception("No se pudo precargar el contenido; se carga con el primer mensaje.")
+            pool.start()
+        if self.outbound:
+            self._cargar_agenda()
+        capacidad = pool.capacidad
+        reaper_interval = float(getattr(settings, "QUEUE_REAPER_INTERVAL_SECONDS", 30))
+        proximo_reaper = 0.0
+        while not self.stop_event.is_set():
+            lote_completo = False
+            try:
+                close_old_connections()
+                if reaper_interval > 0 and time.monotonic() >= proximo_reaper:
+                    recuperar_leases_vencidos()
+                    proximo_reaper = time.monotonic() + reaper_interval
+                if self.inbound:
+                    # Los webhooks guardados en modo fast-ack pasan a ser Mensaje.
+                    expandir_inbox()
+                libres = capacidad - pool.pending
+                if self.inbound and libres > 0:
+                    limite = min(self.batch, libres)
+                    mensajes = reclamar_inbound(limit=limite)
+                    for phone_number, grupo in agrupar_por_conversacion(mensajes).items():
+                        pool.submit(phone_number, procesar_lote_inbound, grupo)
+                    lote_completo = len(mensajes) == limite
+                    self._programar_flush(pool)
+                if self.outbound:
+                    self._procesar_outbound()
+            except Exception:
+                logger.exception("Error en worker de cola.")
+            if not lote_completo and not self.stop_event.is_set():
+                esperar_cola(_poll_interval())
+        self._drenar(pool)
+
+    @staticmethod
+    def _programar_flush(pool: ShardedWorkerPool) -> None:
+        """Cada hilo escribe las sesiones de sus telefonos, entre sus lotes."""
+        store = get_sesion_store()
+        if not store.flush_pendiente():
+            return
+        store.marcar_flush()
+        pool.en_cada_hilo(
+            lambda idx: store.flush(solo=lambda phone: pool.worker_for(phone) == idx)
+        )
+
+    def _cargar_agenda(self) -> None:
+        agenda_outbound.activar()
         try:
-            close_old_connections()
-            procesar_cola(limit=batch)
+            cargados = agenda_outbound.cargar_desde_db(
+                limit=int(getattr(settings, "QUEUE_AGENDA_PRELOAD", 1000))
+            )
         except Exception:
-            logger.exception("Error en worker de cola.")
-        _stop_event.wait(interval)
+            logger.exception("No se pudo precargar la agenda outbound.")
+            return
+        proximo = agenda_outbound.proximo()
+        if proximo is not None:
+            despertar_worker(proximo)
+        logger.info("Agenda outbound precargada con %s envios.", cargados)
+
+    def _procesar_outbound(self) -> None:
+        """Envia lo vencido de la agenda y escanea la cola como respaldo.
+
+        Sin LISTEN activo otros procesos no pueden avisar sus ids, asi que el
+        escaneo corre en cada vuelta; con LISTEN solo cada
+        QUEUE_FALLBACK_POLL_SECONDS o cuando llega un aviso sin id.
+        """
+        ids = agenda_outbound.tomar_vencidos(limit=self.batch)
+        if ids:
+            procesar_outbound_pendientes(
+                limit=len(ids), concurrency=self.outbound_concurrency, ids=ids
+            )
+        escanear = agenda_outbound.tomar_escaneo() or not queue_listener_activo()
+        if escanear or time.monotonic() >= self._proximo_escaneo:
+            procesar_outbound_pendientes(limit=self.batch, concurrency=self.outbound_concurrency)
+            self._proximo_escaneo = time.monotonic() + float(
+                getattr(settings, "QUEUE_FALLBACK_POLL_SECONDS", 30.0)
+            )
+
+    def _drenar(self, pool: ShardedWorkerPool) -> None:
+        """Termina lo que esta en curso y devuelve a la cola lo reclamado sin empezar."""
+        if pool.pending:
+            logger.info("Drenando worker de cola: %s mensajes en vuelo.", pool.pending)
+        pool.drain(liberar_reclamados)
+        pool.stop(wait=True)
+        if self.inbound:
+            desactivar_sesion_store()
+        if self.outbound:
+            agenda_outbound.desactivar()
+        close_old_connections()
+        logger.info("Worker de cola detenido.")
+
+
+_worker: QueueWorker | None = None
 
 
 def start_queue_worker():
-    global _worker_thread
+    global _worker_thread, _worker
     if _worker_thread and _worker_thread.is_alive():
         return
-    _stop_event.clear()
+    _worker = QueueWorker()
     _worker_thread = threading.Thread(
-        target=_worker_loop,
+        target=_worker.run,
         name="queue-worker",
         daemon=True,
     )
     _worker_thread.start()
+    start_queue_listener()
     logger.info("Worker de cola iniciado.")
 
 
 def stop_queue_worker():
-    _stop_event.set()
+    if _worker is not None:
+        _worker.stop()
@@ -0,0 +1,210 @@
+"""Token bucket de envios a la Graph API compartido entre procesos.
+
+Cada phone_id tiene un bucket por clase de envio: "reply" (respuestas del
+bot) y "campaign" (envios masivos). GRAPH_RATE_LIMIT_PER_SECOND se reparte
+entre ambas segun GRAPH_RATE_CAMPAIGN_SHARE, asi una campana nunca le quita
+cupo a las respuestas. Cuando Meta devuelve throttling la tasa baja a la
+mitad (GRAPH_RATE_BACKOFF_FACTOR) y se recupera linealmente con el tiempo.
+
+El estado vive en la tabla graph_rate_buckets (compartido entre nodos) o,
+sin Postgres, en memoria del proceso. Con la tabla, cada proceso reserva de
+una vez los tokens de GRAPH_RATE_DB_RESERVE_MS y los gasta localmente: asi
+la fila del bucket se bloquea una vez por lote y no una vez por envio.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from app.models.rate_bucket import GraphRateBucket
+
+logger = logging.getLogger(__name__)
+
+CLASES = ("reply", "campaign")
+THROTTLING_ERROR_CODES = {4, 80007, 130429, 131048, 131056}
+
+_limitador = None
+_limitador_lock = threading.Lock()
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def tasa_maxima(clase: str) -> float:
+    total = float(getattr(settings, "GRAPH_RATE_LIMIT_PER_SECOND", 20))
+    share = min(1.0, max(0.0, float(getattr(settings, "GRAPH_RATE_CAMPAIGN_SHARE", 0.25))))
+    return total * share if clase == "campaign" else total * (1 - share)
+
+
+def rate_limit_habilitado() -> bool:
+    return float(getattr(settings, "GRAPH_RATE_LIMIT_PER_SECOND", 20)) > 0
+
+
+def es_throttling(resultado: dict | None) -> bool:
+    if not resultado or resultado.get("ok"):
+        return False
+    return resultado.get("status_code") == 429 or resultado.get("error_code") in THROTTLING_ERROR_CODES
+
+
+class EstadoBucket:
+    def __init__(self, tokens: float, rate: float, updated_ms: int):
+        self.tokens = tokens
+        self.rate = rate
+        self.updated_ms = updated_ms
+
+    def recargar(self, now_ms: int, rate_max: float) -> None:
+        """Suma tokens por el tiempo transcurrido y recupera la tasa tras un throttling."""
+        elapsed = max(0, now_ms - self.updated_ms) / 1000.0
+        recovery = float(getattr(settings, "GRAPH_RATE_RECOVERY_PER_SECOND", 0.2))
+        if self.rate < rate_max:
+            self.rate = min(rate_max, self.rate + recovery * elapsed)
+        self.rate = min(self.rate, rate_max)
+        self.tokens = min(max(1.0, self.rate), self.tokens + self.rate * elapsed)
+        self.updated_ms = now_ms
+
+    def tomar(self) -> float:
+        """Consume un token; si no hay, retorna los segundos a esperar."""
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / max(self.rate, 1e-6)
+
+    def frenar(self) -> None:
+        factor = float(getattr(settings, "GRAPH_RATE_BACKOFF_FACTOR", 0.5))
+        rate_min = float(getattr(settings, "GRAPH_RATE_MIN_PER_SECOND", 1))
+        self.rate = max(rate_min, self.rate * factor)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class MemoriaRateStore:
+    """Buckets en memoria: solo limitan dentro del proceso."""
+
+    def __init__(self):
+        self._estados: dict[str, EstadoBucket] = {}
+        self._lock = threading.Lock()
+
+    def operar(self, clave: str, rate_max: float, now_ms: int, fn: Callable[[EstadoBucket], object]):
+        with self._lock:
+            estado = self._estados.get(clave)
+            if estado is None:
+                estado = EstadoBucket(max(1.0, rate_max), rate_max, now_ms)
+                self._estados[clave] = estado
+            return fn(estado)
+
+    def tomar(self, clave: str, rate_max: float, now_ms: int) -> float:
+        def _tomar(estado: EstadoBucket) -> float:
+            estado.recargar(now_ms, rate_max)
+            return estado.tomar()
+
+        return self.operar(clave, rate_max, now_ms, _tomar)
+
+    def descartar_reserva(self, clave: str) -> None:
+        pass
+
+
+class DBRateStore:
+    """Buckets en la tabla graph_rate_buckets, bloqueando la fila por operacion.
+
+    tomar() reserva hasta GRAPH_RATE_DB_RESERVE_MS de tokens a la tasa actual
+    y los guarda en el proceso; la reserva vence pasado ese mismo tiempo.
+    """
+
+    def __init__(self, reserva_ms: int | None = None):
+        if reserva_ms is None:
+            reserva_ms = int(getattr(settings, "GRAPH_RATE_DB_RESERVE_MS", 200))
+        self.reserva_ms = max(0, reserva_ms)
+        self._reservas: dict[str, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def operar(self, clave: str, rate_max: float, now_ms: int, fn: Callable[[EstadoBucket], object]):
+        with transaction.atomic():
+            bucket, _ = GraphRateBucket.objects.select_for_update().get_or_create(
+                key=clave,
+                defaults={"tokens": max(1.0, rate_max), "rate": rate_max, "updated_ms": now_ms},
+            )
+            estado = EstadoBucket(bucket.tokens, bucket.rate, bucket.updated_ms)
+            resultado = fn(estado)
+            bucket.tokens = estado.tokens
+            bucket.rate = estado.rate
+            bucket.updated_ms = estado.updated_ms
+            bucket.save(update_fields=["tokens", "rate", "updated_ms"])
+        return resultado
+
+    def tomar(self, clave: str, rate_max: float, now_ms: int) -> float:
+        with self._lock:
+            restantes, vence_ms = self._reservas.get(clave, (0, 0))
+            if restantes > 0 and now_ms < vence_ms:
+                self._reservas[clave] = (restantes - 1, vence_ms)
+                return 0.0
+
+        def _reservar(estado: EstadoBucket) -> tuple[float, int]:
+            estado.recargar(now_ms, rate_max)
+            espera = estado.tomar()
+            if espera > 0:
+                return espera, 0
+            lote = int(estado.rate * self.reserva_ms / 1000)
+            extra = max(0, min(lote - 1, int(estado.tokens)))
+            estado.tokens -= extra
+            return 0.0, extra
+
+        espera, extra = self.operar(clave, rate_max, now_ms, _reservar)
+        with self._lock:
+            self._reservas[clave] = (extra, now_ms + self.reserva_ms)
+        return espera
+
+    def descartar_reserva(self, clave: str) -> None:
+        with self._lock:
+            self._reservas.pop(clave, None)
+
+
+class LimitadorGraph:
+    def __init__(self, store=None):
+        self.store = store or MemoriaRateStore()
+
+    def intentar(self, phone_id: str, clase: str = "reply", now_ms: int | None = None) -> float:
+        """Intenta tomar un token; retorna 0 si lo obtuvo o los segundos a esperar."""
+        now_ms = now_ms or _now_ms()
+        return self.store.tomar(f"{phone_id}:{clase}", tasa_maxima(clase), now_ms)
+
+    def adquirir(self, phone_id: str, clase: str = "reply", timeout: float | None = None) -> bool:
+        """Bloquea hasta obtener un token o hasta timeout (GRAPH_RATE_MAX_WAIT_SECONDS)."""
+        if timeout is None:
+            timeout = float(getattr(settings, "GRAPH_RATE_MAX_WAIT_SECONDS", 5))
+        deadline = time.monotonic() + timeout
+        while True:
+            espera = self.intentar(phone_id, clase)
+            if espera <= 0:
+                return True
+            if time.monotonic() + espera > deadline:
+                return False
+            time.sleep(espera)
+
+    def registrar_throttling(self, phone_id: str, now_ms: int | None = None) -> None:
+        """Reduce la tasa de todas las clases del phone_id (el limite de Meta es por numero)."""
+        now_ms = now_ms or _now_ms()
+        for clase in CLASES:
+            rate_max = tasa_maxima(clase)
+            self.store.descartar_reserva(f"{phone_id}:{clase}")
+
+            def _frenar(estado: EstadoBucket) -> float:
+                estado.recargar(now_ms, rate_max)
+                estado.frenar()
+                return estado.rate
+
+            rate = self.store.operar(f"{phone_id}:{clase}", rate_max, now_ms, _frenar)
+            logger.warning("Throttling de Graph para %s:%s; nueva tasa %.2f/s", phone_id, clase, rate)
+
+
+def get_limitador() -> LimitadorGraph:
+    global _limitador
+    with _limitador_lock:
+        if _limitador is None:
+            backend = str(getattr(settings, "GRAPH_RATE_LIMIT_STORE", "auto")).lower()
+            usar_db = backend == "db" or (backend == "auto" and connection.vendor == "postgresql")
+            _limitador = LimitadorGraph(DBRateStore() if usar_db else MemoriaRateStore())
+        return _limitador
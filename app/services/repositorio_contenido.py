@@ -0,0 +1,255 @@
+"""Cache en proceso del contenido del bot (menus, opciones, respuestas, config).
+
+El contenido cambia muy de vez en cuando y se lee en cada respuesta. La
+primera lectura carga todo el grafo en una instantanea inmutable; las
+siguientes la reutilizan sin consultas mientras no cambie la version.
+
+Los signals post_save/post_delete de Menu, MenuOption, Respuesta y Config
+suben la version y publican el topico "contenido" en cache_bus: al
+confirmar la transaccion se vuelve a subir aca (para no quedarse con una
+instantanea armada antes del commit) y en los demas procesos. Sin
+listener del bus, los cambios de otro proceso se ven al vencer
+CONTENT_CACHE_TTL_SECONDS.
+
+Las instancias de la instantanea se comparten entre hilos: son de solo
+lectura. Cada instantanea guarda ademas lo ya renderizado a partir de ella
+(textos y payloads interactivos), asi que ese cache queda atado a la
+version del contenido. Al invalidar por el bus se arma la nueva
+instantanea y se precalienta en segundo plano.
+"""
+
+import logging
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Mapping, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+
+from app.models.config import Config
+from app.models.menu import Menu
+from app.models.menu_option import MenuOption
+from app.models.respuesta import Respuesta
+from app.services.cache_bus import publicar_invalidacion, suscribir, ttl_cache
+
+TOPICO_CONTENIDO = "contenido"
+
+logger = logging.getLogger(__name__)
+
+
+class InstantaneaContenido:
+    """Grafo de contenido leido en un momento dado (version)."""
+
+    # Tope de renders guardados; las claves salen del contenido, no del usuario.
+    MAX_RENDERS = 5000
+
+    def __init__(
+        self,
+        version: int,
+        menus: Mapping[str, Menu],
+        opciones: Mapping[str, tuple[MenuOption, ...]],
+        respuestas: Mapping[str, Respuesta],
+        config: Mapping[str, object],
+    ):
+        self.version = version
+        self.creada = time.monotonic()
+        # Todos los menus (tambien inactivos) para recorrer la cadena de padres.
+        self.menus = MappingProxyType(dict(menus))
+        # Ids de la raiz al menu, para el breadcrumb sin recorrer parent.
+        self.ancestros = MappingProxyType(_calcular_ancestros(self.menus))
+        self.menus_activos = MappingProxyType(
+            {menu_id: menu for menu_id, menu in menus.items() if menu.activo}
+        )
+        self.menu_principal: Optional[Menu] = next(
+            (menu for menu in self.menus_activos.values() if menu.is_main), None
+        )
+        self.opciones = MappingProxyType(dict(opciones))
+        self.opciones_por_key = MappingProxyType(
+            {
+                (menu_id, opcion.key): opcion
+                for menu_id, lista in opciones.items()
+                for opcion in lista
+            }
+        )
+        self.respuestas = MappingProxyType(dict(respuestas))
+        self.config = MappingProxyType(dict(config))
+        self._renders: dict[tuple, Any] = {}
+        self._derivados: dict[str, Any] = {}
+
+    def es_propio(self, instancia: Menu | Respuesta) -> bool:
+        """True si la instancia es la de esta instantanea (y no una copia editada)."""
+        coleccion = self.menus if isinstance(instancia, Menu) else self.respuestas
+        return coleccion.get(str(instancia.pk)) is instancia
+
+    def derivado(self, nombre: str, construir: Callable[[], Any]) -> Any:
+        """Estructura compilada a partir de esta instantanea (una por nombre)."""
+        try:
+            return self._derivados[nombre]
+        except KeyError:
+            valor = self._derivados[nombre] = construir()
+            return valor
+
+    def renderizar(self, clave: tuple, construir: Callable[[], Any]) -> Any:
+        """Render memorizado por clave mientras viva esta instantanea."""
+        try:
+            return self._renders[clave]
+        except KeyError:
+            pass
+        valor = construir()
+        if len(self._renders) < self.MAX_RENDERS:
+            self._renders[clave] = valor
+        return valor
+
+    def opciones_de(self, menu_id: str) -> tuple[MenuOption, ...]:
+        """Opciones activas del menu ordenadas por orden."""
+        return self.opciones.get(str(menu_id), ())
+
+    @classmethod
+    def cargar(cls, version: int) -> "InstantaneaContenido":
+        """Lee el grafo completo: una consulta por tabla."""
+        menus = {str(menu.pk): menu for menu in Menu.objects.order_by("pk")}
+        respuestas = {
+            str(respuesta.pk): respuesta
+            for respuesta in Respuesta.objects.filter(activo=True).order_by("pk")
+        }
+        opciones: dict[str, list[MenuOption]] = {}
+        for opcion in MenuOption.objects.filter(activo=True).order_by("menu_id", "orden", "pk"):
+            opciones.setdefault(str(opcion.menu_id), []).append(opcion)
+        config = {str(item.pk): item.valor for item in Config.objects.all()}
+        return cls(
+            version,
+            menus,
+            {menu_id: tuple(lista) for menu_id, lista in opciones.items()},
+            respuestas,
+            config,
+        )
+
+
+def _calcular_ancestros(menus: Mapping[str, Menu]) -> dict[str, tuple[str, ...]]:
+    """Camino de ids (raiz ... menu) de cada menu, compartiendo los prefijos."""
+    ancestros: dict[str, tuple[str, ...]] = {}
+    for menu_id in menus:
+        cadena: list[str] = []
+        visitados: set[str] = set()
+        actual: Optional[str] = menu_id
+        while actual is not None and actual not in ancestros and actual not in visitados:
+            visitados.add(actual)
+            cadena.append(actual)
+            padre_id = menus[actual].parent_id
+            actual = str(padre_id) if padre_id is not None and str(padre_id) in menus else None
+        if actual is not None and actual in visitados:
+            # Menu.save lo impide; solo llega por un UPDATE directo y aca se corta.
+            logger.warning("Ciclo de menus en %s; se corta el breadcrumb.", actual)
+            base: tuple[str, ...] = ()
+        else:
+            base = ancestros.get(actual, ()) if actual is not None else ()
+        for paso in reversed(cadena):
+            base = base + (paso,)
+            ancestros[paso] = base
+    return ancestros
+
+
+_version = 0
+_instantanea: Optional[InstantaneaContenido] = None
+_lock = threading.Lock()
+
+
+def version_contenido() -> int:
+    return _version
+
+
+def invalidar_contenido() -> None:
+    """Sube la version; la proxima lectura vuelve a cargar el grafo."""
+    global _version
+    with _lock:
+        _version += 1
+
+
+def _al_cambiar_contenido(sender, **kwargs) -> None:
+    invalidar_contenido()
+    publicar_invalidacion(TOPICO_CONTENIDO, _version)
+
+
+def _vencida(instantanea: InstantaneaContenido) -> bool:
+    ttl = ttl_cache(getattr(settings, "CONTENT_CACHE_TTL_SECONDS", 60) or 0)
+    return ttl > 0 and time.monotonic() - instantanea.creada >= ttl
+
+
+def obtener_contenido() -> InstantaneaContenido:
+    """Instantanea vigente del contenido; la carga si cambio la version."""
+    global _instantanea
+    instantanea = _instantanea
+    if instantanea is not None and instantanea.version == _version and not _vencida(instantanea):
+        return instantanea
+    with _lock:
+        instantanea = _instantanea
+        if instantanea is None or instantanea.version != _version or _vencida(instantanea):
+            # invalidar_contenido espera este lock: un cambio durante la carga
+            # sube la version despues y fuerza otra carga.
+            instantanea = InstantaneaContenido.cargar(_version)
+            _instantanea = instantanea
+            logger.debug("Contenido cargado (version %s).", instantanea.version)
+    return instantanea
+
+
+_precarga_pendiente = threading.Event()
+_precarga_lock = threading.Lock()
+_precarga_thread: Optional[threading.Thread] = None
+
+
+def precargar_contenido() -> InstantaneaContenido:
+    """Arma la instantanea vigente, compila la navegacion y precalienta los renders."""
+    from app.services.gestor_contenido import GestorContenido
+    from app.services.navegador import AutomataNavegacion
+
+    instantanea = obtener_contenido()
+    AutomataNavegacion.vigente()
+    GestorContenido.precalentar_render(instantanea)
+    return instantanea
+
+
+def _precargar_en_segundo_plano() -> None:
+    global _precarga_thread
+    try:
+        while True:
+            # Varias invalidaciones seguidas se resuelven con una sola carga.
+            with _precarga_lock:
+                if not _precarga_pendiente.is_set():
+                    _precarga_thread = None
+                    return
+                _precarga_pendiente.clear()
+            try:
+                precargar_contenido()
+            except Exception:
+                logger.exception("No se pudo precargar el contenido")
+    finally:
+        connection.close()
+
+
+def _al_invalidar_por_bus(version: str) -> None:
+    """Invalida y arma la version nueva fuera del camino de los mensajes."""
+    global _precarga_thread
+    invalidar_contenido()
+    if not getattr(settings, "CONTENT_CACHE_WARM", True):
+        return
+    with _precarga_lock:
+        _precarga_pendiente.set()
+        if _precarga_thread is None:
+            _precarga_thread = threading.Thread(
+                target=_precargar_en_segundo_plano, name="content-warmup", daemon=True
+            )
+            _precarga_thread.start()
+
+
+def conectar_invalidacion() -> None:
+    """Conecta los signals de los modelos de contenido y el bus (AppConfig.ready)."""
+    suscribir(TOPICO_CONTENIDO, _al_invalidar_por_bus)
+    for modelo in (Menu, MenuOption, Respuesta, Config):
+        for nombre, senal in (("post_save", post_save), ("post_delete", post_delete)):
+            senal.connect(
+                _al_cambiar_contenido,
+                sender=modelo,
+                dispatch_uid=f"contenido_{nombre}_{modelo.__name__}",
+            )
@@ -0,0 +1,322 @@
+"""Almacenamiento de sesiones con backend intercambiable.
+
+Por defecto (SESSION_STORE=db) cada lectura y escritura va directo a la
+tabla sesiones. Con SESSION_STORE=lru el worker de inbound mantiene en
+memoria las sesiones de las conversaciones que atiende (LRU por telefono)
+y escribe los cambios en lotes (write-behind).
+
+El pool shardeado garantiza que un telefono lo atiende siempre el mismo
+hilo del proceso, asi que la sesion cacheada tiene un unico duenio. El
+backend lru solo es coherente con un unico proceso de inbound. En Postgres
+cada proceso de inbound toma un advisory lock: compartido con db y
+exclusivo con lru. Si ya hay otros procesos, el que pide lru se queda en
+db; si ya hay uno con lru, los demas no procesan inbound.
+
+Cada hilo del pool escribe solo las sesiones de sus telefonos (el worker
+le encola el flush detras de sus lotes), asi nunca se lee una sesion que
+otro hilo esta modificando. Un cambio hecho desde otro proceso (reset
+desde la API) se avisa por cache_bus y el store lru descarta su copia.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+from django.db import connection, connections
+from django.utils import timezone
+
+from app.models.sesion import Sesion
+from app.services.cache_bus import publicar_invalidacion, suscribir
+
+logger = logging.getLogger(__name__)
+TOPICO_SESION = "sesion"
+
+
+class DBSesionStore:
+    """Lee y escribe cada sesion directo en la base."""
+
+    def cargar(self, phone_number: str) -> Optional[Sesion]:
+        return Sesion.objects.filter(phone_number=phone_number).first()
+
+    def guardar(self, sesion: Sesion, campos: Iterable[str] = (), nueva: bool = False) -> None:
+        if nueva:
+            sesion.save(force_insert=True)
+        elif campos:
+            sesion.save(update_fields=sorted(set(campos)) + ["updated_at"])
+
+    def descartar(self, phone_number: str, pendientes: bool = True) -> None:
+        """Olvida lo cacheado de un telefono (cambio hecho por fuera del store).
+
+        Con pendientes=False se conserva si tiene cambios sin escribir.
+        """
+
+    def flush(self, solo: Optional[Callable[[str], bool]] = None) -> int:
+        return 0
+
+    def flush_pendiente(self) -> bool:
+        return False
+
+    def marcar_flush(self) -> None:
+        pass
+
+
+class LRUSesionStore(DBSesionStore):
+    """Cache LRU por telefono con escritura diferida en lotes."""
+
+    def __init__(
+        self,
+        capacidad: int | None = None,
+        lote: int | None = None,
+        intervalo: float | None = None,
+    ):
+        self.capacidad = max(
+            1, int(capacidad or getattr(settings, "SESSION_STORE_CAPACITY", 10000))
+        )
+        self.lote = max(1, int(lote or getattr(settings, "SESSION_STORE_FLUSH_BATCH", 200)))
+        if intervalo is None:
+            intervalo = float(getattr(settings, "SESSION_STORE_FLUSH_SECONDS", 2))
+        self.intervalo = intervalo
+        self._cache: "OrderedDict[str, Sesion]" = OrderedDict()
+        # phone -> campos sucios; None significa fila nueva (INSERT).
+        self._sucios: dict[str, Optional[set[str]]] = {}
+        self._lock = threading.RLock()
+        self._ultimo_flush = time.monotonic()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._cache)
+
+    def cargar(self, phone_number: str) -> Optional[Sesion]:
+        with self._lock:
+            sesion = self._cache.get(phone_number)
+            if sesion is not None and self._vigente(sesion):
+                self._cache.move_to_end(phone_number)
+                return sesion
+            if sesion is not None:
+                # El barrido de sesiones pudo cerrarla o borrarla: se relee.
+                del self._cache[phone_number]
+        sesion = super().cargar(phone_number)
+        if sesion is not None:
+            with self._lock:
+                desalojados = self._cachear(sesion)
+            self._escribir_desalojados(desalojados)
+        return sesion
+
+    def guardar(self, sesion: Sesion, campos: Iterable[str] = (), nueva: bool = False) -> None:
+        phone_number = sesion.phone_number
+        with self._lock:
+            if nueva:
+                self._sucios[phone_number] = None
+            elif campos:
+                pendientes = self._sucios.get(phone_number, set())
+                if pendientes is not None:
+                    pendientes.update(campos)
+                self._sucios[phone_number] = pendientes
+            desalojados = self._cachear(sesion)
+        self._escribir_desalojados(desalojados)
+
+    def descartar(self, phone_number: str, pendientes: bool = True) -> None:
+        with self._lock:
+            if not pendientes and phone_number in self._sucios:
+                return
+            self._cache.pop(phone_number, None)
+            self._sucios.pop(phone_number, None)
+
+    def flush_pendiente(self) -> bool:
+        """True si hay cambios y paso el intervalo o se junto un lote."""
+        with self._lock:
+            if not self._sucios:
+                return False
+            if len(self._sucios) >= self.lote:
+                return True
+            return time.monotonic() - self._ultimo_flush >= self.intervalo
+
+    def flush(self, solo: Optional[Callable[[str], bool]] = None) -> int:
+        """Escribe las sesiones sucias: un INSERT y un UPDATE por lote.
+
+        Con solo(phone) se escriben unicamente esos telefonos; el worker lo
+        usa para que cada hilo escriba las sesiones que solo el modifica.
+        """
+        with self._lock:
+            if solo is None:
+                sucios, self._sucios = self._sucios, {}
+                self._ultimo_flush = time.monotonic()
+            else:
+                sucios = {phone: campos for phone, campos in self._sucios.items() if solo(phone)}
+                for phone in sucios:
+                    del self._sucios[phone]
+            sesiones = {phone: self._cache.get(phone) for phone in sucios}
+        return self._escribir(sucios, sesiones)
+
+    def marcar_flush(self) -> None:
+        """Reinicia el intervalo (el worker ya encolo el flush en cada hilo)."""
+        with self._lock:
+            self._ultimo_flush = time.monotonic()
+
+    def _vigente(self, sesion: Sesion) -> bool:
+        """Con cambios pendientes o acceso reciente, lo cacheado sigue valiendo."""
+        if sesion.phone_number in self._sucios:
+            return True
+        corte_ms = int(time.time() * 1000) - int(settings.SESSION_TIMEOUT_SECONDS) * 1000
+        return sesion.ultimo_acceso_ms >= corte_ms
+
+    def _cachear(self, sesion: Sesion) -> dict:
+        """Cachea la sesion (con el lock tomado); retorna los desalojados sucios."""
+        self._cache[sesion.phone_number] = sesion
+        self._cache.move_to_end(sesion.phone_number)
+        desalojados = {}
+        while len(self._cache) > self.capacidad:
+            phone_number, viejo = self._cache.popitem(last=False)
+            if phone_number in self._sucios:
+                desalojados[phone_number] = (self._sucios.pop(phone_number), viejo)
+        return desalojados
+
+    def _escribir_desalojados(self, desalojados: dict) -> None:
+        if desalojados:
+            self._escribir(
+                {phone: campos for phone, (campos, _) in desalojados.items()},
+                {phone: sesion for phone, (_, sesion) in desalojados.items()},
+            )
+
+    def _escribir(self, sucios: dict, sesiones: dict) -> int:
+        nuevas = []
+        existentes = []
+        campos: set[str] = set()
+        for phone, pendientes in sucios.items():
+            sesion = sesiones.get(phone)
+            if sesion is None:
+                continue
+            if pendientes is None:
+                nuevas.append(sesion)
+            elif pendientes:
+                existentes.append(sesion)
+                campos.update(pendientes)
+        try:
+            if nuevas:
+                Sesion.objects.bulk_create(
+                    nuevas,
+                    update_conflicts=True,
+                    unique_fields=["phone_number"],
+                    update_fields=[
+                        field.name
+                        for field in Sesion._meta.concrete_fields
+                        if field.name not in ("phone_number", "created_at")
+                    ],
+                )
+            if existentes:
+                # bulk_update no aplica auto_now: updated_at se asigna a mano.
+                ahora = timezone.now()
+                for sesion in existentes:
+                    sesion.updated_at = ahora
+                Sesion.objects.bulk_update(
+                    existentes, sorted(campos) + ["updated_at"], batch_size=self.lote
+                )
+        except Exception:
+            # No perder los cambios: vuelven a quedar sucios para el proximo flush.
+            with self._lock:
+                for phone, pendientes in sucios.items():
+                    actual = self._sucios.get(phone, set())
+                    if pendientes is None or actual is None:
+                        self._sucios[phone] = None
+                    else:
+                        self._sucios[phone] = actual | pendientes
+                    if phone in sesiones and phone not in self._cache:
+                        self._cache[phone] = sesiones[phone]
+            logger.exception("No se pudieron escribir %s sesiones; se reintenta.", len(sucios))
+            return 0
+        return len(nuevas) + len(existentes)
+
+
+LLAVE_INBOUND = "sesion_store:inbound"
+
+_store: DBSesionStore = DBSesionStore()
+_store_lock = threading.Lock()
+# Conexion propia que retiene el advisory lock de inbound mientras dure.
+_conexion_lock = None
+
+
+def get_sesion_store() -> DBSesionStore:
+    return _store
+
+
+def invalidar_sesion(phone_number: str) -> None:
+    """Avisa que la sesion cambio por fuera del store lru (otro proceso).
+
+    Si este proceso es el del store lru el cambio ya paso por su cache.
+    """
+    if not isinstance(_store, LRUSesionStore):
+        publicar_invalidacion(TOPICO_SESION, phone_number)
+
+
+def _al_invalidar_sesion(phone_number: str) -> None:
+    if phone_number:
+        _store.descartar(phone_number)
+
+
+def conectar_invalidacion_sesiones() -> None:
+    """Suscribe el store al bus de invalidacion (AppConfig.ready)."""
+    suscribir(TOPICO_SESION, _al_invalidar_sesion)
+
+
+def _tomar_lock_inbound(exclusivo: bool) -> bool:
+    """Advisory lock de inbound (solo Postgres; con otro motor hay un solo proceso)."""
+    global _conexion_lock
+    if connection.vendor != "postgresql":
+        return True
+    funcion = "pg_try_advisory_lock" if exclusivo else "pg_try_advisory_lock_shared"
+    conexion = connections.create_connection("default")
+    conexion.inc_thread_sharing()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute(f"SELECT {funcion}(hashtext(%s))", [LLAVE_INBOUND])
+            obtenido = bool(cursor.fetchone()[0])
+    except Exception:
+        logger.exception("No se pudo tomar el lock de inbound.")
+        obtenido = False
+    if obtenido:
+        _conexion_lock = conexion
+    else:
+        conexion.close()
+    return obtenido
+
+
+def _soltar_lock_inbound() -> None:
+    global _conexion_lock
+    if _conexion_lock is not None:
+        _conexion_lock.close()
+        _conexion_lock = None
+
+
+def activar_sesion_store() -> Optional[DBSesionStore]:
+    """Lo llama el worker de inbound al arrancar.
+
+    Retorna None si otro proceso ya usa el store lru: este proceso no debe
+    procesar inbound.
+    """
+    global _store
+    with _store_lock:
+        if _conexion_lock is not None or isinstance(_store, LRUSesionStore):
+            return _store
+        backend = str(getattr(settings, "SESSION_STORE", "db")).lower()
+        if backend == "lru":
+            if _tomar_lock_inbound(exclusivo=True):
+                _store = LRUSesionStore()
+                logger.info("Store de sesiones LRU activo (capacidad %s).", _store.capacidad)
+                return _store
+            logger.warning("Hay otros procesos de inbound; SESSION_STORE=lru no aplica, se usa db.")
+        if _tomar_lock_inbound(exclusivo=False):
+            return _store
+        logger.error("Otro proceso de inbound usa SESSION_STORE=lru; este no procesa inbound.")
+        return None
+
+
+def desactivar_sesion_store() -> None:
+    """Escribe lo pendiente, vuelve al backend de base y suelta el lock de inbound."""
+    global _store
+    with _store_lock:
+        _store.flush()
+        _store = DBSesionStore()
+        _soltar_lock_inbound()
@@ -1,8 +1,43 @@
 ﻿import re
 import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Dict, Tuple
 from enum import Enum
 
+# Entradas de hasta este largo pasan por el memo LRU de validar().
+MAX_LARGO_MEMO = 40
+TAMANIO_MEMO = 1024
+
+# Emojis y caracteres especiales (todos fuera de ASCII).
+_PATRON_EMOJIS = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    "\U00002702-\U000027B0"
+    "\U000024C2-\U0001F251"
+    "\U0001f926-\U0001f937"
+    "\U00010000-\U0010ffff"
+    "\u2640-\u2642"
+    "\u2600-\u2B55"
+    "\u200d"
+    "\u23cf"
+    "\u23e9"
+    "\u231a"
+    "\ufe0f"  # dingbats
+    "\u3030"
+    "]+",
+    flags=re.UNICODE,
+)
+_PATRON_NO_SALUDO = re.compile(r"[^A-Z0-9 ]+")
+_PATRON_SALUDO = re.compile(
+    r"^(HOLA|BUEN DIA|BUENOS DIAS|BUENAS|BUENAS TARDES|BUENAS NOCHES|HI|HELLO)\b"
+)
+_PATRON_NUMERO = re.compile(r"^[0-9]{1,2}$")
+_PATRON_LETRA = re.compile(r"^[A-Z]$")
+
 
 class TipoEntrada(str, Enum):
     COMANDO = "comando"
@@ -11,22 +46,16 @@ class TipoEntrada(str, Enum):
     INVALIDO = "invalido"
 
 
+@dataclass(frozen=True)
 class ResultadoValidacion:
-    def __init__(
-        self,
-        es_valido: bool,
-        tipo: TipoEntrada,
-        accion: str,
-        target: str,
-        entrada_limpia: str,
-        error_msg: str = "",
-    ):
-        self.es_valido = es_valido
-        self.tipo = tipo
-        self.accion = accion
-        self.target = target
-        self.entrada_limpia = entrada_limpia
-        self.error_msg = error_msg
+    """Resultado inmutable: validar() comparte la misma instancia entre llamadas."""
+
+    es_valido: bool
+    tipo: TipoEntrada
+    accion: str
+    target: str
+    entrada_limpia: str
+    error_msg: str = ""
 
 
 class ValidadorEntrada:
@@ -75,10 +104,11 @@ class ValidadorEntrada:
             return ""
 
         # Remover emojis y caracteres especiales manteniendo nÃºmeros y letras
-        texto = ValidadorEntrada._remover_emojis(texto)
+        if not texto.isascii():
+            texto = ValidadorEntrada._remover_emojis(texto)
 
-        # Normalizar espacios
-        texto = re.sub(r"\s+", " ", texto).strip()
+        # Normalizar espacios (split() corta por los mismos espacios que \s)
+        texto = " ".join(texto.split())
 
         # A mayÃºsculas
         texto = texto.upper()
@@ -88,37 +118,29 @@ class ValidadorEntrada:
     @staticmethod
     def _remover_emojis(texto: str) -> str:
         """Remueve emojis pero mantiene nÃºmeros y letras"""
-        # PatrÃ³n para detectar emojis y caracteres especiales
-        emoji_pattern = re.compile(
-            "["
-            "\U0001F600-\U0001F64F"  # emoticons
-            "\U0001F300-\U0001F5FF"  # symbols & pictographs
-            "\U0001F680-\U0001F6FF"  # transport & map symbols
-            "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-            "\U00002702-\U000027B0"
-            "\U000024C2-\U0001F251"
-            "\U0001f926-\U0001f937"
-            "\U00010000-\U0010ffff"
-            "\u2640-\u2642"
-            "\u2600-\u2B55"
-            "\u200d"
-            "\u23cf"
-            "\u23e9"
-            "\u231a"
-            "\ufe0f"  # dingbats
-            "\u3030"
-            "]+",
-            flags=re.UNICODE,
-        )
         # Reemplaza emojis con espacio
-        texto = emoji_pattern.sub(r" ", texto)
-        return texto
+        return _PATRON_EMOJIS.sub(" ", texto)
 
     @staticmethod
     def validar(entrada: str) -> ResultadoValidacion:
         """
         Valida entrada del usuario y retorna un objeto ResultadoValidacion
+
+        Las entradas tipicas ("1", "A", "#", "MENU") salen de una tabla armada
+        al importar; el resto de las cortas, de un memo LRU acotado. El
+        resultado es compartido: no modificarlo.
         """
+        if not entrada:
+            return ValidadorEntrada._validar_completo(entrada)
+        rapido = _RESULTADOS_RAPIDOS.get(entrada)
+        if rapido is not None:
+            return rapido
+        if len(entrada) <= MAX_LARGO_MEMO:
+            return _validar_memorizado(entrada)
+        return ValidadorEntrada._validar_completo(entrada)
+
+    @staticmethod
+    def _validar_completo(entrada: str) -> ResultadoValidacion:
         entrada_limpia = ValidadorEntrada.normalizar_entrada(entrada)
 
         if not entrada_limpia:
@@ -143,14 +165,8 @@ class ValidadorEntrada:
             )
 
         # Saludos: responder con menu principal
-        entrada_saludo = re.sub(r"[^A-Z0-9 ]+", "", entrada_limpia).strip()
-        if (
-            entrada_saludo in ValidadorEntrada.SALUDOS
-            or re.match(
-                r"^(HOLA|BUEN DIA|BUENOS DIAS|BUENAS|BUENAS TARDES|BUENAS NOCHES|HI|HELLO)\b",
-                entrada_saludo,
-            )
-        ):
+        entrada_saludo = _PATRON_NO_SALUDO.sub("", entrada_limpia).strip()
+        if entrada_saludo in ValidadorEntrada.SALUDOS or _PATRON_SALUDO.match(entrada_saludo):
             return ResultadoValidacion(
                 es_valido=True,
                 tipo=TipoEntrada.COMANDO,
@@ -160,7 +176,7 @@ class ValidadorEntrada:
             )
 
         # Validar opciones numericas (1-99)
-        if re.match(r"^[0-9]{1,2}$", entrada_limpia):
+        if _PATRON_NUMERO.match(entrada_limpia):
             return ResultadoValidacion(
                 es_valido=True,
                 tipo=TipoEntrada.MENU_PRINCIPAL,
@@ -170,7 +186,7 @@ class ValidadorEntrada:
             )
 
         # Validar opciones alfabeticas (A-Z)
-        if re.match(r"^[A-Z]$", entrada_limpia):
+        if _PATRON_LETRA.match(entrada_limpia):
             return ResultadoValidacion(
                 es_valido=True,
                 tipo=TipoEntrada.SUBMENU,
@@ -189,3 +205,16 @@ class ValidadorEntrada:
             error_msg="OpciÃ³n no vÃ¡lida. Selecciona un nÃºmero o una letra (A-Z)",
         )
 
+
+_validar_memorizado = lru_cache(maxsize=TAMANIO_MEMO)(ValidadorEntrada._validar_completo)
+
+_RESULTADOS_RAPIDOS: Dict[str, ResultadoValidacion] = {
+    entrada: ValidadorEntrada._validar_completo(entrada)
+    for base in (
+        list(ValidadorEntrada.COMANDOS_ESPECIALES)
+        + [str(numero) for numero in range(100)]
+        + [f"{numero:02d}" for numero in range(10)]
+        + [chr(letra) for letra in range(ord("A"), ord("Z") + 1)]
+    )
+    for entrada in {base, base.lower(), base.capitalize()}
+}
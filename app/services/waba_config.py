@@ -2,25 +2,50 @@ import time
 from typing import Optional
 
 from django.conf import settings
+from django.db.models.signals import post_delete, post_save
 
 from app.models.waba_config import WabaConfig
+from app.services.cache_bus import publicar_invalidacion, suscribir, ttl_cache
 
+TOPICO_WABA_CONFIG = "waba_config"
+# TTL sin bus de invalidacion; con el bus activo rige CACHE_BUS_TTL_SECONDS.
 _CACHE_TTL_SECONDS = 5
+_SIN_CARGAR = object()
 _cache_ts = 0.0
-_cache_value: Optional[WabaConfig] = None
+_cache_value: object = _SIN_CARGAR
 
 
-def clear_waba_config_cache() -> None:
+def _descartar_cache(version: str = "") -> None:
     global _cache_ts, _cache_value
     _cache_ts = 0.0
-    _cache_value = None
+    _cache_value = _SIN_CARGAR
+
+
+def clear_waba_config_cache() -> None:
+    """Descarta la config cacheada aca y en los demas procesos."""
+    _descartar_cache()
+    publicar_invalidacion(TOPICO_WABA_CONFIG)
+
+
+def _al_cambiar_config(sender, **kwargs) -> None:
+    clear_waba_config_cache()
+
+
+def conectar_invalidacion_waba() -> None:
+    """Conecta los signals de WabaConfig y el bus (AppConfig.ready)."""
+    suscribir(TOPICO_WABA_CONFIG, _descartar_cache)
+    post_save.connect(_al_cambiar_config, sender=WabaConfig, dispatch_uid="waba_config_post_save")
+    post_delete.connect(
+        _al_cambiar_config, sender=WabaConfig, dispatch_uid="waba_config_post_delete"
+    )
 
 
 def get_active_waba_config() -> Optional[WabaConfig]:
     global _cache_ts, _cache_value
     now = time.time()
-    if _cache_value is not None and (now - _cache_ts) < _CACHE_TTL_SECONDS:
-        return _cache_value
+    # Tambien se cachea la ausencia de config activa (None).
+    if _cache_value is not _SIN_CARGAR and (now - _cache_ts) < ttl_cache(_CACHE_TTL_SECONDS):
+        return _cache_value  # type: ignore[return-value]
     config = WabaConfig.objects.filter(active=True).first()
     _cache_value = config
     _cache_ts = now
@@ -0,0 +1,282 @@
+"""Eventos de los webhooks de WhatsApp: parseo, encolado e inbox crudo.
+
+En modo normal la vista expande el payload en el momento. Con
+WEBHOOK_FAST_ACK la vista solo guarda el cuerpo en WebhookInbox (un
+INSERT) y responde; el worker llama a expandir_inbox(), que parsea cada
+fila y crea los Mensaje y los estados de entrega fuera del request.
+"""
+
+import json
+import logging
+import time
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from app.models.mensaje import Mensaje
+from app.models.webhook_inbox import WebhookInbox
+from app.services.gestor_mensajes import GestorMensajes
+from app.services.queue_notify import notificar_cola
+
+logger = logging.getLogger(__name__)
+
+
+def _buscar_valor_crudo_por_claves(data: Any, claves: list[str]) -> Any:
+    if data is None:
+        return None
+    if isinstance(data, dict):
+        for clave in claves:
+            if clave in data:
+                valor = data.get(clave)
+                if valor is not None:
+                    return valor
+        for value in data.values():
+            encontrado = _buscar_valor_crudo_por_claves(value, claves)
+            if encontrado is not None:
+                return encontrado
+    elif isinstance(data, list):
+        for item in data:
+            encontrado = _buscar_valor_crudo_por_claves(item, claves)
+            if encontrado is not None:
+                return encontrado
+    return None
+
+
+def _buscar_valor_por_claves(data: Any, claves: list[str]) -> Optional[str]:
+    valor = _buscar_valor_crudo_por_claves(data, claves)
+    if valor is None:
+        return None
+    return str(valor)
+
+
+def extraer_opcion_flow(response_json: Any) -> Optional[str]:
+    if response_json is None:
+        return None
+    claves_prioridad = [
+        "menu_option",
+        "menu_option_1",
+        "menu_option_2",
+        "menu_option_3",
+        "opcion",
+        "option",
+    ]
+    return _buscar_valor_por_claves(response_json, claves_prioridad)
+
+
+def extraer_datos_cliente_flow(response_json: Any) -> dict:
+    if response_json is None:
+        return {}
+
+    nombre = _buscar_valor_por_claves(
+        response_json, ["nombre_completo", "nombre", "full_name"]
+    )
+    fecha_nacimiento = _buscar_valor_por_claves(
+        response_json,
+        ["fecha_nacimiento", "fechaNacimiento", "birth_date", "dob"],
+    )
+    tos_optin = _buscar_valor_crudo_por_claves(
+        response_json,
+        ["tos_optin", "terms_optin", "terminos_optin", "marketing_opt_in", "optin"],
+    )
+
+    datos = {}
+    if nombre:
+        datos["nombre_completo"] = nombre
+    if fecha_nacimiento:
+        datos["fecha_nacimiento"] = fecha_nacimiento
+    if tos_optin is not None:
+        datos["tos_optin"] = tos_optin
+    return datos
+
+
+def extraer_eventos_whatsapp(data: dict) -> tuple[list[dict], list[dict]]:
+    """Extrae mensajes y status updates del webhook de WhatsApp."""
+    mensajes: list[dict] = []
+    statuses: list[dict] = []
+    try:
+        for entry in data.get("entry", []) or []:
+            for change in entry.get("changes", []) or []:
+                value = change.get("value", {}) or {}
+                metadata = value.get("metadata", {}) or {}
+                contacts = value.get("contacts", []) or []
+                contact = contacts[0] if contacts else {}
+                alias_waba = contact.get("profile", {}).get("name", "")
+                for message in value.get("messages", []) or []:
+                    message_type = message.get("type", "text")
+                    mensaje_texto = ""
+                    flow_response_json = None
+                    flow_client_data = None
+                    if message_type == "text":
+                        mensaje_texto = message.get("text", {}).get("body", "")
+                    elif message_type == "interactive":
+                        interactive = message.get("interactive", {}) or {}
+                        if interactive.get("type") == "nfm_reply":
+                            nfm_reply = interactive.get("nfm_reply") or {}
+                            response_raw = nfm_reply.get("response_json")
+                            try:
+                                response_json = json.loads(response_raw) if response_raw else None
+                            except Exception:
+                                response_json = None
+                            flow_response_json = response_json
+                            flow_client_data = extraer_datos_cliente_flow(response_json)
+                            mensaje_texto = extraer_opcion_flow(response_json) or ""
+                            if not mensaje_texto:
+                                mensaje_texto = (
+                                    nfm_reply.get("id")
+                                    or nfm_reply.get("title")
+                                    or nfm_reply.get("name")
+                                    or ""
+                                )
+                        else:
+                            reply = interactive.get("button_reply") or interactive.get("list_reply") or {}
+                            mensaje_texto = reply.get("id") or reply.get("title") or ""
+
+                    phone_raw = message.get("from", "")
+                    if phone_raw.startswith("549"):
+                        phone_number = "+54" + phone_raw[3:]
+                    else:
+                        phone_number = "+" + phone_raw
+
+                    mensajes.append(
+                        {
+                            "phone_number": phone_number,
+                            "nombre": alias_waba,
+                            "alias_waba": alias_waba,
+                            "mensaje": mensaje_texto,
+                            "message_type": message_type,
+                            "wa_message_id": message.get("id"),
+                            "timestamp": int(message.get("timestamp", time.time())),
+                            "raw_message": message,
+                            "metadata": metadata,
+                            "flow_response_json": flow_response_json,
+                            "flow_client_data": flow_client_data,
+                        }
+                    )
+                for status in value.get("statuses", []) or []:
+                    statuses.append(status)
+    except Exception as exc:
+        logger.error("Error extrayendo eventos de WhatsApp: %s", exc)
+    return mensajes, statuses
+
+
+def procesar_statuses(statuses: list[dict]) -> int:
+    actualizados = 0
+    for status in statuses:
+        wa_message_id = status.get("id")
+        status_value = status.get("status")
+        timestamp = status.get("timestamp")
+        if not wa_message_id or not status_value:
+            continue
+        update = {"delivery_status": status_value}
+        if timestamp:
+            update["delivery_timestamp_ms"] = int(timestamp) * 1000
+        actualizados += Mensaje.objects.filter(
+            direccion="out", wa_message_id=wa_message_id
+        ).update(**update)
+    return actualizados
+
+
+def encolar_mensajes(mensajes: list[dict]) -> dict:
+    """Registra los mensajes del payload en un solo lote; ver registrar_entradas."""
+    mensajes_ordenados = sorted(
+        mensajes,
+        key=lambda m: (m.get("timestamp", 0), m.get("wa_message_id") or ""),
+    )
+    ahora_ms = int(time.time() * 1000)
+    entradas = []
+    for datos in mensajes_ordenados:
+        metadata = datos.get("metadata") or {}
+        flow_response_json = datos.get("flow_response_json")
+        flow_client_data = datos.get("flow_client_data")
+        inbound_metadata = {
+            "raw": datos.get("raw_message"),
+            "alias_waba": datos.get("alias_waba"),
+            "phone_number_id": metadata.get("phone_number_id"),
+        }
+        if flow_response_json is not None:
+            inbound_metadata["flow_response_json"] = flow_response_json
+        if flow_client_data:
+            inbound_metadata["flow_client_data"] = flow_client_data
+        entradas.append(
+            GestorMensajes.nueva_entrada(
+                phone_number=datos["phone_number"],
+                nombre=datos.get("nombre") or "",
+                contenido=datos.get("mensaje") or "",
+                tipo=datos.get("message_type") or "text",
+                timestamp_ms=datos.get("timestamp", int(time.time())) * 1000,
+                wa_message_id=datos.get("wa_message_id"),
+                metadata=inbound_metadata,
+                queue_status="pending",
+                process_after_ms=ahora_ms,
+            )
+        )
+    resultado = GestorMensajes.registrar_entradas(entradas)
+    if resultado["nuevos"]:
+        notificar_cola("in")
+    if resultado["duplicados"]:
+        logger.info("Webhook con %s mensajes ya registrados (reintento de Meta).", resultado["duplicados"])
+    return resultado
+
+
+def expandir_eventos(data: Any) -> dict:
+    """Encola los mensajes y aplica los estados de un payload ya parseado."""
+    mensajes, statuses = extraer_eventos_whatsapp(data)
+    registrados = encolar_mensajes(mensajes) if mensajes else {"nuevos": 0, "duplicados": 0}
+    actualizados = procesar_statuses(statuses) if statuses else 0
+    return {
+        "encolados": registrados["nuevos"],
+        "duplicados": registrados["duplicados"],
+        "statuses": actualizados,
+    }
+
+
+def guardar_en_inbox(cuerpo: bytes) -> WebhookInbox:
+    """Guarda el cuerpo crudo con un solo INSERT y despierta al worker."""
+    fila = WebhookInbox.objects.create(
+        payload=cuerpo.decode("utf-8", errors="replace"),
+        recibido_ms=int(time.time() * 1000),
+    )
+    notificar_cola("in")
+    return fila
+
+
+def expandir_inbox(limit: int | None = None) -> dict:
+    """Expande las filas pendientes del inbox en orden de llegada.
+
+    Las filas se toman con SKIP LOCKED, asi varios workers no expanden el
+    mismo webhook. Cada fila corre en su savepoint: si falla queda marcada
+    con el error y no bloquea a las siguientes.
+    """
+    limit = limit or int(getattr(settings, "WEBHOOK_INBOX_BATCH_SIZE", 50))
+    resultado = {"webhooks": 0, "encolados": 0, "duplicados": 0, "statuses": 0, "errores": 0}
+    with transaction.atomic():
+        filas = list(
+            WebhookInbox.objects.select_for_update(skip_locked=True)
+            .filter(procesado_ms__isnull=True)
+            .order_by("id")[:limit]
+        )
+        for fila in filas:
+            try:
+                with transaction.atomic():
+                    expandido = expandir_eventos(json.loads(fila.payload))
+                for clave in ("encolados", "duplicados", "statuses"):
+                    resultado[clave] += expandido[clave]
+            except Exception as exc:
+                logger.exception("No se pudo expandir el webhook %s", fila.pk)
+                fila.error = str(exc)[:1000]
+                resultado["errores"] += 1
+            fila.procesado_ms = int(time.time() * 1000)
+        if filas:
+            WebhookInbox.objects.bulk_update(filas, ["procesado_ms", "error"])
+    resultado["webhooks"] = len(filas)
+    return resultado
+
+
+def purgar_inbox(retencion_horas: float | None = None) -> int:
+    """Borra los webhooks ya expandidos mas viejos que la retencion."""
+    if retencion_horas is None:
+        retencion_horas = float(getattr(settings, "WEBHOOK_INBOX_RETENTION_HOURS", 72))
+    limite_ms = int((time.time() - retencion_horas * 3600) * 1000)
+    borrados, _ = WebhookInbox.objects.filter(procesado_ms__lt=limite_ms).delete()
+    return borrados
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from app.models.waba_config import WabaConfig
+from app.services import cache_bus
+from app.services.waba_config import clear_waba_config_cache, get_active_waba_config
+
+
+class CacheBusTests(TestCase):
+    def setUp(self):
+        self.recibidas: list[str] = []
+        cache_bus.suscribir("test_topico", self.recibidas.append)
+        self.addCleanup(cache_bus._suscriptores.pop, "test_topico", None)
+
+    def test_publicar_invalida_local_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cache_bus.publicar_invalidacion("test_topico", 7)
+            assert self.recibidas == []
+        assert self.recibidas == ["7"]
+
+    def test_aviso_de_otro_proceso_invalida_y_el_propio_se_ignora(self):
+        cache_bus._handle_notify(SimpleNamespace(payload=f"test_topico:3:{cache_bus.ORIGEN}"))
+        cache_bus._handle_notify(SimpleNamespace(payload="test_topico:4:999-abcd"))
+        assert self.recibidas == ["4"]
+
+    @override_settings(CACHE_BUS_TTL_SECONDS=7200)
+    def test_ttl_largo_solo_con_listener_activo(self):
+        assert cache_bus.ttl_cache(5) == 5
+        with patch("app.services.cache_bus.cache_listener_activo", return_value=True):
+            assert cache_bus.ttl_cache(5) == 7200
+
+
+class WabaConfigCacheTests(TestCase):
+    def setUp(self):
+        clear_waba_config_cache()
+
+    def test_cachea_la_ausencia_de_config(self):
+        with self.assertNumQueries(1):
+            assert get_active_waba_config() is None
+            assert get_active_waba_config() is None
+
+    def test_guardar_config_descarta_la_cache(self):
+        assert get_active_waba_config() is None
+        config = WabaConfig.objects.create(
+            name="principal", active=True, phone_id="123", access_token="token"
+        )
+        assert get_active_waba_config() == config
+        config.access_token = "revocado"
+        config.save()
+        assert get_active_waba_config().access_token == "revocado"
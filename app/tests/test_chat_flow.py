@@ -1,8 +1,12 @@
 import json
 import time
+from unittest import skipUnless
 from unittest.mock import patch
 
+from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from app.models.cliente import Cliente
 from app.models.config import Config
@@ -12,11 +16,17 @@ from app.models.mensaje import Mensaje
 from app.models.respuesta import Respuesta
 from app.models.sesion import Sesion
 from app.models.waba_config import WabaConfig
+from app.services.gestor_cliente import GestorCliente
 from app.services.gestor_contenido import GestorContenido
+from app.services.interactive_builder import (
+    build_flow_interactive_payload,
+    build_menu_interactive_payloads,
+)
 from app.services.queue_processor import (
     procesar_inbound_pendientes,
     procesar_outbound_pendientes,
 )
+from app.services.repositorio_contenido import obtener_contenido, version_contenido
 from app.services.waba_config import clear_waba_config_cache
 from app import views
 
@@ -71,6 +81,153 @@ class ContenidoFormattingTests(TestCase):
         assert "Menu principal > Instalaciones" in resultado
 
 
+@override_settings(DATABASES=TEST_DB)
+class RepositorioContenidoTests(TestCase):
+    def setUp(self):
+        self.menu = Menu.objects.create(id="0", titulo="Menu", contenido="", is_main=True)
+        self.respuesta = Respuesta.objects.create(id="R1", categoria="info", contenido="Uno")
+        MenuOption.objects.create(
+            menu=self.menu, key="1", label="Opcion 1", target_respuesta=self.respuesta, orden=1
+        )
+
+    def test_lecturas_sin_consultas_con_la_version_vigente(self):
+        GestorContenido.obtener_menu("0")
+        with self.assertNumQueries(0):
+            menu = GestorContenido.obtener_menu_principal()
+            assert GestorContenido.obtener_opcion("0", "1").target_respuesta_id == "R1"
+            assert "1 Opcion 1" in GestorContenido.formatear_menu(menu)
+            assert GestorContenido.obtener_respuesta("R1").contenido == "Uno"
+            assert GestorContenido.obtener_config_mensaje("bienvenida") is None
+
+    def test_signals_invalidan_la_instantanea(self):
+        version = version_contenido()
+        assert GestorContenido.obtener_respuesta("R1").contenido == "Uno"
+
+        self.respuesta.contenido = "Dos"
+        self.respuesta.save()
+        MenuOption.objects.filter(menu=self.menu).delete()
+        Config.objects.create(id="mensaje_bienvenida", seccion="mensajes", valor={"contenido": "Hola"})
+
+        assert version_contenido() > version
+        assert GestorContenido.obtener_respuesta("R1").contenido == "Dos"
+        assert GestorContenido.obtener_opcion("0", "1") is None
+        assert GestorContenido.obtener_config_mensaje("bienvenida") == "Hola"
+
+    def test_renders_precalentados_no_se_recalculan(self):
+        submenu = Menu.objects.create(
+            id="2", titulo="Sub", contenido="", parent=self.menu, flow_id="F1"
+        )
+        MenuOption.objects.create(menu=submenu, key="A", label="Uno", target_respuesta=self.respuesta)
+        instantanea = obtener_contenido()
+        cacheado = instantanea.menus["2"]
+        assert GestorContenido.precalentar_render(instantanea) == 4
+
+        with patch.object(GestorContenido, "_agregar_navegacion") as agregar, patch(
+            "app.services.interactive_builder._build_options"
+        ) as opciones:
+            texto = GestorContenido.formatear_menu(cacheado)
+            respuesta = GestorContenido.formatear_respuesta(
+                instantanea.respuestas["R1"], menu_contexto_id="2"
+            )
+            payloads = build_menu_interactive_payloads(cacheado, body_text="Sub")
+        agregar.assert_not_called()
+        opciones.assert_not_called()
+        assert "A Uno" in texto
+        assert "Menu principal > Sub" in respuesta
+        payloads[0]["body"]["text"] = "modificado"
+        assert build_menu_interactive_payloads(cacheado, "Sub")[0]["body"]["text"] == "Sub"
+
+        flow = build_flow_interactive_payload(cacheado, body_text="Sub")
+        parametros = flow["action"]["parameters"]
+        assert parametros["flow_token"].startswith("menu_2_")
+        parametros["flow_token"] = ""
+        otro = build_flow_interactive_payload(cacheado, body_text="Sub")
+        assert otro["action"]["parameters"]["flow_token"].startswith("menu_2_")
+
+    def test_breadcrumb_desde_ancestros_precalculados(self):
+        padre = self.menu
+        for nivel in range(1, 4):
+            padre = Menu.objects.create(
+                id=f"N{nivel}", titulo=f"Nivel {nivel}", contenido="", parent=padre
+            )
+        instantanea = obtener_contenido()
+        assert instantanea.ancestros["N3"] == ("0", "N1", "N2", "N3")
+
+        with self.assertNumQueries(0):
+            ruta = GestorContenido.construir_ruta_menu(instantanea.menus["N3"])
+        assert ruta == "Menu principal > Nivel 1 > Nivel 2 > Nivel 3"
+        assert GestorContenido.construir_ruta_menu(instantanea.menus["N3"], max_depth=2) == (
+            "Menu principal > Nivel 2 > Nivel 3"
+        )
+
+    def test_clean_rechaza_ciclos_de_menus(self):
+        hijo = Menu.objects.create(id="H", titulo="Hijo", contenido="", parent=self.menu)
+        nieto = Menu.objects.create(id="N", titulo="Nieto", contenido="", parent=hijo)
+        self.menu.parent = nieto
+        with self.assertRaises(ValidationError):
+            self.menu.clean()
+        nieto.parent = self.menu
+        nieto.clean()
+
+    def test_save_rechaza_ciclos_de_menus(self):
+        hijo = Menu.objects.create(id="H", titulo="Hijo", contenido="", parent=self.menu)
+        self.menu.parent = hijo
+        with self.assertRaises(ValidationError):
+            self.menu.save()
+        assert Menu.objects.get(pk="0").parent_id is None
+        hijo.parent = None
+        hijo.save(update_fields=["parent"])
+
+    @override_settings(CONTENT_CACHE_TTL_SECONDS=0.01)
+    def test_ttl_relee_cambios_de_otros_procesos(self):
+        assert GestorContenido.obtener_respuesta("R1").contenido == "Uno"
+        Respuesta.objects.filter(pk="R1").update(contenido="Dos")
+        assert GestorContenido.obtener_respuesta("R1").contenido == "Uno"
+        time.sleep(0.02)
+        assert GestorContenido.obtener_respuesta("R1").contenido == "Dos"
+
+
+@override_settings(DATABASES=TEST_DB)
+class GestorClienteTests(TestCase):
+    def test_contabilizar_contacto_crea_y_suma(self):
+        cliente, es_nuevo, previo_ms = GestorCliente.contabilizar_contacto(
+            "+541100000090", "", "hola", alias_waba="Ana"
+        )
+        assert (es_nuevo, previo_ms, cliente.mensajes_totales) == (True, None, 1)
+
+        cliente, es_nuevo, previo_ms = GestorCliente.contabilizar_contacto(
+            "+541100000090", "Ana Perez", "1", alias_waba="Otro"
+        )
+        assert es_nuevo is False
+        assert previo_ms is not None
+        assert cliente.mensajes_totales == 2
+
+        cliente = Cliente.objects.get(phone_number="+541100000090")
+        assert (cliente.mensajes_totales, cliente.ultimo_mensaje) == (2, "1")
+        assert (cliente.nombre, cliente.alias_waba) == ("Ana Perez", "Ana")
+
+    def test_contabilizar_contacto_no_pisa_incrementos_ajenos(self):
+        GestorCliente.contabilizar_contacto("+541100000091", "", "hola")
+        # Otro worker sumo un mensaje entre medio.
+        Cliente.objects.filter(phone_number="+541100000091").update(mensajes_totales=5)
+        GestorCliente.contabilizar_contacto("+541100000091", "", "de nuevo")
+        assert Cliente.objects.get(phone_number="+541100000091").mensajes_totales == 6
+
+
+@skipUnless(connection.vendor == "postgresql", "UPSERT_CONTACTO_SQL es solo para Postgres")
+class GestorClientePostgresTests(TestCase):
+    def test_upsert_marca_creado_y_retorna_el_contacto_previo(self):
+        primero, creado, previo_ms = GestorCliente._contabilizar_sql("+541100000092", "", "hola", "Ana")
+        assert (creado, previo_ms, primero.mensajes_totales) == (True, None, 1)
+
+        segundo, creado, previo_ms = GestorCliente._contabilizar_sql("+541100000092", "Ana Perez", "1", "Otro")
+        assert creado is False
+        assert previo_ms == primero.ultimo_contacto_ms
+        assert segundo.pk == primero.pk
+        assert segundo.mensajes_totales == 2
+        assert (segundo.nombre, segundo.alias_waba) == ("Ana Perez", "Ana")
+
+
 @override_settings(
     DATABASES=TEST_DB,
     WHATSAPP_VERIFY_TOKEN="test-token",
@@ -837,6 +994,32 @@ class WebhookFlowTests(TestCase):
         assert "Sesion expirada" in enviado_texto
         assert "Menu" in enviado_texto
 
+    @patch("app.services.cliente_whatsapp.ClienteWhatsApp.marcar_como_leido", return_value=True)
+    @patch(
+        "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
+        return_value={"ok": True, "message_id": "wamid.out"},
+    )
+    def test_sesion_archivada_por_el_barrido_reinicia_menu(self, mocked_send, mocked_read):
+        self.client.post(
+            "/webhook/mensajes",
+            data=json.dumps(self._payload("hola")),
+            content_type="application/json",
+        )
+        procesar_inbound_pendientes(limit=10)
+        procesar_outbound_pendientes(limit=10)
+        Sesion.objects.all().delete()
+
+        self.client.post(
+            "/webhook/mensajes",
+            data=json.dumps(self._payload("1")),
+            content_type="application/json",
+        )
+        procesar_inbound_pendientes(limit=10)
+        procesar_outbound_pendientes(limit=10)
+        enviado_texto = mocked_send.call_args[0][1]
+        assert "Sesion expirada" in enviado_texto
+        assert Sesion.objects.get().estado_actual == "0"
+
     @patch("app.services.cliente_whatsapp.ClienteWhatsApp.marcar_como_leido", return_value=True)
     @patch(
         "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
@@ -941,3 +1124,78 @@ class WebhookFlowTests(TestCase):
         procesar_outbound_pendientes(limit=10)
         enviado_texto = mocked_send.call_args[0][1]
         assert "elegi una opcion del menu" in enviado_texto.lower()
+
+    @override_settings(QUEUE_INBOUND_COALESCE=True)
+    @patch("app.services.cliente_whatsapp.ClienteWhatsApp.marcar_como_leido", return_value=True)
+    @patch(
+        "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
+        return_value={"ok": True, "message_id": "wamid.out"},
+    )
+    def test_rafaga_responde_solo_al_ultimo_mensaje(self, mocked_send, mocked_read):
+        self.client.post(
+            "/webhook/mensajes",
+            data=json.dumps(self._payload("hola")),
+            content_type="application/json",
+        )
+        procesar_inbound_pendientes(limit=10)
+        procesar_outbound_pendientes(limit=10)
+        for texto in ("2", "A"):
+            self.client.post(
+                "/webhook/mensajes",
+                data=json.dumps(self._payload(texto)),
+                content_type="application/json",
+            )
+        salientes_previos = Mensaje.objects.filter(direccion="out").count()
+        procesar_inbound_pendientes(limit=10)
+
+        assert Mensaje.objects.filter(direccion="out").count() == salientes_previos + 1
+        intermedio = Mensaje.objects.get(direccion="in", contenido="2")
+        ultimo = Mensaje.objects.get(direccion="in", contenido="A")
+        assert intermedio.queue_status == "processed"
+        assert intermedio.metadata_json.get("coalesced") is True
+        assert "coalesced" not in ultimo.metadata_json
+
+        procesar_outbound_pendientes(limit=10)
+        enviado_texto = mocked_send.call_args[0][1]
+        assert "Contenido con nav" in enviado_texto
+        assert "Estas en: Menu principal > Submenu" in enviado_texto
+
+    @patch("app.services.cliente_whatsapp.ClienteWhatsApp.marcar_como_leido", return_value=True)
+    @patch(
+        "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
+        return_value={"ok": True, "message_id": "wamid.out"},
+    )
+    def test_inbound_lee_y_escribe_cliente_y_sesion_una_vez(self, mocked_send, mocked_read):
+        self.client.post(
+            "/webhook/mensajes",
+            data=json.dumps(self._payload("hola")),
+            content_type="application/json",
+        )
+        procesar_inbound_pendientes(limit=10)
+        procesar_outbound_pendientes(limit=10)
+        self.client.post(
+            "/webhook/mensajes",
+            data=json.dumps(self._payload("2")),
+            content_type="application/json",
+        )
+
+        with CaptureQueriesContext(connection) as consultas:
+            assert procesar_inbound_pendientes(limit=10) == 1
+
+        def contar(fragmento: str) -> int:
+            return sum(1 for consulta in consultas.captured_queries if fragmento in consulta["sql"])
+
+        assert contar('FROM "clientes"') == 1
+        assert contar('FROM "sesiones"') == 1
+        assert contar('UPDATE "clientes"') == 1
+        assert contar('UPDATE "sesiones"') == 1
+        # Contenido y config WABA salen de las caches cargadas con el primer mensaje.
+        for tabla in ("menus", "menu_opciones", "respuestas", "config", "waba_config"):
+            assert contar(f'FROM "{tabla}"') == 0, tabla
+        # Reclamo (3) + sesion y cliente (4) + respuesta encolada (2) + cierre del lote (3).
+        sentencias = [
+            consulta["sql"]
+            for consulta in consultas.captured_queries
+            if "SAVEPOINT" not in consulta["sql"]
+        ]
+        assert len(sentencias) == 12, sentencias
@@ -0,0 +1,150 @@
+import random
+from typing import List, Optional
+
+from django.test import TestCase
+
+from app.models.menu import Menu
+from app.models.menu_option import MenuOption
+from app.models.respuesta import Respuesta
+from app.services.navegador import NavigadorBot
+from app.services.validador import ValidadorEntrada
+
+
+def _navegar_con_orm(
+    entrada: str,
+    historial_actual: List[str],
+    estado_actual: str,
+    ultimo_tipo: Optional[str] = None,
+):
+    """Navegador de referencia: la logica previa a la tabla compilada, con consultas."""
+    validacion = ValidadorEntrada.validar(entrada)
+    if not validacion.es_valido:
+        return estado_actual, historial_actual, "error", "", False
+
+    accion = validacion.accion
+    target = validacion.target
+    nuevo_historial = list(historial_actual)
+    tipo_contenido = "menu"
+
+    if accion == "ir_menu_principal":
+        nuevo_historial = ["0"]
+        nuevo_estado = "0"
+        target = "0"
+    elif accion == "ir_club_beneficios":
+        principal = (
+            Menu.objects.filter(is_main=True, activo=True).order_by("pk").first()
+            or Menu.objects.filter(id="0", activo=True).first()
+        )
+        opcion_club = None
+        if principal:
+            for opcion in MenuOption.objects.filter(menu=principal, activo=True).order_by("orden", "pk"):
+                label = opcion.label.lower()
+                if "club" in label and any(t in label for t in ("beneficio", "promo", "descuento")):
+                    opcion_club = opcion
+                    break
+        nuevo_historial = ["0"]
+        if opcion_club and opcion_club.target_menu_id:
+            nuevo_estado = opcion_club.target_menu_id
+            if nuevo_estado not in nuevo_historial:
+                nuevo_historial.append(nuevo_estado)
+            target = opcion_club.target_menu_id
+        elif opcion_club and opcion_club.target_respuesta_id:
+            nuevo_estado = "0"
+            tipo_contenido = "respuesta"
+            target = opcion_club.target_respuesta_id
+        else:
+            nuevo_estado = "0"
+            target = "0"
+    elif accion == "volver_anterior":
+        if ultimo_tipo == "respuesta":
+            nuevo_estado = estado_actual
+        else:
+            if len(nuevo_historial) > 1:
+                nuevo_historial.pop()
+            nuevo_estado = nuevo_historial[-1] if nuevo_historial else "0"
+        target = nuevo_estado
+    elif accion == "seleccionar_opcion":
+        opcion = MenuOption.objects.filter(menu_id=estado_actual, key=target, activo=True).first()
+        if not opcion:
+            return estado_actual, historial_actual, "error", "", False
+        if opcion.target_menu_id:
+            nuevo_estado = opcion.target_menu_id
+            if nuevo_estado not in nuevo_historial:
+                nuevo_historial.append(nuevo_estado)
+            target = opcion.target_menu_id
+        elif opcion.target_respuesta_id:
+            nuevo_estado = estado_actual
+            tipo_contenido = "respuesta"
+            target = opcion.target_respuesta_id
+        else:
+            return estado_actual, historial_actual, "error", "", False
+    elif accion == "mostrar_ayuda":
+        nuevo_estado = estado_actual
+        tipo_contenido = "help"
+    else:
+        return estado_actual, historial_actual, "error", "", False
+
+    return nuevo_estado, nuevo_historial, tipo_contenido, target, True
+
+
+class AutomataNavegacionTests(TestCase):
+    def _sembrar(self, semilla: int) -> list[str]:
+        azar = random.Random(semilla)
+        menus = [Menu.objects.create(id="0", titulo="Menu", contenido="", is_main=azar.random() < 0.8)]
+        for idx in range(1, 9):
+            menus.append(
+                Menu.objects.create(
+                    id=f"M{idx}",
+                    titulo=f"Menu {idx}",
+                    contenido="",
+                    parent=azar.choice(menus),
+                    activo=azar.random() < 0.85,
+                )
+            )
+        respuestas = [
+            Respuesta.objects.create(id=f"R{idx}", categoria="info", contenido=f"R{idx}")
+            for idx in range(6)
+        ]
+        for menu in menus:
+            claves = azar.sample([str(n) for n in range(1, 13)] + list("ABCa"), azar.randint(0, 6))
+            for orden, clave in enumerate(claves):
+                destino = azar.random()
+                MenuOption.objects.create(
+                    menu=menu,
+                    key=clave,
+                    label=azar.choice(["Opcion", "Club de beneficios", "Promos del club"]),
+                    target_menu=azar.choice(menus) if destino < 0.45 else None,
+                    target_respuesta=azar.choice(respuestas) if 0.45 <= destino < 0.9 else None,
+                    orden=azar.randint(0, 3),
+                    activo=azar.random() < 0.9,
+                )
+        return [menu.id for menu in menus]
+
+    def test_coincide_con_el_navegador_orm(self):
+        entradas = (
+            [str(n) for n in range(0, 14)]
+            + list("ABCDa")
+            + ["MENU", "club", "PROMOS", "#", "volver", "*", "ayuda", "hola", "texto libre", ""]
+        )
+        historiales = [["0"], ["0", "M1"], ["0", "M1", "M2"], []]
+        for semilla in range(3):
+            with self.subTest(semilla=semilla):
+                estados = self._sembrar(semilla) + ["R1", "X"]
+                for estado in estados:
+                    for entrada in entradas:
+                        for historial in historiales:
+                            for ultimo_tipo in (None, "menu", "respuesta"):
+                                esperado = _navegar_con_orm(entrada, historial, estado, ultimo_tipo)
+                                obtenido = NavigadorBot.procesar_entrada(
+                                    entrada, historial, estado, ultimo_tipo
+                                )
+                                assert obtenido == esperado, (estado, entrada, historial, ultimo_tipo)
+                Menu.objects.all().delete()
+                Respuesta.objects.all().delete()
+
+    def test_paso_de_navegacion_sin_consultas(self):
+        self._sembrar(0)
+        NavigadorBot.procesar_entrada("1", ["0"], "0")
+        with self.assertNumQueries(0):
+            for entrada in ("1", "2", "A", "club", "#", "0"):
+                NavigadorBot.procesar_entrada(entrada, ["0"], "0")
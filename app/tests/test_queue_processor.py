@@ -0,0 +1,662 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest import skipIf, skipUnless
+from unittest.mock import patch
+
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from app.models.cola_mensaje import ColaMensaje
+from app.models.mensaje import Mensaje
+from app.services.cliente_whatsapp import ClienteWhatsApp
+from app.services.gestor_mensajes import GestorMensajes
+from app.services import queue_processor
+from app.services.outbound_agenda import agenda_outbound
+from app.services.queue_processor import (
+    RepositorioCola,
+    liberar_reclamados,
+    procesar_inbound_pendientes,
+    procesar_outbound_pendientes,
+    recuperar_leases_vencidos,
+    reencolar_descartados,
+)
+
+
+def _crear_outbound(phone_number: str, contenido: str, **extra) -> Mensaje:
+    ahora_ms = int(time.time() * 1000)
+    datos = dict(
+        phone_number=phone_number,
+        nombre="Tester",
+        direccion="out",
+        tipo="text",
+        contenido=contenido,
+        timestamp_ms=ahora_ms,
+        queue_status="queued",
+        process_after_ms=ahora_ms - 1,
+    )
+    datos.update(extra)
+    return _encolar(Mensaje.objects.create(**datos))
+
+
+def _encolar(mensaje: Mensaje) -> Mensaje:
+    """Crea la fila de cola que corresponde al estado del mensaje."""
+    if mensaje.queue_status in ("pending", "queued", "processing"):
+        ColaMensaje.encolar(mensaje)
+        ColaMensaje.objects.filter(mensaje=mensaje).update(locked_at_ms=mensaje.locked_at_ms)
+    return mensaje
+
+
+def _estado(mensaje: Mensaje) -> SimpleNamespace:
+    """Estado efectivo: la fila de cola mientras exista, si no el log del mensaje."""
+    mensaje.refresh_from_db()
+    fila = ColaMensaje.objects.filter(mensaje=mensaje).first()
+    if fila:
+        return SimpleNamespace(
+            queue_status=fila.status,
+            attempts=fila.attempts,
+            process_after_ms=fila.due_at_ms,
+            locked_at_ms=fila.locked_at_ms,
+        )
+    return SimpleNamespace(
+        queue_status=mensaje.queue_status,
+        attempts=mensaje.attempts,
+        process_after_ms=mensaje.process_after_ms,
+        locked_at_ms=mensaje.locked_at_ms,
+    )
+
+
+@override_settings(OUTBOUND_DROP_IF_NEWER_INBOUND="False")
+class OutboundDispatcherTests(TestCase):
+    def _fake_send(self, delay: float):
+        lock = threading.Lock()
+        estado = {"activos": 0, "max_activos": 0, "enviados": []}
+
+        def enviar(phone_number, texto, clase="reply"):
+            with lock:
+                estado["activos"] += 1
+                estado["max_activos"] = max(estado["max_activos"], estado["activos"])
+            time.sleep(delay)
+            with lock:
+                estado["activos"] -= 1
+                estado["enviados"].append((phone_number, texto))
+            return {"ok": True, "message_id": f"wamid.{phone_number}.{texto}"}
+
+        return enviar, estado
+
+    @override_settings(OUTBOUND_MAX_CONCURRENCY=3)
+    def test_envia_en_paralelo_respetando_orden_y_limite(self):
+        phones = [f"+5491100000{idx}" for idx in range(6)]
+        for phone_number in phones:
+            _crear_outbound(phone_number, "confirmacion")
+            _crear_outbound(phone_number, "menu")
+
+        enviar, estado = self._fake_send(delay=0.03)
+        with patch(
+            "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
+            side_effect=enviar,
+        ):
+            enviados = procesar_outbound_pendientes(limit=20)
+
+        assert enviados == 12
+        assert 1 < estado["max_activos"] <= 3
+        for phone_number in phones:
+            orden = [texto for phone, texto in estado["enviados"] if phone == phone_number]
+            assert orden == ["confirmacion", "menu"]
+        assert Mensaje.objects.filter(direccion="out", queue_status="sent").count() == 12
+
+    @override_settings(OUTBOUND_MAX_CONCURRENCY=4)
+    def test_no_reclama_telefono_con_envio_en_curso(self):
+        _crear_outbound("+541100000001", "en curso", queue_status="processing")
+        pendiente = _crear_outbound("+541100000001", "siguiente")
+        otro = _crear_outbound("+541100000002", "otro")
+
+        with patch(
+            "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
+            return_value={"ok": True, "message_id": "wamid.out"},
+        ) as mocked_send:
+            procesar_outbound_pendientes(limit=10)
+
+        assert mocked_send.call_count == 1
+        assert _estado(pendiente).queue_status == "queued"
+        assert _estado(otro).queue_status == "sent"
+
+
+@override_settings(QUEUE_VISIBILITY_TIMEOUT_SECONDS=60, QUEUE_MAX_ATTEMPTS=3)
+class LeaseReaperTests(TestCase):
+    def test_reencola_o_descarta_leases_vencidos(self):
+        ahora_ms = int(time.time() * 1000)
+        vencido_ms = ahora_ms - 61_000
+        inbound = _encolar(
+            Mensaje.objects.create(
+                phone_number="+541100000001",
+                direccion="in",
+                contenido="hola",
+                timestamp_ms=ahora_ms,
+                queue_status="processing",
+                locked_at_ms=vencido_ms,
+                attempts=1,
+            )
+        )
+        outbound = _crear_outbound(
+            "+541100000002", "menu", queue_status="processing", locked_at_ms=vencido_ms, attempts=1
+        )
+        agotado = _crear_outbound(
+            "+541100000003", "menu", queue_status="processing", locked_at_ms=vencido_ms, attempts=3
+        )
+        vigente = _crear_outbound(
+            "+541100000004", "menu", queue_status="processing", locked_at_ms=ahora_ms, attempts=1
+        )
+
+        resultado = recuperar_leases_vencidos(now_ms=ahora_ms)
+
+        assert resultado == {"reencolados": 2, "descartados": 1}
+        assert _estado(inbound).queue_status == "pending"
+        assert _estado(outbound).queue_status == "queued"
+        assert _estado(outbound).locked_at_ms is None
+        assert _estado(agotado).queue_status == "dead"
+        assert _estado(vigente).queue_status == "processing"
+
+    def test_caida_a_mitad_del_lote_no_duplica_respuestas(self):
+        primero = GestorMensajes.registrar_entrada("+541100000006", "Tester", "hola", "text")
+        segundo = GestorMensajes.registrar_entrada("+541100000007", "Tester", "hola", "text")
+        procesar = queue_processor._procesar_mensaje_inbound
+
+        def procesar_y_caer(mensaje, **kwargs):
+            if mensaje.id == segundo.id:
+                raise KeyboardInterrupt  # el proceso muere; no es un error del mensaje
+            procesar(mensaje, **kwargs)
+
+        with patch.object(queue_processor, "_procesar_mensaje_inbound", side_effect=procesar_y_caer):
+            with self.assertRaises(KeyboardInterrupt):
+                procesar_inbound_pendientes(limit=10)
+
+        recuperar_leases_vencidos(now_ms=int(time.time() * 1000) + 61_000)
+        assert _estado(primero).queue_status == "processed"
+        assert _estado(segundo).queue_status == "pending"
+
+        ColaMensaje.objects.filter(mensaje=segundo).update(due_at_ms=0)
+        assert procesar_inbound_pendientes(limit=10) == 1
+        respuestas = Mensaje.objects.filter(direccion="out").values_list("phone_number", flat=True)
+        assert sorted(respuestas) == [primero.phone_number, segundo.phone_number]
+
+    def test_lease_perdido_no_confirma_la_respuesta(self):
+        mensaje = GestorMensajes.registrar_entrada("+541100000008", "Tester", "hola", "text")
+        procesar = queue_processor._procesar_mensaje_inbound
+
+        def procesar_y_perder_lease(mensaje, **kwargs):
+            procesar(mensaje, **kwargs)
+            # El reaper lo reencolo y otro worker lo reclamo: el lease ya no es este.
+            mensaje.locked_at_ms -= 1
+
+        with patch.object(
+            queue_processor, "_procesar_mensaje_inbound", side_effect=procesar_y_perder_lease
+        ):
+            assert procesar_inbound_pendientes(limit=10) == 0
+
+        assert _estado(mensaje).queue_status == "processing"
+        assert not Mensaje.objects.filter(direccion="out").exists()
+
+    @override_settings(OUTBOUND_DROP_IF_NEWER_INBOUND="False")
+    def test_resultado_con_lease_perdido_no_pisa_estado(self):
+        mensaje = _crear_outbound("+541100000005", "menu")
+
+        def enviar(phone_number, texto, clase="reply"):
+            # Mientras se envia, el reaper da el lease por vencido y lo reencola.
+            ColaMensaje.objects.filter(mensaje=mensaje).update(status="queued", locked_at_ms=None)
+            return {"ok": True, "message_id": "wamid.out"}
+
+        with patch(
+            "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
+            side_effect=enviar,
+        ):
+            procesar_outbound_pendientes(limit=10)
+
+        assert _estado(mensaje).queue_status == "queued"
+
+
+THROTTLED = {"ok": False, "message_id": None, "response": "throttled", "retryable": True}
+RECHAZADO = {"ok": False, "message_id": None, "response": "invalid", "retryable": False}
+SIN_CUPO = {"ok": False, "message_id": None, "error": ClienteWhatsApp.SIN_CUPO, "retryable": True}
+
+
+@override_settings(OUTBOUND_DROP_IF_NEWER_INBOUND="False", QUEUE_MAX_ATTEMPTS=3)
+class OutboundRetryTests(TestCase):
+    def _enviar(self, **kwargs):
+        with patch(
+            "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
+            **kwargs,
+        ) as mocked_send:
+            procesar_outbound_pendientes(limit=10)
+        return mocked_send
+
+    def test_clasifica_errores_de_graph(self):
+        def respuesta(status_code, code=None):
+            return SimpleNamespace(
+                status_code=status_code,
+                text="{}",
+                json=lambda: {"error": {"code": code}} if code else {},
+            )
+
+        assert ClienteWhatsApp._resultado_error(respuesta(429))["retryable"]
+        assert ClienteWhatsApp._resultado_error(respuesta(503))["retryable"]
+        assert ClienteWhatsApp._resultado_error(respuesta(400, code=131056))["retryable"]
+        assert not ClienteWhatsApp._resultado_error(respuesta(400, code=131026))["retryable"]
+
+    def test_fallo_transitorio_se_reprograma_con_backoff(self):
+        mensaje = _crear_outbound("+541100000010", "hola")
+        antes_ms = int(time.time() * 1000)
+        self._enviar(return_value=THROTTLED)
+
+        estado = _estado(mensaje)
+        assert estado.queue_status == "queued"
+        assert estado.attempts == 1
+        assert mensaje.error == "throttled"
+        assert estado.process_after_ms >= antes_ms + 1000
+
+    def test_fallo_permanente_no_se_reintenta(self):
+        mensaje = _crear_outbound("+541100000011", "hola")
+        self._enviar(return_value=RECHAZADO)
+
+        assert _estado(mensaje).queue_status == "failed"
+
+    def test_agota_intentos_y_pasa_a_dead(self):
+        mensaje = _crear_outbound("+541100000012", "hola", attempts=2)
+        self._enviar(return_value=THROTTLED)
+
+        estado = _estado(mensaje)
+        assert estado.queue_status == "dead"
+        assert estado.attempts == 3
+        assert not ColaMensaje.objects.filter(mensaje=mensaje).exists()
+
+        assert reencolar_descartados(Mensaje.objects.filter(id=mensaje.id)) == 1
+        estado = _estado(mensaje)
+        assert estado.queue_status == "queued"
+        assert estado.attempts == 0
+
+    @override_settings(OUTBOUND_MAX_AGE_SECONDS=60)
+    def test_no_reprograma_fuera_de_max_age(self):
+        viejo_ms = int(time.time() * 1000) - 59_500
+        mensaje = _crear_outbound("+541100000013", "hola", timestamp_ms=viejo_ms)
+        self._enviar(return_value=THROTTLED)
+
+        assert _estado(mensaje).queue_status == "dead"
+
+    @override_settings(OUTBOUND_MAX_AGE_SECONDS=60)
+    def test_reencolado_manual_reinicia_la_edad(self):
+        viejo_ms = int(time.time() * 1000) - 3_600_000
+        mensaje = _crear_outbound("+541100000015", "hola", timestamp_ms=viejo_ms, metadata_json={"a": 1})
+        Mensaje.objects.filter(id=mensaje.id).update(queue_status="dead")
+        ColaMensaje.objects.filter(mensaje=mensaje).delete()
+
+        assert reencolar_descartados(Mensaje.objects.filter(id=mensaje.id)) == 1
+        mocked_send = self._enviar(return_value={"ok": True, "message_id": "wamid.out"})
+
+        assert mocked_send.call_count == 1
+        assert _estado(mensaje).queue_status == "sent"
+        assert mensaje.metadata_json["a"] == 1
+
+    def test_sin_cupo_local_no_consume_intento(self):
+        mensaje = _crear_outbound("+541100000016", "hola", attempts=2)
+        antes_ms = int(time.time() * 1000)
+        self._enviar(return_value=SIN_CUPO)
+
+        estado = _estado(mensaje)
+        assert estado.queue_status == "queued"
+        assert estado.attempts == 2
+        assert estado.process_after_ms >= antes_ms
+
+    def test_outbound_de_campana_usa_su_bucket(self):
+        campana = _crear_outbound("+541100000017", "promo", metadata_json={"clase_envio": "campaign"})
+        respuesta = _crear_outbound("+541100000018", "hola")
+        mocked_send = self._enviar(return_value={"ok": True, "message_id": "wamid.out"})
+
+        clases = {c.args[0]: c.kwargs["clase"] for c in mocked_send.call_args_list}
+        assert clases == {campana.phone_number: "campaign", respuesta.phone_number: "reply"}
+
+    def test_reintento_no_deja_pasar_al_siguiente_del_mismo_telefono(self):
+        primero = _crear_outbound("+541100000014", "primero")
+        segundo = _crear_outbound("+541100000014", "segundo")
+        mocked_send = self._enviar(return_value=THROTTLED)
+
+        assert mocked_send.call_count == 1
+        segundo_estado = _estado(segundo)
+        assert segundo_estado.queue_status == "queued"
+        assert segundo_estado.attempts == 0
+        assert segundo_estado.process_after_ms >= _estado(primero).process_after_ms
+
+    def test_interactivo_retoma_desde_el_payload_pendiente(self):
+        mensaje = _crear_outbound(
+            "+541100000015",
+            "menu",
+            tipo="interactive",
+            metadata_json={"interactive_payloads": [{"parte": 1}, {"parte": 2}]},
+        )
+        enviados = []
+
+        def enviar_interactivo(phone_number, payload, clase="reply"):
+            enviados.append(payload["parte"])
+            if len(enviados) == 2:
+                return THROTTLED
+            return {"ok": True, "message_id": f"wamid.{payload['parte']}"}
+
+        path = "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_interactive_con_resultado"
+        with patch(path, side_effect=enviar_interactivo):
+            procesar_outbound_pendientes(limit=10)
+            assert _estado(mensaje).queue_status == "queued"
+            ColaMensaje.objects.filter(mensaje=mensaje).update(due_at_ms=0)
+            procesar_outbound_pendientes(limit=10)
+
+        mensaje.refresh_from_db()
+        assert enviados == [1, 2, 2]
+        assert mensaje.queue_status == "sent"
+        assert mensaje.metadata_json["interactive_sent_count"] == 2
+
+
+class RepositorioColaTests(TestCase):
+    def _completar_lote(self, cantidad: int) -> int:
+        """Completa un lote de cantidad envios y retorna las consultas usadas."""
+        for idx in range(cantidad):
+            _crear_outbound(f"+5411000003{idx:02d}", "menu")
+        mensajes = RepositorioCola.reclamar("out", limit=cantidad)
+        resultados = [(m, {"queue_status": "sent", "wa_message_id": f"wamid.{m.id}"}) for m in mensajes]
+        with CaptureQueriesContext(connection) as consultas:
+            assert RepositorioCola.completar(resultados) == cantidad
+        return len(consultas)
+
+    def test_completar_usa_consultas_constantes(self):
+        assert self._completar_lote(2) == self._completar_lote(12)
+
+    def test_completa_lote_respetando_lease(self):
+        for idx in range(3):
+            _crear_outbound(f"+54110000002{idx}", "menu")
+        mensajes = RepositorioCola.reclamar("out", limit=10)
+        assert [m.queue_status for m in mensajes] == ["processing"] * 3
+        enviado, fallido, perdido = mensajes
+        ColaMensaje.objects.filter(mensaje=perdido).update(status="queued", locked_at_ms=None)
+
+        actualizados = RepositorioCola.completar(
+            [
+                (enviado, {"queue_status": "sent", "wa_message_id": "wamid.1", "metadata_json": {"a": 1}}),
+                (fallido, {"queue_status": "failed", "error": "invalid"}),
+                (perdido, {"queue_status": "sent"}),
+            ]
+        )
+
+        assert actualizados == 2
+        for mensaje in mensajes:
+            mensaje.refresh_from_db()
+        assert (enviado.queue_status, enviado.wa_message_id, enviado.error) == ("sent", "wamid.1", None)
+        assert enviado.metadata_json == {"a": 1}
+        assert (fallido.queue_status, fallido.wa_message_id, fallido.error) == ("failed", None, "invalid")
+        assert _estado(perdido).queue_status == "queued"
+        assert ColaMensaje.objects.filter(mensaje=perdido).exists()
+        assert not ColaMensaje.objects.filter(mensaje__in=[enviado, fallido]).exists()
+
+    def test_mensaje_queda_fuera_de_la_cola_hasta_el_final(self):
+        mensaje = _crear_outbound("+541100000026", "hola")
+        RepositorioCola.reclamar("out", limit=10)
+        mensaje.refresh_from_db()
+        assert (mensaje.queue_status, mensaje.attempts) == ("queued", 0)
+        assert _estado(mensaje).queue_status == "processing"
+
+    def test_telefonos_ocupados_no_ocupan_el_lote(self):
+        ahora_ms = int(time.time() * 1000)
+        for idx in range(3):
+            phone_number = f"+54110000004{idx}"
+            _crear_outbound(phone_number, "en curso", queue_status="processing", locked_at_ms=ahora_ms)
+            _crear_outbound(phone_number, "atrasado", process_after_ms=ahora_ms - 10_000)
+        libre = _crear_outbound("+541100000049", "libre")
+
+        assert [m.id for m in RepositorioCola.reclamar("out", limit=3)] == [libre.id]
+
+    def test_liberar_reclamados_no_consume_intento(self):
+        _encolar(
+            Mensaje.objects.create(
+                phone_number="+541100000025",
+                direccion="in",
+                contenido="hola",
+                timestamp_ms=int(time.time() * 1000),
+                queue_status="pending",
+            )
+        )
+        mensajes = RepositorioCola.reclamar("in", limit=10)
+        assert mensajes[0].attempts == 1
+
+        assert liberar_reclamados(mensajes) == 1
+        estado = _estado(mensajes[0])
+        assert (estado.queue_status, estado.attempts, estado.locked_at_ms) == ("pending", 0, None)
+
+    def test_entrantes_se_reclaman_por_timestamp(self):
+        ahora_ms = int(time.time() * 1000)
+        posterior = GestorMensajes.registrar_entrada(
+            "+541100000027", "", "segundo", "text", timestamp_ms=ahora_ms - 1_000, process_after_ms=ahora_ms
+        )
+        # Meta reenvia tarde uno anterior: llega despues pero va primero.
+        anterior = GestorMensajes.registrar_entrada(
+            "+541100000027", "", "primero", "text", timestamp_ms=ahora_ms - 5_000, process_after_ms=ahora_ms + 1
+        )
+
+        assert [m.id for m in RepositorioCola.reclamar("in", limit=1)] == [anterior.id]
+        assert _estado(posterior).queue_status == "pending"
+
+    @override_settings(OUTBOUND_DROP_IF_NEWER_INBOUND="False")
+    def test_entrante_se_escribe_una_vez_al_cerrar(self):
+        mensaje = GestorMensajes.registrar_entrada("+541100000028", "Tester", "hola", "text")
+        with CaptureQueriesContext(connection) as consultas:
+            assert procesar_inbound_pendientes(limit=10) == 1
+
+        updates = [
+            q["sql"] for q in consultas.captured_queries if q["sql"].startswith('UPDATE "mensajes"')
+        ]
+        assert len(updates) == 1
+        mensaje.refresh_from_db()
+        assert mensaje.queue_status == "processed"
+        assert mensaje.metadata_json["tipo_entrada"] == "cliente_nuevo"
+
+
+@skipIf(connection.vendor == "postgresql", "demora el reclamo ORM; Postgres usa ReclamoPostgresTests")
+class ReclamoConcurrenteTests(TransactionTestCase):
+    def _inbound(self, phone_number: str, timestamp_ms: int) -> Mensaje:
+        return _encolar(
+            Mensaje.objects.create(
+                phone_number=phone_number,
+                direccion="in",
+                contenido="hola",
+                timestamp_ms=timestamp_ms,
+                queue_status="pending",
+                process_after_ms=timestamp_ms,
+            )
+        )
+
+    def test_dos_reclamos_simultaneos_no_toman_el_mismo_telefono(self):
+        base_ms = int(time.time() * 1000) - 1000
+        primero = self._inbound("+541100000050", base_ms)
+        segundo = self._inbound("+541100000050", base_ms + 1)
+        otro = self._inbound("+541100000051", base_ms + 2)
+        en_reclamo = threading.Event()
+        reclamados: dict[str, list[int]] = {}
+        in_bulk = Mensaje.objects.in_bulk
+
+        def in_bulk_lento(ids):
+            # El primer reclamo se demora con su transaccion abierta.
+            if not en_reclamo.is_set():
+                en_reclamo.set()
+                time.sleep(0.2)
+            return in_bulk(ids)
+
+        def reclamar(nombre: str, limit: int) -> None:
+            try:
+                reclamados[nombre] = [m.id for m in RepositorioCola.reclamar("in", limit=limit)]
+            finally:
+                connections.close_all()
+
+        with patch.object(Mensaje.objects, "in_bulk", side_effect=in_bulk_lento):
+            hilo_a = threading.Thread(target=reclamar, args=("a", 1))
+            hilo_a.start()
+            assert en_reclamo.wait(5)
+            hilo_b = threading.Thread(target=reclamar, args=("b", 10))
+            hilo_b.start()
+            hilo_a.join(5)
+            hilo_b.join(5)
+
+        assert reclamados == {"a": [primero.id], "b": [otro.id]}
+        assert _estado(segundo).queue_status == "pending"
+
+
+@skipUnless(connection.vendor == "postgresql", "el reclamo con advisory locks es solo para Postgres")
+class ReclamoPostgresTests(TransactionTestCase):
+    def _inbound(self, phone_number: str, timestamp_ms: int) -> Mensaje:
+        return _encolar(
+            Mensaje.objects.create(
+                phone_number=phone_number,
+                direccion="in",
+                contenido="hola",
+                timestamp_ms=timestamp_ms,
+                queue_status="pending",
+                process_after_ms=timestamp_ms,
+            )
+        )
+
+    def test_reclamo_toma_los_campos_de_la_cola(self):
+        base_ms = int(time.time() * 1000) - 1000
+        primero = self._inbound("+541100000060", base_ms)
+        self._inbound("+541100000061", base_ms + 1)
+
+        mensajes = RepositorioCola._reclamar_sql("in", 10, base_ms + 500, [primero.id])
+
+        assert [m.id for m in mensajes] == [primero.id]
+        assert (mensajes[0].queue_status, mensajes[0].attempts, mensajes[0].locked_at_ms) == (
+            "processing",
+            1,
+            base_ms + 500,
+        )
+        primero.refresh_from_db()
+        assert (primero.queue_status, primero.attempts) == ("pending", 0)
+
+    def test_telefono_con_advisory_lock_tomado_se_saltea(self):
+        base_ms = int(time.time() * 1000) - 1000
+        primero = self._inbound("+541100000062", base_ms)
+        segundo = self._inbound("+541100000062", base_ms + 1)
+        otro = self._inbound("+541100000063", base_ms + 2)
+        reclamado = threading.Event()
+        liberar = threading.Event()
+        reclamados: dict[str, list[int]] = {}
+
+        def reclamar_y_esperar() -> None:
+            # Mantiene abierta la transaccion, y con ella el advisory lock del telefono.
+            # Llama a _reclamar_sql porque reclamar() cierra conexiones con transaccion abierta.
+            try:
+                with transaction.atomic():
+                    mensajes = RepositorioCola._reclamar_sql("in", 1, int(time.time() * 1000), None)
+                    reclamados["a"] = [m.id for m in mensajes]
+                    reclamado.set()
+                    liberar.wait(5)
+            finally:
+                connections.close_all()
+
+        hilo = threading.Thread(target=reclamar_y_esperar)
+        hilo.start()
+        try:
+            assert reclamado.wait(5)
+            reclamados["b"] = [m.id for m in RepositorioCola.reclamar("in", limit=10)]
+        finally:
+            liberar.set()
+            hilo.join(5)
+
+        assert reclamados == {"a": [primero.id], "b": [otro.id]}
+        assert _estado(segundo).queue_status == "pending"
+
+
+@override_settings(OUTBOUND_DROP_IF_NEWER_INBOUND="True", OUTBOUND_MAX_CONCURRENCY=1)
+class SupersededInboundTests(TestCase):
+    def _inbound(self, phone_number: str, timestamp_ms: int) -> Mensaje:
+        return Mensaje.objects.create(
+            phone_number=phone_number,
+            direccion="in",
+            contenido="hola",
+            timestamp_ms=timestamp_ms,
+            queue_status="processed",
+        )
+
+    def test_descartes_coinciden_con_chequeo_por_mensaje(self):
+        base_ms = int(time.time() * 1000) - 10_000
+        casos = [
+            ("+541100000030", [base_ms], base_ms),  # responde al ultimo
+            ("+541100000031", [base_ms, base_ms + 5], base_ms),  # hay uno mas nuevo
+            ("+541100000032", [base_ms + 5], base_ms + 5),  # mismo timestamp
+            ("+541100000033", [], base_ms),  # sin inbound
+            ("+541100000034", [base_ms, base_ms + 9], None),  # sin respuesta_a_ts_ms
+        ]
+        salientes = []
+        for phone_number, inbound_ts, respuesta_ts in casos:
+            for timestamp_ms in inbound_ts:
+                self._inbound(phone_number, timestamp_ms)
+            meta = {"respuesta_a_ts_ms": respuesta_ts} if respuesta_ts else {}
+            salientes.append(_crear_outbound(phone_number, "menu", metadata_json=meta))
+        # Mismo telefono en el lote: uno respondido por otro inbound posterior.
+        salientes.append(
+            _crear_outbound("+541100000031", "menu", metadata_json={"respuesta_a_ts_ms": base_ms + 5})
+        )
+
+        def chequeo_por_mensaje(mensaje):
+            respuesta_ts = (mensaje.metadata_json or {}).get("respuesta_a_ts_ms")
+            if not respuesta_ts:
+                return False
+            return Mensaje.objects.filter(
+                phone_number=mensaje.phone_number,
+                direccion="in",
+                timestamp_ms__gt=int(respuesta_ts),
+            ).exists()
+
+        esperado = {mensaje.id: chequeo_por_mensaje(mensaje) for mensaje in salientes}
+
+        with patch(
+            "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
+            return_value={"ok": True, "message_id": None},
+        ):
+            procesar_outbound_pendientes(limit=20)
+
+        for mensaje in salientes:
+            mensaje.refresh_from_db()
+            descartado = mensaje.error == "superseded_by_newer_inbound"
+            assert descartado == esperado[mensaje.id], mensaje.phone_number
+        assert sum(esperado.values()) == 1
+
+
+@override_settings(OUTBOUND_DROP_IF_NEWER_INBOUND="False")
+class OutboundAgendaTests(TestCase):
+    def setUp(self):
+        agenda_outbound.activar()
+        self.addCleanup(agenda_outbound.desactivar)
+
+    def test_reclama_solo_ids_vencidos_y_reagenda_bloqueados(self):
+        vencido = _crear_outbound("+541100000040", "vencido")
+        otro = _crear_outbound("+541100000041", "otro")
+        _crear_outbound("+541100000042", "en curso", queue_status="processing")
+        bloqueado = _crear_outbound("+541100000042", "bloqueado")
+
+        with patch(
+            "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
+            return_value={"ok": True, "message_id": None},
+        ) as mocked_send:
+            enviados = procesar_outbound_pendientes(limit=10, ids=[vencido.id, bloqueado.id])
+
+        assert enviados == 1
+        assert mocked_send.call_count == 1
+        assert _estado(otro).queue_status == "queued"
+        assert agenda_outbound.tomar_vencidos(limit=10) == []
+        assert agenda_outbound.tomar_vencidos(limit=10, now_ms=int(time.time() * 1000) + 1500) == [
+            bloqueado.id
+        ]
+
+    def test_reintento_queda_agendado(self):
+        mensaje = _crear_outbound("+541100000043", "hola")
+        with patch(
+            "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado",
+            return_value=THROTTLED,
+        ):
+            procesar_outbound_pendientes(limit=10, ids=[mensaje.id])
+
+        assert agenda_outbound.proximo() == _estado(mensaje).process_after_ms
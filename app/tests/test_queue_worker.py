@@ -0,0 +1,219 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from app.models.sesion import Sesion
+
+from app.services.outbound_agenda import AgendaOutbound
+from app.services import queue_notify
+from app.services.queue_notify import despertar_worker, esperar_cola
+from app.services.queue_processor import agrupar_por_conversacion, shard_for_phone
+from app.services.queue_worker import QueueWorker, ShardedWorkerPool
+from app.services.sesion_store import LRUSesionStore
+
+
+def _mensajes(phones: int, por_phone: int) -> list:
+    mensajes = []
+    for seq in range(por_phone):
+        for idx in range(phones):
+            mensajes.append(SimpleNamespace(phone_number=f"+54911000{idx:04d}", seq=seq))
+    return mensajes
+
+
+class ShardedWorkerPoolTests(SimpleTestCase):
+    def _run(self, workers: int, mensajes: list) -> list:
+        procesados: list = []
+        lock = threading.Lock()
+
+        def handler(items):
+            with lock:
+                procesados.extend(items)
+
+        pool = ShardedWorkerPool(workers, shards=16)
+        pool.start()
+        for phone_number, grupo in agrupar_por_conversacion(mensajes).items():
+            pool.submit(phone_number, handler, grupo)
+        assert pool.wait_idle(timeout=10)
+        pool.stop()
+        return procesados
+
+    def test_shard_estable_por_telefono(self):
+        assert shard_for_phone("+541112345678", 16) == shard_for_phone("+541112345678", 16)
+        assert shard_for_phone("+541112345678", 1) == 0
+        pool = ShardedWorkerPool(4, shards=16)
+        assert pool.worker_for("+541112345678") == shard_for_phone("+541112345678", 16) % 4
+
+    def test_preserva_orden_por_conversacion(self):
+        mensajes = _mensajes(phones=12, por_phone=6)
+        procesados = self._run(workers=4, mensajes=mensajes)
+        assert len(procesados) == len(mensajes)
+        por_phone: dict = {}
+        for item in procesados:
+            por_phone.setdefault(item.phone_number, []).append(item.seq)
+        for secuencia in por_phone.values():
+            assert secuencia == sorted(secuencia)
+
+    def test_throughput_escala_con_los_hilos(self):
+        mensajes = _mensajes(phones=16, por_phone=2)
+
+        def medir(workers: int) -> float:
+            pool = ShardedWorkerPool(workers, shards=16)
+            pool.start()
+            inicio = time.monotonic()
+            for phone_number, grupo in agrupar_por_conversacion(mensajes).items():
+                # Costo fijo por mensaje (Graph, base) que libera el GIL.
+                pool.submit(phone_number, lambda items: time.sleep(0.01 * len(items)), grupo)
+            assert pool.wait_idle(timeout=30)
+            pool.stop()
+            return len(mensajes) / (time.monotonic() - inicio)
+
+        # Ideal 4x; el margen cubre shards desparejos y ruido del runner.
+        assert medir(4) / medir(1) >= 2.0
+
+    def test_conversaciones_de_distintos_hilos_corren_a_la_vez(self):
+        pool = ShardedWorkerPool(4, shards=16)
+        phones: dict[int, str] = {}
+        idx = 0
+        while len(phones) < 4:
+            phones.setdefault(pool.worker_for(f"+54911{idx:06d}"), f"+54911{idx:06d}")
+            idx += 1
+        # Solo se cruza si los cuatro hilos estan adentro al mismo tiempo.
+        barrera = threading.Barrier(4, timeout=5)
+        cruzaron: list = []
+
+        def handler(items):
+            barrera.wait()
+            cruzaron.extend(items)
+
+        pool.start()
+        for phone_number in phones.values():
+            pool.submit(phone_number, handler, [phone_number])
+        assert pool.wait_idle(timeout=10)
+        pool.stop()
+        assert sorted(cruzaron) == sorted(phones.values())
+
+    def test_flush_de_sesiones_lo_hace_el_hilo_de_cada_telefono(self):
+        pool = ShardedWorkerPool(4, shards=16, name="queue-test")
+        store = LRUSesionStore(capacidad=100, lote=100, intervalo=0)
+        phones = [f"+54911{idx:06d}" for idx in range(20)]
+        for phone_number in phones:
+            store.guardar(Sesion(phone_number=phone_number), nueva=True)
+        escritos: dict = {}
+
+        def escribir(sucios, sesiones):
+            for phone_number in sucios:
+                escritos[phone_number] = threading.current_thread().name
+            return len(sucios)
+
+        pool.start()
+        with patch.object(store, "_escribir", side_effect=escribir), patch(
+            "app.services.queue_worker.get_sesion_store", return_value=store
+        ):
+            QueueWorker._programar_flush(pool)
+            pool.stop()
+
+        assert escritos == {
+            phone_number: f"queue-test-{pool.worker_for(phone_number)}" for phone_number in phones
+        }
+        assert not store.flush_pendiente()
+
+    def test_liberar_capacidad_despierta_al_loop(self):
+        while esperar_cola(0):
+            pass
+        pool = ShardedWorkerPool(1, shards=1, capacidad=2)
+        soltar = threading.Event()
+        pool.start()
+        pool.submit("a", lambda items: soltar.wait(5), ["uno", "dos"])
+        assert esperar_cola(0.05) is False
+        soltar.set()
+        assert esperar_cola(5) is True
+        pool.stop()
+
+    def test_drain_termina_en_curso_y_libera_encolados(self):
+        pool = ShardedWorkerPool(1, shards=1)
+        pool.start()
+        en_curso = threading.Event()
+        soltar = threading.Event()
+        procesados: list = []
+        liberados: list = []
+
+        def handler(items):
+            en_curso.set()
+            soltar.wait(5)
+            procesados.extend(items)
+
+        pool.submit("a", handler, ["primero"])
+        assert en_curso.wait(5)
+        pool.submit("a", handler, ["segundo"])
+        pool.drain(liberados.extend)
+        soltar.set()
+        pool.stop(wait=True)
+
+        assert procesados == ["primero"]
+        assert liberados == ["segundo"]
+        assert pool.pending == 0
+
+
+class QueueWakeupTests(SimpleTestCase):
+    def setUp(self):
+        # Envios diferidos que agendaron tests anteriores no deben despertar a estos.
+        with queue_notify._cond:
+            queue_notify._vencimientos.clear()
+        while esperar_cola(0):
+            pass
+
+    def test_timeout_sin_trabajo(self):
+        assert esperar_cola(0.05) is False
+
+    def test_despierta_inmediato(self):
+        despertar_worker()
+        inicio = time.monotonic()
+        assert esperar_cola(5) is True
+        assert time.monotonic() - inicio < 0.5
+
+    def test_despierta_al_vencer_envio_diferido(self):
+        due_ms = int(time.time() * 1000) + 150
+        despertar_worker(due_ms)
+        inicio = time.monotonic()
+        assert esperar_cola(5) is True
+        assert 0.1 <= time.monotonic() - inicio < 1.0
+
+    def test_notificar_desde_otro_hilo(self):
+        threading.Timer(0.05, despertar_worker).start()
+        assert esperar_cola(5) is True
+
+
+class AgendaOutboundTests(SimpleTestCase):
+    def setUp(self):
+        self.agenda = AgendaOutbound()
+        self.agenda.activar()
+
+    def test_entrega_por_vencimiento(self):
+        self.agenda.agendar(1, 3000)
+        self.agenda.agendar(2, 1000)
+        self.agenda.agendar(3, 2000)
+        assert self.agenda.proximo() == 1000
+        assert self.agenda.tomar_vencidos(limit=10, now_ms=2500) == [2, 3]
+        assert self.agenda.tomar_vencidos(limit=10, now_ms=2500) == []
+        assert self.agenda.tomar_vencidos(limit=10, now_ms=3000) == [1]
+
+    def test_reprogramar_usa_la_ultima_fecha(self):
+        self.agenda.agendar(1, 1000)
+        self.agenda.agendar(1, 5000)
+        assert self.agenda.tomar_vencidos(limit=10, now_ms=2000) == []
+        assert self.agenda.proximo() == 5000
+        assert len(self.agenda) == 1
+
+    def test_respeta_limite(self):
+        for mensaje_id in range(5):
+            self.agenda.agendar(mensaje_id, 1000 + mensaje_id)
+        assert self.agenda.tomar_vencidos(limit=2, now_ms=9999) == [0, 1]
+        assert len(self.agenda) == 3
+
+    def test_inactiva_no_acumula(self):
+        self.agenda.desactivar()
+        self.agenda.agendar(1, 1000)
+        assert len(self.agenda) == 0
@@ -0,0 +1,115 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from app.models.rate_bucket import GraphRateBucket
+from app.services.cliente_whatsapp import ClienteWhatsApp
+from app.services.rate_limiter import DBRateStore, LimitadorGraph, MemoriaRateStore
+
+
+@override_settings(
+    GRAPH_RATE_LIMIT_PER_SECOND=10,
+    GRAPH_RATE_CAMPAIGN_SHARE=0.2,
+    GRAPH_RATE_BACKOFF_FACTOR=0.5,
+    GRAPH_RATE_MIN_PER_SECOND=1,
+    GRAPH_RATE_RECOVERY_PER_SECOND=1,
+)
+class LimitadorGraphTests(SimpleTestCase):
+    def setUp(self):
+        self.limitador = LimitadorGraph(MemoriaRateStore())
+        self.t0 = 1_000_000
+
+    def _tomados(self, clase: str, now_ms: int) -> int:
+        count = 0
+        while self.limitador.intentar("123", clase, now_ms=now_ms) == 0:
+            count += 1
+        return count
+
+    def test_buckets_separados_por_clase(self):
+        assert self._tomados("reply", self.t0) == 8
+        assert self._tomados("campaign", self.t0) == 2
+        # Un segundo despues se recarga cada bucket a su propia tasa.
+        assert self._tomados("reply", self.t0 + 1000) == 8
+        assert self._tomados("campaign", self.t0 + 1000) == 2
+
+    def test_espera_sugerida_sin_tokens(self):
+        self._tomados("reply", self.t0)
+        espera = self.limitador.intentar("123", "reply", now_ms=self.t0)
+        assert abs(espera - 1 / 8) < 1e-6
+
+    def test_throttling_reduce_y_recupera_la_tasa(self):
+        self.limitador.registrar_throttling("123", now_ms=self.t0)
+        assert self._tomados("reply", self.t0) == 0
+        assert self._tomados("reply", self.t0 + 1000) == 5
+
+        # Recupera 1 msg/s por segundo hasta volver al maximo.
+        assert self._tomados("reply", self.t0 + 10_000) == 8
+
+    def test_throttling_de_un_phone_id_no_afecta_a_otro(self):
+        self.limitador.registrar_throttling("123", now_ms=self.t0)
+        assert self.limitador.intentar("456", "reply", now_ms=self.t0) == 0
+
+
+@override_settings(GRAPH_RATE_LIMIT_PER_SECOND=4, GRAPH_RATE_CAMPAIGN_SHARE=0.5)
+class DBRateStoreTests(TestCase):
+    def test_estado_compartido_en_la_base(self):
+        t0 = 1_000_000
+        primero = LimitadorGraph(DBRateStore())
+        segundo = LimitadorGraph(DBRateStore())
+        assert primero.intentar("123", "reply", now_ms=t0) == 0
+        assert segundo.intentar("123", "reply", now_ms=t0) == 0
+        assert primero.intentar("123", "reply", now_ms=t0) > 0
+        bucket = GraphRateBucket.objects.get(key="123:reply")
+        assert bucket.tokens == 0
+
+    @override_settings(GRAPH_RATE_LIMIT_PER_SECOND=40)
+    def test_reserva_tokens_por_lote_y_bloquea_la_fila_una_vez(self):
+        t0 = 1_000_000
+        limitador = LimitadorGraph(DBRateStore(reserva_ms=200))
+        assert limitador.intentar("123", "reply", now_ms=t0) == 0
+        # 20/s durante 200 ms: el primer envio reservo 4 tokens de la fila.
+        assert GraphRateBucket.objects.get(key="123:reply").tokens == 16
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                assert limitador.intentar("123", "reply", now_ms=t0 + 10) == 0
+        assert len(queries) == 0
+
+    @override_settings(GRAPH_RATE_LIMIT_PER_SECOND=40)
+    def test_reserva_vencida_vuelve_a_la_base(self):
+        t0 = 1_000_000
+        limitador = LimitadorGraph(DBRateStore(reserva_ms=200))
+        limitador.intentar("123", "reply", now_ms=t0)
+        with CaptureQueriesContext(connection) as queries:
+            assert limitador.intentar("123", "reply", now_ms=t0 + 200) == 0
+        assert len(queries) > 0
+
+    @override_settings(GRAPH_RATE_LIMIT_PER_SECOND=40)
+    def test_throttling_descarta_la_reserva_local(self):
+        t0 = 1_000_000
+        limitador = LimitadorGraph(DBRateStore(reserva_ms=200))
+        limitador.intentar("123", "reply", now_ms=t0)
+        limitador.registrar_throttling("123", now_ms=t0)
+        assert limitador.intentar("123", "reply", now_ms=t0) > 0
+
+
+class ClienteWhatsAppCuotaTests(SimpleTestCase):
+    def test_envio_masivo_usa_bucket_de_campana(self):
+        path = "app.services.cliente_whatsapp.ClienteWhatsApp.enviar_mensaje_con_resultado"
+        with patch(path, return_value={"ok": True}) as mocked_send:
+            ClienteWhatsApp.enviar_mensajes_batch([{"phone_number": "+5411", "mensaje": "promo"}])
+
+        assert mocked_send.call_args.kwargs["clase"] == "campaign"
+
+    def test_marcar_como_leido_sin_cupo_se_omite_sin_esperar(self):
+        limitador = LimitadorGraph()
+        with patch("app.services.cliente_whatsapp.get_limitador", return_value=limitador), patch.object(
+            limitador, "intentar", return_value=0.5
+        ), patch.object(limitador, "adquirir") as mocked_adquirir, patch(
+            "app.services.cliente_whatsapp.get_whatsapp_setting", side_effect=lambda _clave, default=None: default
+        ), patch("app.services.cliente_whatsapp.requests.post") as mocked_post:
+            assert ClienteWhatsApp.marcar_como_leido("wamid.1") is False
+
+        mocked_adquirir.assert_not_called()
+        mocked_post.assert_not_called()
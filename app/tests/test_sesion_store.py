@@ -0,0 +1,174 @@
+import time
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from app.models.sesion import Sesion
+from app.services.gestor_sesion import GestorSesion
+from app.jobs.session_jobs import expire_stale_sessions
+from app.services import sesion_store
+from app.services.sesion_store import (
+    DBSesionStore,
+    LRUSesionStore,
+    activar_sesion_store,
+    desactivar_sesion_store,
+)
+
+
+def _sesion(phone_number: str, inactividad_s: int = 0, **campos) -> Sesion:
+    ahora_ms = int(time.time() * 1000)
+    campos.setdefault("estado_actual", "0")
+    campos.setdefault("historial_navegacion", ["0"])
+    return Sesion.objects.create(
+        phone_number=phone_number,
+        inicio_sesion_ms=ahora_ms,
+        ultimo_acceso_ms=ahora_ms - inactividad_s * 1000,
+        **campos,
+    )
+
+
+class LRUSesionStoreTests(TestCase):
+    def setUp(self):
+        self.store = LRUSesionStore(capacidad=2, lote=10, intervalo=60)
+        patcher = patch("app.services.gestor_sesion.get_sesion_store", return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lee_una_vez_y_escribe_al_hacer_flush(self):
+        _sesion("+541100000100")
+        GestorSesion.obtener_o_crear_sesion("+541100000100")
+        with self.assertNumQueries(0):
+            GestorSesion.actualizar_estado("+541100000100", "1", ["0", "1"], "1", tipo_contenido="menu")
+            GestorSesion.actualizar_estado("+541100000100", "R1", ["0", "1"], "A")
+        assert Sesion.objects.get(phone_number="+541100000100").estado_actual == "0"
+
+        assert self.store.flush() == 1
+        sesion = Sesion.objects.get(phone_number="+541100000100")
+        assert (sesion.estado_actual, sesion.ultimo_mensaje) == ("R1", "A")
+        assert sesion.datos_extra == {"last_content_type": "menu"}
+
+    def test_flush_agrupa_altas_y_cambios(self):
+        _sesion("+541100000101")
+        GestorSesion.obtener_o_crear_sesion("+541100000101")
+        GestorSesion.obtener_o_crear_sesion("+541100000102", "Nueva")
+        with self.assertNumQueries(2):
+            assert self.store.flush() == 2
+        assert Sesion.objects.get(phone_number="+541100000102").nombre == "Nueva"
+
+    def test_desalojo_escribe_la_sesion_sucia(self):
+        for idx in range(3):
+            _sesion(f"+54110000011{idx}")
+            GestorSesion.actualizar_estado(f"+54110000011{idx}", "1", ["0", "1"])
+        assert len(self.store) == 2
+        assert Sesion.objects.get(phone_number="+541100000110").estado_actual == "1"
+        assert Sesion.objects.get(phone_number="+541100000112").estado_actual == "0"
+
+    def test_descartar_olvida_cambios_pendientes(self):
+        _sesion("+541100000120")
+        GestorSesion.actualizar_estado("+541100000120", "1", ["0", "1"])
+        self.store.descartar("+541100000120")
+        assert self.store.flush() == 0
+        assert GestorSesion.obtener_o_crear_sesion("+541100000120")[0].estado_actual == "0"
+
+    def test_flush_solo_escribe_los_telefonos_pedidos(self):
+        _sesion("+541100000121")
+        _sesion("+541100000122")
+        GestorSesion.actualizar_estado("+541100000121", "1", ["0", "1"])
+        GestorSesion.actualizar_estado("+541100000122", "1", ["0", "1"])
+
+        assert self.store.flush(solo=lambda phone: phone.endswith("1")) == 1
+        assert Sesion.objects.get(phone_number="+541100000122").estado_actual == "0"
+        assert self.store.flush() == 1
+        assert Sesion.objects.get(phone_number="+541100000122").estado_actual == "1"
+
+    def test_reset_desde_otro_proceso_descarta_la_copia(self):
+        _sesion("+541100000123")
+        GestorSesion.actualizar_estado("+541100000123", "1", ["0", "1"])
+        with patch.object(sesion_store, "_store", self.store):
+            # Aviso de cache_bus: otro proceso reseteo la sesion en la base.
+            sesion_store._al_invalidar_sesion("+541100000123")
+        assert self.store.flush() == 0
+        assert len(self.store) == 0
+
+    def test_barrido_libera_solo_las_sesiones_sin_cambios(self):
+        _sesion("+541100000124", 120)
+        _sesion("+541100000125", 120)
+        with override_settings(SESSION_TIMEOUT_SECONDS=60), patch(
+            "app.services.gestor_sesion.get_sesion_store", return_value=self.store
+        ):
+            self.store.cargar("+541100000124")
+            GestorSesion.actualizar_estado("+541100000125", "1", ["0", "1"])
+            GestorSesion.expirar_sesiones()
+        assert list(self.store._cache) == ["+541100000125"]
+
+
+class InvalidarSesionTests(TestCase):
+    def test_solo_avisa_si_el_store_no_es_el_lru(self):
+        _sesion("+541100000126")
+        with patch.object(sesion_store, "publicar_invalidacion") as publicar:
+            GestorSesion.resetear_navegacion("+541100000126")
+            publicar.assert_called_once_with(sesion_store.TOPICO_SESION, "+541100000126")
+            with patch.object(sesion_store, "_store", LRUSesionStore()):
+                sesion_store.invalidar_sesion("+541100000126")
+            publicar.assert_called_once()
+
+
+@override_settings(SESSION_TIMEOUT_SECONDS=60, INACTIVE_TIMEOUT_SECONDS=3600, SESSION_PURGE_ENABLED=True)
+class ExpirarSesionesTests(TestCase):
+    def test_cierra_vencidas_en_lotes_y_borra_abandonadas(self):
+        for idx in range(5):
+            _sesion(f"+54110000020{idx}", 120, estado_actual="R1", historial_navegacion=["0", "1"])
+        _sesion("+541100000210", 10, estado_actual="R1")
+        _sesion("+541100000220", 7200)
+
+        assert expire_stale_sessions(batch_size=2) == "expiradas=6 archivadas=1"
+
+        vencida = Sesion.objects.get(phone_number="+541100000200")
+        assert (vencida.activa, vencida.estado_actual, vencida.historial_navegacion) == (
+            False,
+            "0",
+            ["0"],
+        )
+        assert Sesion.objects.get(phone_number="+541100000210").activa is True
+        assert not Sesion.objects.filter(phone_number="+541100000220").exists()
+        assert expire_stale_sessions() == "expiradas=0 archivadas=0"
+
+    @override_settings(INACTIVE_TIMEOUT_SECONDS=0)
+    def test_segundo_nivel_desactivado(self):
+        _sesion("+541100000230", 7200)
+        assert GestorSesion.expirar_sesiones() == {"expiradas": 1, "archivadas": 0}
+
+    @override_settings(SESSION_PURGE_ENABLED=False)
+    def test_no_borra_sin_habilitar_la_purga(self):
+        _sesion("+541100000231", 7200)
+        assert GestorSesion.expirar_sesiones() == {"expiradas": 1, "archivadas": 0}
+        assert Sesion.objects.filter(phone_number="+541100000231").exists()
+
+    def test_acceso_a_sesion_barrida_solo_lee_el_flag(self):
+        _sesion("+541100000240", 120, estado_actual="R1")
+        GestorSesion.expirar_sesiones()
+        sesion = Sesion.objects.get(phone_number="+541100000240")
+
+        expirada, campos = GestorSesion.registrar_acceso(sesion)
+
+        assert expirada is True
+        assert campos == ["ultimo_acceso_ms", "primer_acceso", "activa"]
+        assert sesion.activa is True
+
+
+@override_settings(SESSION_STORE="lru")
+class ActivarSesionStoreTests(TestCase):
+    def setUp(self):
+        self.addCleanup(desactivar_sesion_store)
+
+    def test_lru_con_un_solo_proceso_de_inbound(self):
+        assert isinstance(activar_sesion_store(), LRUSesionStore)
+
+    def test_lru_no_convive_con_otros_procesos_de_inbound(self):
+        # Otro proceso ya tiene el lock compartido (db): se cae a db.
+        with patch.object(sesion_store, "_tomar_lock_inbound", side_effect=[False, True]):
+            assert type(activar_sesion_store()) is DBSesionStore
+        desactivar_sesion_store()
+        # Otro proceso tiene el lock exclusivo (lru): este no procesa inbound.
+        with patch.object(sesion_store, "_tomar_lock_inbound", return_value=False):
+            assert activar_sesion_store() is None
@@ -0,0 +1,48 @@
+from dataclasses import FrozenInstanceError
+
+from django.test import SimpleTestCase
+
+from app.services.validador import MAX_LARGO_MEMO, ValidadorEntrada
+
+
+class ValidadorEntradaTests(SimpleTestCase):
+    ENTRADAS = [
+        "",
+        "   ",
+        "1",
+        " 12 ",
+        "100",
+        "a",
+        "AB",
+        "#",
+        "menu",
+        "Volver",
+        "hola",
+        "Hola! 👋",
+        "buenas\ttardes",
+        "1️⃣",
+        "👍",
+        "texto libre",
+        "x" * (MAX_LARGO_MEMO + 5),
+    ]
+
+    def test_camino_rapido_y_memo_coinciden_con_la_validacion_completa(self):
+        for entrada in self.ENTRADAS:
+            with self.subTest(entrada=entrada):
+                rapido = ValidadorEntrada.validar(entrada)
+                completo = ValidadorEntrada._validar_completo(entrada)
+                assert vars(rapido) == vars(completo)
+
+    def test_comandos_cortos_no_se_recalculan(self):
+        assert ValidadorEntrada.validar("1") is ValidadorEntrada.validar("1")
+        assert ValidadorEntrada.validar("hola") is ValidadorEntrada.validar("hola")
+
+    def test_resultado_compartido_es_inmutable(self):
+        with self.assertRaises(FrozenInstanceError):
+            ValidadorEntrada.validar("1").target = "2"
+        assert ValidadorEntrada.validar("1").target == "1"
+
+    def test_normaliza_emojis_y_espacios(self):
+        assert ValidadorEntrada.normalizar_entrada(" hola\t 👋  bot\n") == "HOLA BOT"
+        assert ValidadorEntrada.normalizar_entrada("👉 2") == "2"
+        assert ValidadorEntrada.validar("👉 2").target == "2"
@@ -0,0 +1,150 @@
+import json
+import time
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from app.jobs.queue_jobs import purge_webhook_inbox
+from app.models.cola_mensaje import ColaMensaje
+from app.models.mensaje import Mensaje
+from app.models.webhook_inbox import WebhookInbox
+from app.services.gestor_mensajes import GestorMensajes
+from app.services.webhook_eventos import expandir_inbox
+
+
+def _payload(*message_ids: str, statuses: list[dict] | None = None) -> dict:
+    mensajes = [
+        {
+            "id": message_id,
+            "from": "5491112345678",
+            "timestamp": str(int(time.time())),
+            "type": "text",
+            "text": {"body": "hola"},
+        }
+        for message_id in message_ids
+    ]
+    return {
+        "entry": [
+            {
+                "changes": [
+                    {
+                        "value": {
+                            "messages": mensajes,
+                            "statuses": statuses or [],
+                            "contacts": [{"profile": {"name": "Tester"}}],
+                        }
+                    }
+                ]
+            }
+        ]
+    }
+
+
+@override_settings(WEBHOOK_FAST_ACK=True)
+class WebhookFastAckTests(TestCase):
+    def _post(self, cuerpo: str):
+        return self.client.post("/webhook/mensajes", data=cuerpo, content_type="application/json")
+
+    def test_un_insert_sin_parsear_y_el_worker_expande(self):
+        cuerpo = json.dumps(_payload(*[f"wamid.inbox.{idx}" for idx in range(20)]))
+        with self.assertNumQueries(1):
+            respuesta = self._post(cuerpo)
+
+        assert respuesta.status_code == 200
+        assert Mensaje.objects.count() == 0
+        assert WebhookInbox.objects.get().payload == cuerpo
+
+        assert expandir_inbox() == {
+            "webhooks": 1,
+            "encolados": 20,
+            "duplicados": 0,
+            "statuses": 0,
+            "errores": 0,
+        }
+        assert Mensaje.objects.filter(direccion="in", queue_status="pending").count() == 20
+        assert WebhookInbox.objects.get().procesado_ms is not None
+        assert expandir_inbox()["webhooks"] == 0
+
+    def test_cuerpo_invalido_queda_marcado_sin_frenar_a_los_demas(self):
+        self._post("{no es json")
+        self._post(json.dumps(_payload("wamid.inbox.ok")))
+
+        with self.assertLogs("app.services.webhook_eventos", level="ERROR"):
+            resultado = expandir_inbox()
+
+        assert (resultado["errores"], resultado["encolados"]) == (1, 1)
+        invalido = WebhookInbox.objects.order_by("id").first()
+        assert invalido.error and invalido.procesado_ms is not None
+
+    def test_expande_statuses_y_purga_lo_viejo(self):
+        Mensaje.objects.create(
+            phone_number="+5491112345678",
+            direccion="out",
+            tipo="text",
+            contenido="hola",
+            timestamp_ms=int(time.time() * 1000),
+            wa_message_id="wamid.out.1",
+        )
+        self._post(json.dumps(_payload(statuses=[{"id": "wamid.out.1", "status": "read"}])))
+
+        assert expandir_inbox()["statuses"] == 1
+        assert Mensaje.objects.get(wa_message_id="wamid.out.1").delivery_status == "read"
+        assert purge_webhook_inbox() == "borrados=0"
+        assert purge_webhook_inbox(retention_hours=-1) == "borrados=1"
+
+
+class RegistrarEntradasTests(TestCase):
+    def _entrada(self, wa_message_id: str | None):
+        return GestorMensajes.nueva_entrada(
+            "+5491112345678", "Tester", "hola", "text", wa_message_id=wa_message_id
+        )
+
+    def test_lote_descarta_repetidos_con_consultas_fijas(self):
+        GestorMensajes.registrar_entrada("+5491112345678", "Tester", "hola", "text", wa_message_id="wamid.lote.0")
+        entradas = [self._entrada(f"wamid.lote.{idx}") for idx in range(50)]
+        entradas += [self._entrada("wamid.lote.1"), self._entrada(None)]
+
+        # Postgres: un solo INSERT ... ON CONFLICT; otros motores: consulta + bulk_create.
+        with self.assertNumQueries(1 if connection.vendor == "postgresql" else 5):
+            resultado = GestorMensajes.registrar_entradas(entradas)
+
+        assert resultado == {"nuevos": 50, "duplicados": 2}
+        assert Mensaje.objects.filter(direccion="in").count() == 51
+        assert ColaMensaje.objects.count() == 51
+
+    def test_reintento_del_webhook_solo_cuenta_duplicados(self):
+        cuerpo = json.dumps(_payload("wamid.reintento.1", "wamid.reintento.2"))
+        primera = self.client.post("/webhook/mensajes", data=cuerpo, content_type="application/json")
+        segunda = self.client.post("/webhook/mensajes", data=cuerpo, content_type="application/json")
+
+        assert (primera.json()["encolados"], primera.json()["duplicados"]) == (2, 0)
+        assert (segunda.json()["encolados"], segunda.json()["duplicados"]) == (0, 2)
+        assert Mensaje.objects.filter(direccion="in").count() == 2
+
+
+@skipUnless(connection.vendor == "postgresql", "INSERTAR_ENTRADAS_SQL es solo para Postgres")
+class RegistrarEntradasPostgresTests(TestCase):
+    def _entrada(self, wa_message_id: str, **kwargs):
+        return GestorMensajes.nueva_entrada(
+            "+5491112345678", "Tester", "hola", "text", wa_message_id=wa_message_id, **kwargs
+        )
+
+    def test_cuenta_solo_los_insertados_y_encola_los_pendientes(self):
+        GestorMensajes.registrar_entrada("+5491112345678", "Tester", "hola", "text", wa_message_id="wamid.pg.0")
+        entradas = [
+            self._entrada("wamid.pg.0"),
+            self._entrada("wamid.pg.1", timestamp_ms=1_000, process_after_ms=5_000),
+            self._entrada("wamid.pg.2", timestamp_ms=9_000, process_after_ms=2_000),
+            self._entrada("wamid.pg.3", queue_status="processed"),
+        ]
+
+        assert GestorMensajes._registrar_entradas_sql(entradas) == 3
+
+        cola = dict(
+            ColaMensaje.objects.filter(mensaje__wa_message_id__startswith="wamid.pg.")
+            .values_list("mensaje__wa_message_id", "due_at_ms")
+        )
+        assert set(cola) == {"wamid.pg.0", "wamid.pg.1", "wamid.pg.2"}
+        assert (cola["wamid.pg.1"], cola["wamid.pg.2"]) == (1_000, 2_000)
+        assert ColaMensaje.objects.get(mensaje__wa_message_id="wamid.pg.1").status == "pending"
@@ -1,9 +1,7 @@
 import json
 import logging
 import mimetypes
-import time
 from pathlib import Path
-from typing import Any, Optional
 
 from django.conf import settings
 from django.http import FileResponse, Http404, HttpResponse, JsonResponse
@@ -11,216 +9,29 @@ from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
-from app.models.sesion import Sesion
 from app.models.mensaje import Mensaje
-from app.services import GestorMensajes, GestorSesion
+from app.services import GestorSesion
 from app.services.queue_processor import procesar_cola, simular_mensaje
 from app.services.waba_config import get_active_waba_config
+from app.services.webhook_eventos import (
+    expandir_eventos,
+    guardar_en_inbox,
+    # Nombres previos, usados por los tests de parseo.
+    extraer_eventos_whatsapp as _extraer_eventos_whatsapp,
+    extraer_opcion_flow as _extraer_opcion_flow,
+)
 
 logger = logging.getLogger(__name__)
 
 
-def _buscar_valor_crudo_por_claves(data: Any, claves: list[str]) -> Any:
-    if data is None:
-        return None
-    if isinstance(data, dict):
-        for clave in claves:
-            if clave in data:
-                valor = data.get(clave)
-                if valor is not None:
-                    return valor
-        for value in data.values():
-            encontrado = _buscar_valor_crudo_por_claves(value, claves)
-            if encontrado is not None:
-                return encontrado
-    elif isinstance(data, list):
-        for item in data:
-            encontrado = _buscar_valor_crudo_por_claves(item, claves)
-            if encontrado is not None:
-                return encontrado
-    return None
-
-
-def _buscar_valor_por_claves(data: Any, claves: list[str]) -> Optional[str]:
-    valor = _buscar_valor_crudo_por_claves(data, claves)
-    if valor is None:
-        return None
-    return str(valor)
-
-
-def _extraer_opcion_flow(response_json: Any) -> Optional[str]:
-    if response_json is None:
-        return None
-    claves_prioridad = [
-        "menu_option",
-        "menu_option_1",
-        "menu_option_2",
-        "menu_option_3",
-        "opcion",
-        "option",
-    ]
-    return _buscar_valor_por_claves(response_json, claves_prioridad)
-
-
-def _extraer_datos_cliente_flow(response_json: Any) -> dict:
-    if response_json is None:
-        return {}
-
-    nombre = _buscar_valor_por_claves(
-        response_json, ["nombre_completo", "nombre", "full_name"]
-    )
-    fecha_nacimiento = _buscar_valor_por_claves(
-        response_json,
-        ["fecha_nacimiento", "fechaNacimiento", "birth_date", "dob"],
-    )
-    tos_optin = _buscar_valor_crudo_por_claves(
-        response_json,
-        ["tos_optin", "terms_optin", "terminos_optin", "marketing_opt_in", "optin"],
-    )
-
-    datos = {}
-    if nombre:
-        datos["nombre_completo"] = nombre
-    if fecha_nacimiento:
-        datos["fecha_nacimiento"] = fecha_nacimiento
-    if tos_optin is not None:
-        datos["tos_optin"] = tos_optin
-    return datos
-
-
-def _extraer_eventos_whatsapp(data: dict) -> tuple[list[dict], list[dict]]:
-    """Extrae mensajes y status updates del webhook de WhatsApp."""
-    mensajes: list[dict] = []
-    statuses: list[dict] = []
-    try:
-        for entry in data.get("entry", []) or []:
-            for change in entry.get("changes", []) or []:
-                value = change.get("value", {}) or {}
-                metadata = value.get("metadata", {}) or {}
-                contacts = value.get("contacts", []) or []
-                contact = contacts[0] if contacts else {}
-                alias_waba = contact.get("profile", {}).get("name", "")
-                for message in value.get("messages", []) or []:
-                    message_type = message.get("type", "text")
-                    mensaje_texto = ""
-                    flow_response_json = None
-                    flow_client_data = None
-                    if message_type == "text":
-                        mensaje_texto = message.get("text", {}).get("body", "")
-                    elif message_type == "interactive":
-                        interactive = message.get("interactive", {}) or {}
-                        if interactive.get("type") == "nfm_reply":
-                            nfm_reply = interactive.get("nfm_reply") or {}
-                            response_raw = nfm_reply.get("response_json")
-                            try:
-                                response_json = json.loads(response_raw) if response_raw else None
-                            except Exception:
-                                response_json = None
-                            flow_response_json = response_json
-                            flow_client_data = _extraer_datos_cliente_flow(response_json)
-                            mensaje_texto = _extraer_opcion_flow(response_json) or ""
-                            if not mensaje_texto:
-                                mensaje_texto = (
-                                    nfm_reply.get("id")
-                                    or nfm_reply.get("title")
-                                    or nfm_reply.get("name")
-                                    or ""
-                                )
-                        else:
-                            reply = interactive.get("button_reply") or interactive.get("list_reply") or {}
-                            mensaje_texto = reply.get("id") or reply.get("title") or ""
-
-                    phone_raw = message.get("from", "")
-                    if phone_raw.startswith("549"):
-                        phone_number = "+54" + phone_raw[3:]
-                    else:
-                        phone_number = "+" + phone_raw
-
-                    mensajes.append(
-                        {
-                            "phone_number": phone_number,
-                            "nombre": alias_waba,
-                            "alias_waba": alias_waba,
-                            "mensaje": mensaje_texto,
-                            "message_type": message_type,
-                            "wa_message_id": message.get("id"),
-                            "timestamp": int(message.get("timestamp", time.time())),
-                            "raw_message": message,
-                            "metadata": metadata,
-                            "flow_response_json": flow_response_json,
-                            "flow_client_data": flow_client_data,
-                        }
-                    )
-                for status in value.get("statuses", []) or []:
-                    statuses.append(status)
-    except Exception as exc:
-        logger.error("Error extrayendo eventos de WhatsApp: %s", exc)
-    return mensajes, statuses
-
-
-def _procesar_statuses(statuses: list[dict]) -> int:
-    actualizados = 0
-    for status in statuses:
-        wa_message_id = status.get("id")
-        status_value = status.get("status")
-        timestamp = status.get("timestamp")
-        if not wa_message_id or not status_value:
-            continue
-        update = {"delivery_status": status_value}
-        if timestamp:
-            update["delivery_timestamp_ms"] = int(timestamp) * 1000
-        actualizados += Mensaje.objects.filter(
-            direccion="out", wa_message_id=wa_message_id
-        ).update(**update)
-    return actualizados
-
-
-def _encolar_mensajes(mensajes: list[dict]) -> int:
-    encolados = 0
-    mensajes_ordenados = sorted(
-        mensajes,
-        key=lambda m: (m.get("timestamp", 0), m.get("wa_message_id") or ""),
-    )
-    ahora_ms = int(time.time() * 1000)
-    for datos in mensajes_ordenados:
-        metadata = datos.get("metadata") or {}
-        flow_response_json = datos.get("flow_response_json")
-        flow_client_data = datos.get("flow_client_data")
-        inbound_metadata = {
-            "raw": datos.get("raw_message"),
-            "alias_waba": datos.get("alias_waba"),
-            "phone_number_id": metadata.get("phone_number_id"),
-        }
-        if flow_response_json is not None:
-            inbound_metadata["flow_response_json"] = flow_response_json
-        if flow_client_data:
-            inbound_metadata["flow_client_data"] = flow_client_data
-        mensaje = GestorMensajes.registrar_entrada(
-            phone_number=datos["phone_number"],
-            nombre=datos.get("nombre") or "",
-            contenido=datos.get("mensaje") or "",
-            tipo=datos.get("message_type") or "text",
-            timestamp_ms=datos.get("timestamp", int(time.time())) * 1000,
-            wa_message_id=datos.get("wa_message_id"),
-            metadata=inbound_metadata,
-            queue_status="pending",
-            process_after_ms=ahora_ms,
-        )
-        if mensaje:
-            encolados += 1
-    return encolados
-
-
 def _procesar_webhook(data: dict) -> dict:
     """Procesa un webhook entrante de WhatsApp (cola)."""
-    mensajes, statuses = _extraer_eventos_whatsapp(data)
-    encolados = _encolar_mensajes(mensajes) if mensajes else 0
-    actualizados = _procesar_statuses(statuses) if statuses else 0
+    resultado = expandir_eventos(data)
 
-    if encolados and str(getattr(settings, "QUEUE_PROCESS_INLINE", "False")).lower() == "true":
+    if resultado["encolados"] and str(getattr(settings, "QUEUE_PROCESS_INLINE", "False")).lower() == "true":
         procesar_cola(limit=int(getattr(settings, "QUEUE_BATCH_SIZE", 10)))
 
-    return {"status": "ok", "encolados": encolados, "statuses": actualizados}
+    return {"status": "ok", **resultado}
 
 
 def _verificar_webhook(
@@ -256,12 +67,20 @@ def webhook(request):
         hub_verify_token = params.get("hub.verify_token") or params.get("hub_verify_token")
         return _verificar_webhook(hub_mode, hub_challenge, hub_verify_token)
 
+    logger.info("Webhook recibido (%s bytes)", len(request.body))
+    if getattr(settings, "WEBHOOK_FAST_ACK", False):
+        # Sin parsear ni tocar la cola: un INSERT y el 200 para Meta.
+        logger.debug("Webhook crudo: %s", request.body)
+        fila = guardar_en_inbox(request.body)
+        return JsonResponse({"status": "ok", "inbox": fila.pk})
+
     try:
         data = json.loads(request.body.decode("utf-8"))
     except Exception:
         return JsonResponse({"status": "error", "detalle": "invalid_json"}, status=400)
 
-    logger.info("Webhook recibido: %s", json.dumps(data, indent=2))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Webhook recibido: %s", json.dumps(data, indent=2))
     respuesta = _procesar_webhook(data)
     return JsonResponse(respuesta)
 
@@ -339,12 +158,8 @@ def obtener_sesion(request, phone_number: str):
 @require_http_methods(["POST"])
 def resetear_sesion(request, phone_number: str):
     """Resetea la sesion de un usuario"""
-    sesion = Sesion.objects.filter(phone_number=phone_number).first()
+    sesion = GestorSesion.resetear_navegacion(phone_number)
     if sesion:
-        sesion.estado_actual = "0"
-        sesion.historial_navegacion = ["0"]
-        sesion.intentos_fallidos = 0
-        sesion.save()
         return JsonResponse({"status": "ok", "mensaje": "Sesion reseteada"})
     return JsonResponse({"status": "error", "mensaje": "Sesion no encontrada"}, status=404)
 